@@ -1,2 +1,29 @@
 
-MULTI_NER_URL = 'https://dh.multiner.hum.uu.nl/ner/collect_from_text'
\ No newline at end of file
+MULTI_NER_URL = 'https://dh.multiner.hum.uu.nl/ner/collect_from_text'
+# Seconds to wait for a response, and the number of retries (with exponential backoff) on errors
+MULTI_NER_TIMEOUT = 300
+MULTI_NER_RETRIES = 3
+
+# Maximum number of requests to the geocoding services, as (requests per second, burst).
+# GeoNames allows 1000 credits per hour, Nominatim (OSM) 1 request per second.
+GEOCODER_RATE_LIMITS = {
+    'geonames': (1000 / 3600, 1000),
+    'google': (50, 50),
+    'osm': (1, 1)
+}
+
+# The endpoints of the geocoding services, as requested by the geocoder library
+GEOCODER_URLS = {
+    'geonames': 'http://api.geonames.org/searchJSON',
+    'geonames_details': 'http://api.geonames.org/getJSON',
+    'google': 'https://maps.googleapis.com/maps/api/place/textsearch/json',
+    'osm': 'https://nominatim.openstreetmap.org/search'
+}
+# All services, by name
+SERVICE_URLS = dict(GEOCODER_URLS, multiner=MULTI_NER_URL)
+# The rate limits when the services are replaced by a local stand-in (see fake_services.py),
+# which applies GEOCODER_RATE_LIMITS itself when it records the responses of the real services
+LOCAL_GEOCODER_RATE_LIMITS = {provider: (10000, 10000) for provider in GEOCODER_RATE_LIMITS}
+
+# A folder to cache the compiled (HTML) templates in, across runs. 'None' to compile them once per run.
+TEMPLATE_BYTECODE_CACHE = None
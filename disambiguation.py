@@ -0,0 +1,128 @@
+from collections import OrderedDict
+import numpy as np
+
+from helpers.geocode_cache import normalize_place_name
+from spatial_index import SpatialIndex
+
+
+class Disambiguator:
+    '''
+    Resolves the place names (entities tagged LOCATION) of a document to GeoNames entries in a Gazetteer,
+    along the lines of Ardanuy & Sporleder (2017): places mentioned in the same document tend to be near each other.
+
+    For each (unique) place name, up to 'candidates' entries are looked up (the most populous ones).
+    Each candidate is scored on its population (log scaled, relative to the most populous candidate in the document),
+    its feature class (see FEATURE_CLASS_SCORES) and its distance to the other places in the document
+    (the mean, over the other place names, of the distance to their nearest candidate, up to MAX_DISTANCE).
+    Only the 'neighbours' candidates (of other place names) nearest to each candidate are looked at, found with
+    a SpatialIndex, so that long documents with many place names do not need the distances between all candidates.
+    Optionally, candidates are also scored on their distance to the 'region' of the collection, a list of
+    (latitude, longitude) of places it is known to be about.
+    The scores are combined with 'weights' (see WEIGHTS), the best candidate is picked for all mentions of a name.
+    If a FuzzyIndex is provided, place names are corrected with it before they are looked up.
+
+    Adds 'geonames_id', 'geonames_lat' and 'geonames_lng' to the entities, replacing coordinates
+    that were found before (e.g. by the Geocoder).
+    '''
+
+    # GeoNames feature classes (see http://www.geonames.org/export/codes.html), places mentioned in texts
+    # are most often cities and villages (P) or countries and regions (A)
+    FEATURE_CLASS_SCORES = {'P': 1.0, 'A': 0.9, 'L': 0.5, 'T': 0.5, 'H': 0.4, 'S': 0.2, 'R': 0.1, 'U': 0.1, 'V': 0.1}
+    WEIGHTS = {'population': 1.0, 'feature_class': 0.5, 'distance': 1.5, 'region': 1.0}
+    # The distance (in km) at which the distance scores are halved
+    DISTANCE_SCALE = 250.0
+    # The distance (in km) from which places are considered equally far apart
+    MAX_DISTANCE = 1000.0
+
+    def __init__(self, gazetteer, candidates=10, weights=None, neighbours=10, region=None, fuzzy_index=None):
+        self.gazetteer = gazetteer
+        self.candidates = candidates
+        self.weights = dict(self.WEIGHTS, **(weights or {}))
+        self.neighbours = neighbours
+        self.region = SpatialIndex(*zip(*region)) if region else None
+        self.fuzzy_index = fuzzy_index
+
+    def disambiguate(self, named_entities):
+        groups = OrderedDict()
+        for ent in named_entities:
+            if (ent['type'] == 'LOCATION'):
+                groups.setdefault(normalize_place_name(ent['ne']), []).append(ent)
+
+        names = []
+        entries = []
+        for name, mentions in groups.items():
+            spelling = mentions[0]['ne']
+            if self.fuzzy_index is not None:
+                spelling = self.fuzzy_index.correct(spelling)
+            candidates = self.gazetteer.lookup(spelling, limit=self.candidates)
+            if candidates:
+                names.append(name)
+                entries.append(candidates)
+
+        if not entries:
+            return
+
+        for name, entry in zip(names, self.choose(entries)):
+            for ent in groups[name]:
+                ent['geonames_id'] = entry.geonameid
+                ent['geonames_lat'] = entry.lat
+                ent['geonames_lng'] = entry.lng
+
+    def choose(self, entries):
+        '''
+        Choose the best candidate for each place name, given a (non empty) list of candidates per place name.
+        '''
+        candidates = [entry for candidates in entries for entry in candidates]
+        scores = self.get_scores(candidates, [len(candidates) for candidates in entries])
+
+        chosen = []
+        start = 0
+        for candidates in entries:
+            chosen.append(candidates[int(np.argmax(scores[start:start + len(candidates)]))])
+            start += len(candidates)
+        return chosen
+
+    def get_scores(self, candidates, counts):
+        '''
+        Score a list of candidates, which are the candidates for consecutive place names (counts per place name).
+        '''
+        owners = np.repeat(np.arange(len(counts)), counts)
+
+        populations = np.log1p(np.array([entry.population for entry in candidates], dtype=float))
+        population_scores = populations / populations.max() if populations.max() > 0 else populations
+
+        feature_class_scores = np.array(
+            [self.FEATURE_CLASS_SCORES.get(entry.feature_class, 0.0) for entry in candidates])
+
+        lats = [entry.lat for entry in candidates]
+        lngs = [entry.lng for entry in candidates]
+
+        scores = self.weights['population'] * population_scores + \
+            self.weights['feature_class'] * feature_class_scores
+        if len(counts) > 1:
+            scores += self.weights['distance'] * self.get_distance_scores(lats, lngs, owners, len(counts))
+        if self.region is not None:
+            distances, indices = self.region.query(lats, lngs)
+            scores += self.weights['region'] / (1 + distances[:, 0] / self.DISTANCE_SCALE)
+        return scores
+
+    def get_distance_scores(self, lats, lngs, owners, names):
+        '''
+        Score candidates on the mean distance to the nearest candidate of each other place name (owners gives
+        the place name of each candidate). Place names without a candidate among the neighbours nearest to
+        a candidate, or only further than MAX_DISTANCE, count as MAX_DISTANCE away.
+        '''
+        # the nearest candidates can include those of the same place name, which are skipped,
+        # as is the padding for candidates with fewer neighbours within MAX_DISTANCE (index len(owners))
+        distances, indices = SpatialIndex(lats, lngs).query(
+            lats, lngs, self.neighbours + self.candidates, self.MAX_DISTANCE)
+        rows = np.repeat(np.arange(len(owners)), distances.shape[1])
+        others = np.append(owners, -1)[indices.ravel()]
+        near = (others >= 0) & (others != owners[rows])
+        rows, others, distances = rows[near], others[near], distances.ravel()[near]
+
+        # per row, the neighbours are sorted by distance, so the first of a place name is its nearest
+        keys, first = np.unique(rows * names + others, return_index=True)
+        means = self.MAX_DISTANCE + np.bincount(
+            rows[first], weights=distances[first] - self.MAX_DISTANCE, minlength=len(owners)) / (names - 1)
+        return 1 / (1 + means / self.DISTANCE_SCALE)
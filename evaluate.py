@@ -1,7 +1,11 @@
 import os
 import sys
 import argparse
-from sklearn.metrics import classification_report
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from helpers.token_alignment import align_tokens
 
 
 # Input validation
@@ -28,177 +32,301 @@ def parseArguments(sysArgs):
         dest='pred_dir', required=True, type=dir,
         help="The directory that the predicted entities are in")
 
+    parser.add_argument(
+        '--jobs',
+        dest='jobs', default=1, type=int,
+        help="The number of processes that evaluate files in parallel. Defaults to 1.")
 
     parsedArgs = parser.parse_args()
 
     return parsedArgs
 
-def evaluate_file(gold_file, pred_file):
-    gold_labels = extract_labels(gold_file)
-    pred_labels = extract_labels(pred_file)
-    return get_report(gold_labels, pred_labels)
+# Labels, sorted as in the report ('O' last)
+LABELS = ['LOC', 'ORG', 'OTH', 'PER', 'O']
+ENTITY_LABELS = LABELS[:-1]
+O = LABELS.index('O')
 
+# Tags (the last column of a line in a BIO file, without a 'B-' or 'I-' prefix) and their label,
+# other tags are read as 'O'
+TAGS = {
+    'LOC': 'LOC', 'LOCATION': 'LOC',
+    'ORG': 'ORG', 'ORGANIZATION': 'ORG',
+    'OTH': 'OTH', 'OTHER': 'OTH', 'MISC': 'OTH',
+    'PER': 'PER', 'PERSON': 'PER'
+}
+
+
+def evaluate_file(gold_file, pred_file, evaluation):
+    gold_labels, gold_beginnings = extract_labels(gold_file)
+    pred_labels, pred_beginnings = extract_labels(pred_file)
+
+    gold_tokens = extract_tokens(gold_file)
+    pred_tokens = extract_tokens(pred_file)
+    if gold_tokens != pred_tokens:
+        # the files are tokenized differently (e.g. because of whitespace in OCR text, even if the number
+        # of tokens is the same), score the predicted labels of the gold tokens they are aligned with
+        alignment = align_tokens(gold_tokens, pred_tokens)
+        pred_labels, pred_beginnings = project_labels(alignment, pred_labels, pred_beginnings)
+
+    evaluation.add(gold_labels, pred_labels, gold_beginnings, pred_beginnings)
+
+
+def project_labels(alignment, labels, beginnings):
+    '''
+    Get the labels (and beginnings) of the predicted tokens aligned with the gold tokens (see align_tokens),
+    'O' for gold tokens that are not aligned.
+    '''
+    aligned = alignment >= 0
+    projected_labels = np.full(len(alignment), O, dtype=labels.dtype)
+    projected_labels[aligned] = labels[alignment[aligned]]
+
+    # a predicted token that is aligned with several gold tokens only begins an entity at the first one
+    first = aligned & (alignment != np.concatenate([[-1], alignment[:-1]]))
+    projected_beginnings = np.zeros(len(alignment), dtype=bool)
+    projected_beginnings[first] = beginnings[alignment[first]]
+
+    return projected_labels, projected_beginnings
 
-def main(args):
-    args = parseArguments(args)
-    
-    reports = []
-    gold_dir = args.gold_dir
-    pred_dir = args.pred_dir
 
-    for pred_file_name in os.listdir(pred_dir):
+def evaluate_files(pairs):
+    '''
+    Evaluate a list of (gold file, predicted file) pairs.
+    Returns the Evaluation and a list of messages for the pairs that were skipped.
+    '''
+    evaluation = Evaluation()
+    skipped = []
+
+    for gold_file, pred_file in pairs:
+        try:
+            evaluate_file(gold_file, pred_file, evaluation)
+        except ValueError as e:
+            skipped.append("Skipping '{}': {}".format(os.path.basename(pred_file), e))
+
+    return evaluation, skipped
+
+
+def find_pairs(gold_dir, pred_dir):
+    pairs = []
+
+    for pred_file_name in sorted(os.listdir(pred_dir)):
         if pred_file_name.endswith(".bio"):
             pred_file_path = os.path.join(pred_dir, pred_file_name)
             gold_file_path = os.path.join(gold_dir, pred_file_name)
 
             if os.path.exists(gold_file_path):
-                report = evaluate_file(gold_file_path, pred_file_path)
-                reports.append(report)
+                pairs.append((gold_file_path, pred_file_path))
 
-    process_reports(reports)
+    return pairs
 
 
-def process_reports(reports):
-    ras = []
+def main(args):
+    args = parseArguments(args)
+
+    pairs = find_pairs(args.gold_dir, args.pred_dir)
+
+    if args.jobs > 1:
+        # each process evaluates a batch of files, only the counts are sent back
+        batches = [pairs[i::args.jobs * 4] for i in range(args.jobs * 4)]
+        evaluation = Evaluation()
+        skipped = []
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            for batch_evaluation, batch_skipped in executor.map(evaluate_files, batches):
+                evaluation.merge(batch_evaluation)
+                skipped.extend(batch_skipped)
+    else:
+        evaluation, skipped = evaluate_files(pairs)
 
-    for report in reports:
-        for type, values in report.items():
-            if type in ['LOC', 'PER', 'ORG', 'OTH', 'O']:
-                existing_ra = next((ra for ra in ras if ra.type == type), None)
-                
-                if not existing_ra:
-                    ras.append(ReportAverager(type, values))
-                else:
-                    existing_ra.add(values)
+    for message in sorted(skipped):
+        print(message)
 
-    sorted_ras = sorted(ras)
-    pretty_print(sorted_ras)
+    pretty_print(evaluation)
 
 
-def pretty_print(report_averagers):
-    name_width = max(len(cn.type) for cn in report_averagers)
+class Evaluation:
+    '''
+    Accumulates the counts needed to score predicted labels against gold labels, over any number of files.
+    Per label, keeps a confusion matrix (for token level scores over all tokens, i.e. micro),
+    the sum of the per file scores (for the average over files, i.e. macro over files),
+    and the number of correct, gold and predicted entities (for entity level scores).
+    '''
+
+    def __init__(self):
+        self.files = 0
+        self.confusion = np.zeros((len(LABELS), len(LABELS)), dtype=np.int64)
+        self.file_score_totals = np.zeros((3, len(LABELS)))
+        self.file_counts = np.zeros(len(LABELS), dtype=np.int64)
+        # correct, gold and predicted entities per entity label
+        self.entity_counts = np.zeros((3, len(ENTITY_LABELS)), dtype=np.int64)
+
+    def add(self, gold_labels, pred_labels, gold_beginnings=None, pred_beginnings=None):
+        '''
+        Add the labels of a file. Raises ValueError if they are not of the same length.
+        Labels are given as names or as indices in LABELS, beginnings (optional) mark the tokens
+        that start an entity even if the previous token has the same label (i.e. 'B-' tags).
+        '''
+        if len(gold_labels) != len(pred_labels):
+            raise ValueError("the gold standard has {} labels, the prediction {}".format(
+                len(gold_labels), len(pred_labels)))
+
+        gold = to_indices(gold_labels)
+        pred = to_indices(pred_labels)
+
+        confusion = np.bincount(
+            gold * len(LABELS) + pred, minlength=len(LABELS) ** 2).reshape(len(LABELS), len(LABELS))
+        self.confusion += confusion
+
+        # as in sklearn's classification report, only labels that occur in the file count towards its average
+        present = (confusion.sum(axis=0) + confusion.sum(axis=1)) > 0
+        self.file_score_totals[:, present] += np.array(get_scores(confusion)[:3])[:, present]
+        self.file_counts += present
+        self.files += 1
+
+        gold_entities = get_entities(gold, gold_beginnings)
+        pred_entities = get_entities(pred, pred_beginnings)
+        correct = np.intersect1d(gold_entities, pred_entities)
+        for row, entities in enumerate([correct, gold_entities, pred_entities]):
+            self.entity_counts[row] += np.bincount(entities % len(LABELS), minlength=len(LABELS))[:len(ENTITY_LABELS)]
+
+    def merge(self, other):
+        self.files += other.files
+        self.confusion += other.confusion
+        self.file_score_totals += other.file_score_totals
+        self.file_counts += other.file_counts
+        self.entity_counts += other.entity_counts
+
+    def get_micro_scores(self):
+        '''
+        Precision, recall, f1-score and support per label, over all tokens of all files.
+        '''
+        return get_scores(self.confusion)
+
+    def get_macro_scores(self):
+        '''
+        Precision, recall and f1-score per label, averaged over the files the label occurs in.
+        '''
+        return tuple(divide(self.file_score_totals, self.file_counts))
+
+    def get_entity_scores(self):
+        '''
+        Precision, recall, f1-score and support per entity label, where an entity is only correct
+        if it has exactly the same tokens and label as in the gold standard.
+        '''
+        correct, gold, pred = self.entity_counts
+        precision = divide(correct, pred)
+        recall = divide(correct, gold)
+        return precision, recall, get_f1_score(precision, recall), gold
+
+
+def to_indices(labels):
+    if isinstance(labels, np.ndarray):
+        return labels.astype(np.int64)
+    index = {label: i for i, label in enumerate(LABELS)}
+    return np.array([index[label] for label in labels], dtype=np.int64)
+
+
+def get_scores(confusion):
+    '''
+    Get precision, recall, f1-score and support per label from a confusion matrix (rows are gold, columns predicted).
+    '''
+    true_positives = np.diag(confusion)
+    precision = divide(true_positives, confusion.sum(axis=0))
+    recall = divide(true_positives, confusion.sum(axis=1))
+    return precision, recall, get_f1_score(precision, recall), confusion.sum(axis=1)
+
+
+def get_f1_score(precision, recall):
+    return divide(2 * precision * recall, precision + recall)
+
+
+def divide(numerator, denominator):
+    '''
+    Divide element-wise, with 0 where the denominator is 0.
+    '''
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros(np.broadcast(numerator, denominator).shape),
+                     where=denominator != 0)
+
+
+def get_entities(labels, beginnings=None):
+    '''
+    Find the entities (i.e. runs of the same label other than 'O') in an array of label indices.
+    A run is split where beginnings (an optional boolean array) is True.
+    Returns an array with an integer per entity that encodes its start, end and label.
+    '''
+    if not len(labels):
+        return np.zeros(0, dtype=np.int64)
+
+    is_entity = labels != O
+    is_start = labels != np.concatenate([[O], labels[:-1]])
+    if beginnings is not None:
+        is_start |= np.asarray(beginnings, dtype=bool)
+    is_end = np.concatenate([is_start[1:], [True]]) | (labels != np.concatenate([labels[1:], [O]]))
+    starts = np.flatnonzero(is_entity & is_start)
+    ends = np.flatnonzero(is_entity & is_end) + 1
+    return (starts * (len(labels) + 1) + ends) * len(LABELS) + labels[starts]
+
+
+def pretty_print(evaluation):
+    name_width = max(len(label) for label in LABELS)
     width = max(name_width, 3, 3)
-    head_fmt = '{:>{width}s} ' + ' {:>9}' * 3
-    report = '\n\n'
-    report += head_fmt.format('', 'precision', 'recall',
-                             'f1-score', width=width)
-    report += '\n\n'
-    row_fmt = '{:>{width}s} ' + ' {:>9.{digits}f}' * 3 + ' \n'
-
-    o_row = None
-    for ra in report_averagers:
-        if ra.type == "O":
-            o_row = row_fmt.format(ra.type, ra.get_precision(
-            ), ra.get_recall(), ra.get_f1score(), width=width, digits=3)
-        else:
-            report += row_fmt.format(ra.type, ra.get_precision(),
-                                     ra.get_recall(), ra.get_f1score(), width=width, digits=3)
-    report += o_row
-    report += '\n'
+    head_fmt = '{:>{width}s} ' + ' {:>9}' * 4
+    row_fmt = '{:>{width}s} ' + ' {:>9.{digits}f}' * 3 + ' {:>9}\n'
+
+    report = '\n{} files\n'.format(evaluation.files)
+    for title, labels, scores, count_name in [
+            ('Tokens, over all files', LABELS, evaluation.get_micro_scores(), 'support'),
+            ('Tokens, averaged over files', LABELS, evaluation.get_macro_scores() + (evaluation.file_counts,), 'files'),
+            ('Entities, over all files', ENTITY_LABELS, evaluation.get_entity_scores(), 'support')]:
+        report += '\n{}\n\n'.format(title)
+        report += head_fmt.format('', 'precision', 'recall', 'f1-score', count_name, width=width)
+        report += '\n\n'
+        for index, label in enumerate(labels):
+            report += row_fmt.format(label, scores[0][index], scores[1][index], scores[2][index],
+                                     scores[3][index], width=width, digits=3)
     print(report)
 
 
-class ReportAverager:
-    def __init__(self, type, values):
-        self.type = type
-        self.reports = [values]
-
-    def __eq__(self, other):
-        return self.type == other.type
-
-    def __lt__(self, other):
-        return self.type<other.type
-
-    def add(self, report):
-        self.reports.append(report)
-
-    def get_precision(self):
-        total = self.get_total('precision')
-        if total == 0.00:
-            return total
-        return total / len(self.reports)
-
-    def get_recall(self):
-        total = self.get_total('recall')
-        if total == 0.00:
-            return total
-        return total / len(self.reports)
-
-    def get_f1score(self):
-        total = self.get_total('f1-score')
-        if total == 0.00:
-            return total
-        return total / len(self.reports)
-
-    def get_total(self, property_name):
-        total = 0.00
-        for report in self.reports:
-            total = total + report[property_name]
-        return total
-
-
-def get_report(gold_labels, pred_labels):
-    '''
-    Get a report much like this:
-    
-    { 
-        'LOC': {
-            'precision': 1.0, 
-            'recall': 0.5, 
-            'f1-score': 0.6666666666666666, 
-            'support': 2
-        }, 
-        'PER': {
-            'precision': 1.0, 
-            'recall': 1.0, 
-            'f1-score': 1.0, 
-            'support': 1
-        },
-        'O': {
-            'precision': 0.6666666666666666, 
-            'recall': 1.0, 
-            'f1-score': 0.8, 
-            'support': 2
-        }, 
-        'accuracy': 0.8333333333333334, 
-        'macro avg': {
-            'precision': 0.9166666666666666, 
-            'recall': 0.875, 
-            'f1-score': 0.8666666666666667, 
-            'support': 6
-        }, 
-        'weighted avg': {
-            'precision': 0.8888888888888888, 
-            'recall': 0.8333333333333334, 
-            'f1-score': 0.8222222222222223, 
-            'support': 6
-        }
-    }
-    '''
-    return classification_report(gold_labels, pred_labels, output_dict=True)
+def extract_labels(file):
+    '''
+    Read the labels of the tokens in a BIO file, one line at a time. The tag of a token is the last column
+    of its line, empty lines (i.e. sentence breaks) are skipped.
+    Returns an array of label indices (see LABELS) and a boolean array that marks 'B-' tags.
+    '''
+    labels = array('b')
+    beginnings = array('b')
+    parsed_tags = {}
+
+    with open(file, 'r', encoding='utf-8') as fh:
+        for line in fh:
+            columns = line.rsplit(None, 1)
+            if not columns:
+                continue
 
+            tag = columns[-1]
+            if tag not in parsed_tags:
+                prefix, separator, name = tag.rpartition('-')
+                parsed_tags[tag] = (LABELS.index(TAGS.get(name, 'O')), prefix == 'B')
+            label, beginning = parsed_tags[tag]
+            labels.append(label)
+            beginnings.append(beginning)
 
-def extract_labels(file):
-    labels = []
+    return np.frombuffer(labels, dtype=np.int8), np.frombuffer(beginnings, dtype=np.int8).astype(bool)
 
-    with open(file, 'r') as fh:
-        for line in fh.readlines():
-            if 'LOC' in line:
-                labels.append('LOC')
-                continue
-            if 'PER' in line:
-                labels.append('PER')
-                continue
-            if 'ORG' in line:
-                labels.append('ORG')
-                continue
-            if 'OTHER' in line or 'OTH' in line:
-                labels.append('OTH')
-                continue
 
-            labels.append('O')
+def extract_tokens(file):
+    '''
+    Read the tokens in a BIO file, i.e. the lines without their last column, in the same order as extract_labels.
+    '''
+    tokens = []
+
+    with open(file, 'r', encoding='utf-8') as fh:
+        for line in fh:
+            columns = line.rsplit(None, 1)
+            if columns:
+                tokens.append(columns[0] if len(columns) > 1 else '')
 
-    return labels
+    return tokens
 
 
 if __name__ == '__main__':
@@ -1,13 +1,26 @@
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 import os
 import sys
 import argparse
 import requests
 import json
-
-from geocoding import Geocoder
-from config import MULTI_NER_URL
-from helpers.bio_converter import convert_to_bio
+from concurrent.futures import ThreadPoolExecutor
+
+from geocoding import Geocoder, create_rate_limiters, get_service_urls
+from gazetteer import Gazetteer, feature_classes
+from disambiguation import Disambiguator
+from fuzzy_index import FuzzyIndex
+from toponym_tagger import ToponymTagger, TAGGER_MIN_POPULATION
+from config import MULTI_NER_URL, MULTI_NER_TIMEOUT, MULTI_NER_RETRIES, TEMPLATE_BYTECODE_CACHE, \
+    GEOCODER_RATE_LIMITS, LOCAL_GEOCODER_RATE_LIMITS
+from helpers.bio_converter import iter_bio
+from helpers.chunker import split_into_chunks, merge_responses
+from helpers.geocode_cache import GeocodeCache
+from helpers.http_client import HttpClient, CircuitOpenError
+from helpers.manifest import Manifest
+from helpers.ner_cache import NerCache
+from helpers.pipeline import Pipeline
+from helpers.report import ReportIndex, copy_assets, write_data_file
 
 # Input validation
 def dir(path):
@@ -55,19 +68,175 @@ def parseArguments(sysArgs):
         dest='language', default='en', type=language,
         help="The language of your corpus. Defaults to 'en'")
 
+    parser.add_argument(
+        '--geocode_cache',
+        dest='geocode_cache', default=':memory:',
+        help="A (SQLite) file to cache geocodes in, so that they can be reused in subsequent runs. If not provided, geocodes are only reused within this run.")
+
+    parser.add_argument(
+        '--geocode_cache_ttl',
+        dest='geocode_cache_ttl', default=None, type=float,
+        help="The number of days a cached geocode remains valid. Defaults to forever.")
+
+    parser.add_argument(
+        '--geocode_workers',
+        dest='geocode_workers', default=3, type=int,
+        help="The number of concurrent requests to the geocoding services. Defaults to 3.")
+
+    parser.add_argument(
+        '--gazetteer',
+        dest='gazetteer', default=None,
+        help="An offline gazetteer index (see gazetteer.py) to look up GeoNames coordinates in, instead of the GeoNames service.")
+
+    parser.add_argument(
+        '--tagger',
+        dest='tagger', default='multiner', choices=['multiner', 'gazetteer', 'both'],
+        help="""How to find the entities: with the multiNER service ('multiner'), by looking up the place names
+                in the gazetteer (requires --gazetteer, see toponym_tagger.py), which does not need the multiNER service
+                but only finds locations, or both (places in the gazetteer that multiNER missed are added).
+                Geocoding still uses the Google and OSM services. Defaults to 'multiner'.""")
+
+    parser.add_argument(
+        '--tagger_feature_classes',
+        dest='tagger_feature_classes', default=None, type=feature_classes,
+        help="A comma separated list of the feature classes of the places the gazetteer tagger finds (e.g. 'A,P'). Defaults to all.")
+
+    parser.add_argument(
+        '--tagger_min_population',
+        dest='tagger_min_population', default=TAGGER_MIN_POPULATION, type=int,
+        help="Only find places with at least this population with the gazetteer tagger. Defaults to {}.".format(TAGGER_MIN_POPULATION))
+
+    parser.add_argument(
+        '--fuzzy_index',
+        dest='fuzzy_index', default=None,
+        help="""A fuzzy index over the names in a gazetteer (see fuzzy_index.py), to correct historical, misspelled
+                or OCR'd place names with before they are geocoded.""")
+
+    parser.add_argument(
+        '--disambiguate',
+        dest='disambiguate', action='store_true',
+        help="""Choose the GeoNames entry for each place name from the candidates in the gazetteer (requires --gazetteer),
+                based on their population, feature class and distance to the other places in the document.""")
+
+    parser.add_argument(
+        '--disambiguation_candidates',
+        dest='disambiguation_candidates', default=10, type=int,
+        help="The maximum number of gazetteer entries considered per place name when disambiguating. Defaults to 10.")
+
+    parser.add_argument(
+        '--disambiguation_region',
+        dest='disambiguation_region', nargs=2, type=float, action='append', metavar=('LAT', 'LNG'),
+        help="""The coordinates of a place the collection is about, when disambiguating places nearby are preferred.
+                Can be given more than once.""")
+
+    parser.add_argument(
+        '--workers',
+        dest='workers', default=1, type=int,
+        help="""The number of files to process concurrently. If more than 1, reading, extracting entities,
+                adding geocodes and exporting run as a pipeline, each stage with this number of threads. Defaults to 1.""")
+
+    parser.add_argument(
+        '--manifest',
+        dest='manifest', default=None,
+        help="""A (SQLite) file to keep track of the files that were processed. If provided, files that were
+                processed (and did not change) in an earlier run are skipped, and interrupted runs resume where they stopped.""")
+
+    parser.add_argument(
+        '--ner_timeout',
+        dest='ner_timeout', default=MULTI_NER_TIMEOUT, type=float,
+        help="The number of seconds to wait for the multiNER service. Defaults to {}.".format(MULTI_NER_TIMEOUT))
+
+    parser.add_argument(
+        '--ner_retries',
+        dest='ner_retries', default=MULTI_NER_RETRIES, type=int,
+        help="The number of times a failed request to the multiNER service is retried. Defaults to {}.".format(MULTI_NER_RETRIES))
+
+    parser.add_argument(
+        '--ner_chunk_size',
+        dest='ner_chunk_size', default=0, type=int,
+        help="Send texts longer than this number of characters to the multiNER service in (sentence aligned) chunks. Defaults to 0, i.e. never.")
+
+    parser.add_argument(
+        '--ner_chunk_workers',
+        dest='ner_chunk_workers', default=1, type=int,
+        help="The number of chunks of a text that are sent to the multiNER service concurrently. Defaults to 1.")
+
+    parser.add_argument(
+        '--ner_cache',
+        dest='ner_cache', default=None,
+        help="A directory to cache the responses of the multiNER service in, so that unchanged texts are not sent again in subsequent runs.")
+
+    parser.add_argument(
+        '--ner_cache_size',
+        dest='ner_cache_size', default=1000, type=int,
+        help="The maximum size of the NER cache in MB. Defaults to 1000.")
+
+    parser.add_argument(
+        '--services_url',
+        dest='services_url', default=None,
+        help="""The URL of a local stand-in for the multiNER and geocoding services (see fake_services.py),
+                e.g. 'http://localhost:8000', to use instead of the real services. The credentials of the geocoding
+                services and their rate limits do not apply.""")
+
+    parser.add_argument(
+        '--bio_scheme',
+        dest='bio_scheme', default='io', choices=['io', 'bio2'],
+        help="Tag entity tokens in the .bio output with their type only ('io', e.g. 'LOC'), or with B-/I- prefixes ('bio2'). Defaults to 'io'.")
+
+    parser.add_argument(
+        '--bio_sentence_breaks',
+        dest='bio_sentence_breaks', action='store_true',
+        help="Add an empty line after each sentence in the .bio output (as in CoNLL files).")
+
+    parser.add_argument(
+        '--html_mode',
+        dest='html_mode', default='inline', choices=['inline', 'sidecar'],
+        help="""'inline' to write each HTML file with its data and tooltips included, 'sidecar' to write small HTML files
+                that load their data from a separate '.entities.js' file, share styling and scripts, and are listed (with paging)
+                in 'index.html'. Defaults to 'inline'.""")
+
     parsedArgs = parser.parse_args()
 
     return parsedArgs
 
 
 # Do the work
-def extract_entities(title, text, language):
+CONTEXT_LENGTH = 3
+# The arguments that affect the output of a run, files processed with other values are processed again
+MANIFEST_SETTINGS = ['output_dir', 'extension', 'language', 'gazetteer', 'tagger', 'tagger_feature_classes',
+                     'tagger_min_population', 'fuzzy_index', 'disambiguate', 'disambiguation_candidates',
+                     'disambiguation_region', 'ner_chunk_size', 'bio_scheme', 'bio_sentence_breaks', 'html_mode',
+                     'services_url']
+
+
+class NerServiceError(Exception):
+    pass
+
+
+def extract_entities(title, text, language, client, chunk_size=0, workers=1, cache=None, url=MULTI_NER_URL):
+    '''
+    Collect the named entities in text from the multiNER service (at url). If chunk_size is provided,
+    texts longer than chunk_size characters are sent in (sentence aligned) chunks, by 'workers' threads,
+    and the responses are merged. If a NerCache is provided, responses are read from / stored in it.
+    '''
+    if not chunk_size or len(text) <= chunk_size:
+        return request_entities(title, text, language, client, cache, url)
+
+    chunks = split_into_chunks(text, chunk_size)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        responses = list(executor.map(
+            lambda chunk: request_entities(title, chunk[1], language, client, cache, url), chunks))
+
+    return merge_responses(text, chunks, responses, CONTEXT_LENGTH)
+
+
+def request_entities(title, text, language, client, cache=None, url=MULTI_NER_URL):
     body = {
         "title": title,
         "text": text,
         "configuration": {
             "language": language,
-            "context_length": 3,
+            "context_length": CONTEXT_LENGTH,
             "leading_ner_packages": [
                 "stanford",
                 "spotlight"
@@ -76,18 +245,28 @@ def extract_entities(title, text, language):
         }
     }
 
-    r = requests.get(MULTI_NER_URL, json=body)
+    if cache is not None:
+        key = cache.get_key(text, body['configuration'], url if url != MULTI_NER_URL else None)
+        response = cache.get(key)
+        if response is not None:
+            return response
 
-    if 400 <= r.status_code < 500:
+    r = client.get(url, json=body)
+
+    if 400 <= r.status_code < 500 and r.status_code != 429:
         fatal("Something seems to be wrong with this script. Please contact Digital Humanities Lab with these details: 'status code: {}'".format(r.status_code))
-    if 500 <= r.status_code < 600:
-        fatal("Something is wrong with the multiNER service. Please contact Digital Humanities Lab with these details: 'status code: {}'".format(r.status_code))
+    if r.status_code == 429 or 500 <= r.status_code < 600:
+        raise NerServiceError("Something is wrong with the multiNER service. If this persists, please contact Digital Humanities Lab with these details: 'status code: {}'".format(r.status_code))
 
-    return r.json()
+    response = r.json()
+    if cache is not None:
+        cache.set(key, response)
+    return response
 
 
-def add_geocodes(args, entities):
-    g = Geocoder(entities['text']['entities'], args.language)
+def add_geocodes(args, entities, cache, limiters, gazetteer, fuzzy_index=None, urls=None):
+    g = Geocoder(entities['text']['entities'], args.language, cache, args.geocode_workers, limiters, gazetteer,
+                 fuzzy_index, urls)
 
     try:
         g.geocode_locations()
@@ -97,44 +276,190 @@ def add_geocodes(args, entities):
 
 
 def collect_data(args):
+    ttl = args.geocode_cache_ttl * 24 * 60 * 60 if args.geocode_cache_ttl is not None else None
+    cache = GeocodeCache(args.geocode_cache, ttl)
+    urls = get_service_urls(args.services_url) if args.services_url else None
+    limiters = create_rate_limiters(LOCAL_GEOCODER_RATE_LIMITS if urls else GEOCODER_RATE_LIMITS)
+    gazetteer = Gazetteer(args.gazetteer) if args.gazetteer else None
+    fuzzy_index = FuzzyIndex(args.fuzzy_index) if args.fuzzy_index else None
+    tagger = None
+    if args.tagger != 'multiner':
+        print("building the gazetteer tagger")
+        tagger = ToponymTagger.from_gazetteer(gazetteer, args.tagger_feature_classes, args.tagger_min_population)
+    disambiguator = Disambiguator(
+        gazetteer, args.disambiguation_candidates, region=args.disambiguation_region,
+        fuzzy_index=fuzzy_index) if args.disambiguate else None
+
+    manifest = Manifest(args.manifest, get_manifest_settings(args)) if args.manifest else None
+    client = HttpClient(timeout=args.ner_timeout, retries=args.ner_retries, pool_size=max(args.workers * args.ner_chunk_workers, 1))
+    ner_cache = NerCache(args.ner_cache, args.ner_cache_size * 1024 * 1024) if args.ner_cache else None
+    failed = []
+
+    def mark_done(document, stage, entities=None):
+        if manifest is not None:
+            manifest.mark_done(document['path'], stage, entities)
+
+    def read(document):
+        done = manifest.start(document['path']) if manifest is not None else set()
+        # an export is only done if its output (still) exists
+        done -= set(output_format for output_format in EXPORT_FORMATS if not all(
+            os.path.exists(path) for path in get_output_paths(args, document['filename'], output_format)))
+
+        # resume from the entities of the last completed stage, if they were stored
+        entities = manifest.get_entities(document['path']) if 'ner' in done else None
+        if entities is None:
+            done = set()
+        elif not 'geocode' in done:
+            done = {'ner'}
+
+        if done.issuperset(Manifest.STAGES):
+            print("skipping '{}', it was processed before".format(document['filename']))
+            return None
+
+        with open(document['path'], 'r') as src:
+            document['text'] = src.read()
+        document['done'] = done
+        if entities is not None:
+            document['entities'] = entities
+        return document
+
+    def ner(document):
+        if not 'ner' in document['done']:
+            print("extracting entities from '{}'".format(document['filename']))
+            if args.tagger == 'gazetteer':
+                document['entities'] = tagger.tag('test', document['text'], CONTEXT_LENGTH)
+            else:
+                try:
+                    document['entities'] = extract_entities(
+                        'test', document['text'], args.language, client,
+                        args.ner_chunk_size, args.ner_chunk_workers, ner_cache,
+                        urls['multiner'] if urls else MULTI_NER_URL)
+                except (NerServiceError, CircuitOpenError, requests.exceptions.RequestException) as e:
+                    print("could not extract entities from '{}', skipping it. Details: {}".format(document['filename'], e))
+                    failed.append(document['path'])
+                    return None
+                if tagger is not None:
+                    tagger.add_missing(document['entities'], document['text'], CONTEXT_LENGTH)
+            mark_done(document, 'ner', document['entities'])
+        return document
+
+    def geocode(document):
+        if not 'geocode' in document['done']:
+            print("adding geocodes to locations from '{}'".format(document['filename']))
+            add_geocodes(args, document['entities'], cache, limiters, gazetteer, fuzzy_index, urls)
+            if disambiguator is not None:
+                disambiguator.disambiguate(document['entities']['text']['entities'])
+            mark_done(document, 'geocode', document['entities'])
+        return document
+
+    report_index = None
+    if args.html_mode == 'sidecar':
+        copy_assets(args.output_dir)
+        report_index = ReportIndex(args.output_dir)
+
+    def write(document):
+        for output_format in EXPORT_FORMATS:
+            if not output_format in document['done']:
+                export(args, document['filename'], document['text'], document['entities'], [output_format])
+                mark_done(document, output_format)
+        if report_index is not None:
+            report_index.add(document['filename'], get_output_name(args, document['filename'], 'html'),
+                             document['entities']['text']['entities'])
+        print("results for '{}' exported".format(document['filename']))
+
+    stages = [read, ner, geocode, write]
+
+    if args.workers > 1:
+        Pipeline([(stage, args.workers) for stage in stages]).run(find_documents(args))
+    else:
+        for document in find_documents(args):
+            for stage in stages:
+                document = stage(document)
+                if document is None:
+                    break
+
+    print("multiNER: {}".format(client.get_stats()))
+    if ner_cache is not None:
+        print(ner_cache.get_stats())
+    client.close()
+    if failed:
+        print("{} file(s) could not be processed, run again to retry:\n{}".format(len(failed), '\n'.join(failed)))
+
+    if report_index is not None:
+        report_index.write()
+    if manifest is not None:
+        manifest.close()
+    print(cache.get_stats())
+    cache.close()
+
+
+def find_documents(args):
     for folder, subs, files in os.walk(args.root_dir):
         for filename in files:
             if filename.endswith(args.extension):
-                with open(os.path.join(folder, filename), 'r') as src:
-                    text = src.read()
-                    print("extracting entities from '{}'".format(filename))
-                    entities = extract_entities('test', text, args.language)
-
-                    print("adding geocodes to locations from '{}'".format(filename))
-                    add_geocodes(args, entities)
-
-                    export(args, filename, text, entities)
-                    print("results for '{}' exported".format(filename))
+                yield {'filename': filename, 'path': os.path.join(folder, filename)}
 
 
 # Entry point
 def main(sysArgs):
     args = parseArguments(sysArgs)
     
-    check_env_var("GEONAMES_USERNAME")
-    check_env_var("GOOGLE_API_KEY")
+    if args.disambiguate and not args.gazetteer:
+        fatal("--disambiguate requires a gazetteer, please provide one with --gazetteer")
+    if args.tagger != 'multiner' and not args.gazetteer:
+        fatal("--tagger {} requires a gazetteer, please provide one with --gazetteer".format(args.tagger))
+    if not args.services_url:
+        if not args.gazetteer:
+            check_env_var("GEONAMES_USERNAME")
+        check_env_var("GOOGLE_API_KEY")
     
     collect_data(args)
 
 
 # Output / Export
-def export(args, current_filename, text, entities):
+EXPORT_FORMATS = ['json', 'html', 'bio']
+
+
+def export(args, current_filename, text, entities, formats=EXPORT_FORMATS):
     # save json
-    new_name = current_filename.replace(args.extension, '.json')
-    write_to_file(args.output_dir, new_name, entities)
+    if 'json' in formats:
+        new_name = get_output_name(args, current_filename, 'json')
+        write_to_file(args.output_dir, new_name, entities)
 
     # save html
-    html_name = current_filename.replace(args.extension, '.html')
-    write_html_version(args.output_dir, html_name, text, entities)
+    if 'html' in formats:
+        html_name = get_output_name(args, current_filename, 'html')
+        if args.html_mode == 'sidecar':
+            data_name = get_output_name(args, current_filename, 'entities.js')
+            write_html_report(args.output_dir, html_name, data_name, current_filename, text, entities)
+        else:
+            write_html_version(args.output_dir, html_name, text, entities)
 
     # save in BIO format
-    bio_name = current_filename.replace(args.extension, '.bio')
-    write_as_bio(args.output_dir, html_name, text, entities)
+    if 'bio' in formats:
+        bio_name = get_output_name(args, current_filename, 'bio')
+        write_as_bio(args.output_dir, bio_name, text, entities['text']['entities'],
+                     args.bio_scheme, args.bio_sentence_breaks)
+
+
+def get_output_paths(args, current_filename, output_format):
+    '''
+    Get the paths of the files an export format writes.
+    '''
+    names = [get_output_name(args, current_filename, output_format)]
+    if output_format == 'html' and args.html_mode == 'sidecar':
+        names.append(get_output_name(args, current_filename, 'entities.js'))
+    return [os.path.join(args.output_dir, name) for name in names]
+
+
+def get_manifest_settings(args):
+    settings = {name: getattr(args, name) for name in MANIFEST_SETTINGS}
+    settings['output_dir'] = os.path.abspath(args.output_dir)
+    return settings
+
+
+def get_output_name(args, current_filename, output_format):
+    return current_filename.replace(args.extension, '.{}'.format(output_format))
 
 
 def write_to_file(folder, filename, entities):
@@ -142,17 +467,37 @@ def write_to_file(folder, filename, entities):
         outfile.write(json.dumps(entities))
 
 
+# Templates are loaded (and compiled) once per run, relative to this script
+templates = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')),
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE) if TEMPLATE_BYTECODE_CACHE else None,
+    auto_reload=False)
+
+
 def write_html_version(folder, filename, text, entities):
-    env = Environment(loader=FileSystemLoader('templates'))
-    template = env.get_template('results.html')
+    template = templates.get_template('results.html')
     text = text.replace('\r', '').replace('\n', ' ').replace('"', '\'')
-    output_from_parsed_template = template.render(entities=entities, text=text)
+
+    with open(os.path.join(folder, filename), "w", buffering=1024 * 1024) as fh:
+        fh.writelines(template.generate(entities=entities, text=text))
+
+
+def write_html_report(folder, filename, data_filename, name, text, entities):
+    '''
+    Write an HTML file that loads its text and entities from a separate data file (see helpers/report.py).
+    '''
+    write_data_file(folder, data_filename, text, entities['text']['entities'])
+    template = templates.get_template('results_sidecar.html')
 
     with open(os.path.join(folder, filename), "w") as fh:
-        fh.write(output_from_parsed_template)
+        fh.writelines(template.generate(name=name, data_file=data_filename))
+
 
-def write_as_bio(folder, filename, text, entities):
-    convert_to_bio(text, entities)
+def write_as_bio(folder, filename, text, entities, scheme='io', sentence_breaks=False):
+    with open(os.path.join(folder, filename), "w", buffering=1024 * 1024) as fh:
+        for line in iter_bio(text, entities, scheme, sentence_breaks):
+            fh.write(line)
+            fh.write('\n')
 
 
 # Helpers
@@ -0,0 +1,467 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, urlsplit
+import requests
+
+from config import SERVICE_URLS, GEOCODER_RATE_LIMITS
+from gazetteer import Gazetteer, feature_classes
+from geocoding import create_rate_limiters
+from helpers.chunker import get_left_context, get_right_context
+from helpers.geocode_cache import normalize_place_name
+from toponym_tagger import ToponymTagger, TAGGER_MIN_POPULATION
+
+
+# The service of each path, the stand-in serves the services on the paths of the real ones
+ROUTES = {urlsplit(url).path: service for service, url in SERVICE_URLS.items()}
+# The rate limiter (see GEOCODER_RATE_LIMITS) of each service, when recording
+LIMITERS = {'geonames': 'geonames', 'geonames_details': 'geonames', 'google': 'google', 'osm': 'osm'}
+# The query parameters with credentials, which are left out of the cassettes, and the environment variables
+# the recorder takes them from
+CREDENTIALS = {'username': 'GEONAMES_USERNAME', 'key': 'GOOGLE_API_KEY'}
+# The headers of a request that are passed on to the real services
+FORWARDED_HEADERS = ['Content-Type', 'User-Agent', 'Accept', 'Accept-Language']
+
+WORD = re.compile(r'\w+')
+# The types of the names found by the fake multiNER service, by a hash of the name
+ENTITY_TYPES = ['LOCATION', 'LOCATION', 'PERSON', 'ORGANIZATION']
+
+
+def get_request_key(method, service, query, body):
+    '''
+    Get the key of a request in a cassette: a hash of its method, service, query parameters (in order,
+    without credentials) and body (with the keys of a JSON body in order).
+    '''
+    query = sorted((name, value) for name, value in query if name not in CREDENTIALS)
+    try:
+        body = json.dumps(json.loads(body.decode('utf-8')), sort_keys=True) if body else ''
+    except ValueError:
+        body = body.decode('utf-8', 'replace')
+    return hashlib.sha256(json.dumps([method, service, query, body]).encode('utf-8')).hexdigest()
+
+
+def get_place_id(place_name):
+    return zlib.crc32(normalize_place_name(place_name).encode('utf-8'))
+
+
+def get_coordinates(place_id):
+    '''
+    Get the (made up, but always the same) coordinates of a place id.
+    '''
+    rng = random.Random(place_id)
+    return round(rng.uniform(-60, 70), 5), round(rng.uniform(-180, 180), 5)
+
+
+def find_capitalized(text):
+    '''
+    Find the sequences of capitalized words (separated by a single space) in text, where the first word
+    of a sentence does not count as capitalized. Returns a list of (start, end) character offsets.
+    '''
+    spans = []
+    previous_end = None
+    for match in WORD.finditer(text):
+        start, end = match.span()
+        before = text[max(0, start - 10):start].rstrip()
+        if not match.group()[0].isupper() or not before or before[-1] in '.!?':
+            previous_end = None
+            continue
+
+        if previous_end is not None and text[previous_end:start] == ' ':
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+        previous_end = end
+    return spans
+
+
+class Cassette:
+    '''
+    The responses of the real services, stored in (and read from) a file with a JSON object per line,
+    by the key of their request (see get_request_key). It can be shared between threads.
+    Responses can only be added if it is opened to 'record'.
+    '''
+
+    def __init__(self, path, record=False):
+        self.path = path
+        self.responses = {}
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as fh:
+                for line in fh:
+                    if line.strip():
+                        recording = json.loads(line)
+                        self.responses[recording['key']] = (recording['status'], recording['body'].encode('utf-8'))
+
+        self.file = open(path, 'a', encoding='utf-8') if record else None
+
+    def __len__(self):
+        return len(self.responses)
+
+    def get(self, key):
+        '''
+        Get the (status, body) of the response to a request, or None if it was not recorded.
+        '''
+        return self.responses.get(key)
+
+    def add(self, key, request, status, body):
+        with self.lock:
+            self.responses[key] = (status, body)
+            self.file.write(json.dumps({
+                'key': key, 'request': request, 'status': status, 'body': body.decode('utf-8', 'replace')}) + '\n')
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    # keep connections open, as the clients use sessions
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_service_request('GET')
+
+    def do_POST(self):
+        self.handle_service_request('POST')
+
+    def handle_service_request(self, method):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        url = urlsplit(self.path)
+        service = ROUTES.get(url.path)
+
+        if service is None:
+            status, content = 404, json.dumps({'error': "no service at '{}'".format(url.path)}).encode('utf-8')
+        else:
+            status, content = self.server.respond(
+                service, method, parse_qsl(url.query, keep_blank_values=True), body, self.headers)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FakeServices(ThreadingMixIn, HTTPServer):
+    '''
+    A local stand-in for the multiNER service and the geocoding services (GeoNames, Google Places and
+    Nominatim), to run and benchmark extract.py without them (see --services_url). Serves each service on
+    the path of the real one (see SERVICE_URLS), with the same request and response formats, a thread per request.
+
+    By default, the responses are made up, but always the same for the same request: the fake multiNER service
+    finds the capitalized words in a text (or, if a ToponymTagger is provided, the names in its gazetteer),
+    the geocoding services find a place for a name (except for the share not_found_rate of the names)
+    with coordinates derived from a hash of the name.
+
+    With a Cassette, the responses are read from it instead (and requests that are not in it get a 404),
+    or, if 'record', the requests that are not in it are passed on to the real services (within their
+    GEOCODER_RATE_LIMITS, with the credentials from the environment variables), and their responses added to it.
+
+    Keyword arguments:
+        latency -- The number of seconds to wait before each response.
+        ner_latency -- The number of seconds to wait (on top of latency) per 1000 bytes of a multiNER request.
+        error_rate -- The share of the requests that fail (at random) with error_status.
+        not_found_rate -- The share of the place names the fake geocoding services do not find.
+        seed -- The seed of the random failures.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, ner_latency=0.0, error_rate=0.0, error_status=500, not_found_rate=0.0,
+                 seed=None, tagger=None, cassette=None, record=False, verbose=False):
+        super().__init__(address, FakeServiceHandler)
+        self.latency = latency
+        self.ner_latency = ner_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.not_found_rate = not_found_rate
+        self.random = random.Random(seed)
+        self.tagger = tagger
+        self.cassette = cassette
+        self.record = record
+        self.verbose = verbose
+        self.limiters = create_rate_limiters(GEOCODER_RATE_LIMITS) if record else None
+        self.session = requests.Session() if record else None
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.responses = Counter()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def respond(self, service, method, query, body, headers):
+        '''
+        Get the (status, body) of the response to a request to a service.
+        '''
+        latency = self.latency + (self.ner_latency * len(body) / 1000 if service == 'multiner' else 0)
+        if latency:
+            time.sleep(latency)
+
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+
+        if failed:
+            status, content = self.error_status, self.get_error('the {} service failed'.format(service))
+        elif self.cassette is not None:
+            status, content = self.replay(service, method, query, body, headers)
+        else:
+            status, content = self.fake(service, query, body)
+
+        with self.lock:
+            self.requests[service] += 1
+            self.responses[status] += 1
+        return status, content
+
+    def replay(self, service, method, query, body, headers):
+        key = get_request_key(method, service, query, body)
+        recorded = self.cassette.get(key)
+        if recorded is not None:
+            return recorded
+        if not self.record:
+            return 404, self.get_error('the request is not in the cassette')
+
+        status, content = self.forward(service, method, query, body, headers)
+        # errors are passed on, but not recorded
+        if status < 500 and status != 429:
+            request = '{} {} {}'.format(method, service, [(name, value) for name, value in query
+                                                          if name not in CREDENTIALS])
+            self.cassette.add(key, request, status, content)
+        return status, content
+
+    def forward(self, service, method, query, body, headers):
+        '''
+        Make a request to the real service.
+        '''
+        if service in LIMITERS:
+            self.limiters[LIMITERS[service]].acquire()
+
+        query = [(name, os.environ.get(CREDENTIALS[name], value) if name in CREDENTIALS else value)
+                 for name, value in query]
+        try:
+            r = self.session.request(
+                method, SERVICE_URLS[service], params=query, data=body or None,
+                headers={name: headers[name] for name in FORWARDED_HEADERS if name in headers})
+        except requests.exceptions.RequestException as e:
+            return 502, self.get_error('could not reach the {} service: {}'.format(service, e))
+        return r.status_code, r.content
+
+    def fake(self, service, query, body):
+        try:
+            if service == 'multiner':
+                response = self.fake_multiner(json.loads(body.decode('utf-8')))
+            else:
+                response = getattr(self, 'fake_{}'.format(service))(dict(query))
+        except (ValueError, KeyError) as e:
+            return 400, self.get_error('invalid request: {}'.format(e))
+
+        return 200, json.dumps(response).encode('utf-8')
+
+    def get_error(self, message):
+        return json.dumps({'error': message}).encode('utf-8')
+
+    def is_found(self, place_id):
+        return place_id % 1000 >= self.not_found_rate * 1000
+
+    def fake_multiner(self, body):
+        text = body['text']
+        context_length = body.get('configuration', {}).get('context_length', 3)
+        if self.tagger is not None:
+            return self.tagger.tag(body.get('title'), text, context_length)
+
+        spans = find_capitalized(text)
+        counts = Counter(text[start:end] for start, end in spans)
+        return {'text': {'title': body.get('title'), 'entities': [{
+            'ne': text[start:end],
+            'pos': start,
+            'type': ENTITY_TYPES[zlib.crc32(text[start:end].encode('utf-8')) % len(ENTITY_TYPES)],
+            'count': counts[text[start:end]],
+            'ner_src': ['fake'],
+            'type_certainty': 1,
+            'alt_nes': [],
+            'left_context': get_left_context(text, start, context_length),
+            'right_context': get_right_context(text, end, context_length)
+        } for start, end in spans]}}
+
+    def fake_geonames(self, query):
+        name = query['q']
+        place_id = get_place_id(name)
+        if not self.is_found(place_id):
+            return {'totalResultsCount': 0, 'geonames': []}
+
+        lat, lng = get_coordinates(place_id)
+        return {'totalResultsCount': 1, 'geonames': [{
+            'geonameId': place_id, 'name': name, 'toponymName': name, 'lat': str(lat), 'lng': str(lng),
+            'fcl': query.get('featureClass', 'P'), 'population': 0}]}
+
+    def fake_geonames_details(self, query):
+        place_id = int(query['geonameId'])
+        lat, lng = get_coordinates(place_id)
+        return {'geonameId': place_id, 'name': str(place_id), 'toponymName': str(place_id),
+                'lat': str(lat), 'lng': str(lng), 'population': 0}
+
+    def fake_google(self, query):
+        name = query['query']
+        place_id = get_place_id(name)
+        if not self.is_found(place_id):
+            return {'status': 'ZERO_RESULTS', 'results': []}
+
+        lat, lng = get_coordinates(place_id)
+        return {'status': 'OK', 'results': [{
+            'geometry': {'location': {'lat': lat, 'lng': lng}}, 'name': name, 'formatted_address': name,
+            'place_id': str(place_id), 'types': ['locality', 'political']}]}
+
+    def fake_osm(self, query):
+        name = query['q']
+        place_id = get_place_id(name)
+        if not self.is_found(place_id):
+            return []
+
+        lat, lng = get_coordinates(place_id)
+        return [{'place_id': place_id, 'lat': str(lat), 'lon': str(lng), 'display_name': name,
+                 'category': 'place', 'type': 'city', 'importance': 0.5, 'address': {}}]
+
+    def get_stats(self):
+        with self.lock:
+            return "fake services: {} requests ({}), responses {}".format(
+                sum(self.requests.values()),
+                ', '.join('{}: {}'.format(service, count) for service, count in sorted(self.requests.items())),
+                ', '.join('{}: {}'.format(status, count) for status, count in sorted(self.responses.items())))
+
+    def server_close(self):
+        super().server_close()
+        if self.cassette is not None:
+            self.cassette.close()
+        if self.session is not None:
+            self.session.close()
+
+
+def parseArguments(sysArgs):
+    parser = argparse.ArgumentParser(
+        description='Serve local stand-ins for the multiNER and geocoding services, to run extract.py with --services_url')
+
+    parser.add_argument(
+        '--host',
+        dest='host', default='127.0.0.1',
+        help="The address to listen on. Defaults to '127.0.0.1'.")
+
+    parser.add_argument(
+        '--port',
+        dest='port', default=8000, type=int,
+        help="The port to listen on. Defaults to 8000.")
+
+    parser.add_argument(
+        '--latency',
+        dest='latency', default=0.0, type=float,
+        help="The number of seconds to wait before each response. Defaults to 0.")
+
+    parser.add_argument(
+        '--ner_latency',
+        dest='ner_latency', default=0.0, type=float,
+        help="The number of seconds the multiNER service waits (on top of --latency) per 1000 bytes of text. Defaults to 0.")
+
+    parser.add_argument(
+        '--error_rate',
+        dest='error_rate', default=0.0, type=float,
+        help="The share of the requests (0 to 1) that fail with --error_status, at random. Defaults to 0.")
+
+    parser.add_argument(
+        '--error_status',
+        dest='error_status', default=500, type=int,
+        help="The status code of failed requests. Defaults to 500.")
+
+    parser.add_argument(
+        '--not_found_rate',
+        dest='not_found_rate', default=0.0, type=float,
+        help="The share of the place names (0 to 1) that the geocoding services do not find. Defaults to 0.")
+
+    parser.add_argument(
+        '--seed',
+        dest='seed', default=None, type=int,
+        help="The seed of the random failures, to fail the same share of requests in each run.")
+
+    parser.add_argument(
+        '--gazetteer',
+        dest='gazetteer', default=None,
+        help="A gazetteer index (see gazetteer.py), to find the place names in it with the multiNER service, instead of capitalized words.")
+
+    parser.add_argument(
+        '--tagger_feature_classes',
+        dest='tagger_feature_classes', default=None, type=feature_classes,
+        help="A comma separated list of the feature classes of the places in the gazetteer to find (e.g. 'A,P'). Defaults to all.")
+
+    parser.add_argument(
+        '--tagger_min_population',
+        dest='tagger_min_population', default=TAGGER_MIN_POPULATION, type=int,
+        help="Only find places in the gazetteer with at least this population. Defaults to {}.".format(TAGGER_MIN_POPULATION))
+
+    group = parser.add_mutually_exclusive_group()
+
+    group.add_argument(
+        '--record',
+        dest='record', default=None,
+        help="""A cassette file to record the responses of the real services in: requests that are not in it yet are
+                passed on to the real services, with the credentials from GEONAMES_USERNAME and GOOGLE_API_KEY.""")
+
+    group.add_argument(
+        '--replay',
+        dest='replay', default=None,
+        help="A cassette file (see --record) to serve the responses from.")
+
+    parser.add_argument(
+        '--verbose',
+        dest='verbose', action='store_true',
+        help="Print every request.")
+
+    parsedArgs = parser.parse_args()
+
+    return parsedArgs
+
+
+def main(sysArgs):
+    args = parseArguments(sysArgs)
+
+    if args.replay and not os.path.isfile(args.replay):
+        print("'{}' does not exist".format(args.replay))
+        return 1
+
+    tagger = None
+    if args.gazetteer:
+        gazetteer = Gazetteer(args.gazetteer)
+        tagger = ToponymTagger.from_gazetteer(gazetteer, args.tagger_feature_classes, args.tagger_min_population)
+        gazetteer.close()
+
+    cassette = Cassette(args.record or args.replay, bool(args.record)) if args.record or args.replay else None
+    server = FakeServices(
+        (args.host, args.port), args.latency, args.ner_latency, args.error_rate, args.error_status,
+        args.not_found_rate, args.seed, tagger, cassette, bool(args.record), args.verbose)
+
+    print("serving the services at {0}, run extract.py with '--services_url {0}'".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(server.get_stats())
+        server.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
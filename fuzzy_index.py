@@ -0,0 +1,361 @@
+import argparse
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unicodedata
+import zlib
+from array import array
+from collections import namedtuple
+from itertools import combinations
+import numpy as np
+
+from gazetteer import Gazetteer
+from helpers.geocode_cache import normalize_place_name
+
+
+FuzzyMatch = namedtuple('FuzzyMatch', ['key', 'name', 'distance', 'population'])
+
+# Letters that are not decomposed into a base letter and an accent by unicode normalization
+LETTERS = str.maketrans({'ø': 'o', 'ł': 'l', 'đ': 'd', 'ħ': 'h', 'ı': 'i', 'æ': 'ae', 'œ': 'oe', 'þ': 'th'})
+
+
+def fold_place_name(name):
+    '''
+    Fold a place name for fuzzy matching: ignore case, accents (also those that OCR separated from their letter,
+    e.g. 'Mu¨nchen'), punctuation and whitespace (other than a single space between words).
+    '''
+    name = ''.join(c for c in name if unicodedata.category(c) != 'Sk')
+    name = ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+    name = name.casefold().translate(LETTERS)
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in name).split())
+
+
+def get_deletes(text, max_distance, prefix_length):
+    '''
+    Get the strings that are the prefix of text with up to max_distance characters deleted (including the prefix).
+    '''
+    prefix = text[:prefix_length]
+    deletes = set()
+    for count in range(min(max_distance, len(prefix)) + 1):
+        for positions in combinations(range(len(prefix)), count):
+            deletes.add(''.join(c for i, c in enumerate(prefix) if i not in positions))
+    return deletes
+
+
+def get_hash(text):
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def get_pattern(a):
+    '''
+    The bit masks of the positions of each character in a, for get_edit_distance.
+    '''
+    pattern = {}
+    for i, c in enumerate(a):
+        pattern[c] = pattern.get(c, 0) | (1 << i)
+    return pattern
+
+
+def get_edit_distance(a, b, pattern=None):
+    '''
+    The number of insertions, deletions, substitutions and transpositions (of adjacent characters)
+    to turn a into b (the optimal string alignment distance). Pass the pattern of a (see get_pattern)
+    when computing the distance from a to many strings.
+
+    The columns of the edit distance matrix are computed as bit vectors (with a bit per character of a),
+    as in the bit-parallel algorithm of Myers (1999), with transpositions as described by Hyyrö (2003).
+    '''
+    if not a:
+        return len(b)
+
+    pattern = get_pattern(a) if pattern is None else pattern
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    # the positive and negative vertical differences, and the diagonal zero differences
+    positive, negative, zero = full, 0, 0
+    previous_matches = 0
+    distance = len(a)
+
+    for c in b:
+        matches = pattern.get(c, 0)
+        transposed = ((~zero & matches) << 1) & previous_matches
+        zero = (((((matches & positive) + positive) & full) ^ positive) | matches | negative | transposed) & full
+        horizontal_positive = (negative | ~(zero | positive)) & full
+        horizontal_negative = zero & positive
+        if horizontal_positive & last:
+            distance += 1
+        elif horizontal_negative & last:
+            distance -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = (horizontal_negative | ~(zero | horizontal_positive)) & full
+        negative = horizontal_positive & zero
+        previous_matches = matches
+
+    return distance
+
+
+class FuzzyIndex:
+    '''
+    An offline, memory-mapped index for fuzzy lookups of the names and alternate names in a Gazetteer,
+    that finds the names within an edit distance of a (possibly historical, misspelled or OCR'd) place name,
+    after folding case, accents and punctuation (see fold_place_name). Create the index file with FuzzyIndex.build
+    (or by calling this script), then open it with FuzzyIndex(path).
+
+    Like SymSpell, the index maps the strings that are left after deleting up to max_distance characters
+    from (the first prefix_length characters of) a name to that name. The names within max_distance of a place name
+    share at least one of these deletes with it, so a lookup only computes the edit distance to those names.
+    The deletes are stored as hashes, in a sorted table that is searched with a binary search.
+
+    The index file consists of a header, the population per name, the offsets of the names in the blob,
+    the (sorted) hashes of the deletes and the name each belongs to, the length of each folded name,
+    and a blob with per name its folded form, the name as used in the gazetteer and the name to look it up with,
+    as UTF-8.
+    '''
+
+    # The largest edit distance a place name is corrected over, by the length of the folded name:
+    # in short names, a few edits turn most names into another one
+    CORRECTION_DISTANCES = [(4, 0), (8, 1)]
+
+    MAGIC = b'PNDFUZ01'
+    # name count, delete count, max distance, prefix length
+    HEADER = struct.Struct('<8sIIII')
+    # The number of deletes that are sorted in memory at a time when building an index
+    SORT_RUN_SIZE = 2 ** 20
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self.data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.name_count, self.delete_count, self.max_distance, self.prefix_length = \
+            self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC:
+            raise ValueError("'{}' is not a fuzzy index".format(path))
+
+        offset = self.HEADER.size
+        self.populations, offset = self.get_array(offset, np.int64, self.name_count)
+        self.offsets, offset = self.get_array(offset, np.uint32, self.name_count + 1)
+        self.hashes, offset = self.get_array(offset, np.uint32, self.delete_count)
+        self.names, offset = self.get_array(offset, np.uint32, self.delete_count)
+        self.lengths, offset = self.get_array(offset, np.uint16, self.name_count)
+        self.blob_start = offset
+
+    def get_array(self, offset, dtype, count):
+        array = np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
+        return array, offset + array.nbytes
+
+    def __len__(self):
+        return self.name_count
+
+    def get_name(self, index):
+        '''
+        The folded form, gazetteer key and name of the name at index.
+        '''
+        start = self.blob_start + int(self.offsets[index])
+        end = self.blob_start + int(self.offsets[index + 1])
+        return self.data[start:end].decode('utf-8').split('\t')
+
+    def lookup(self, name, max_distance=None, limit=None):
+        '''
+        Find the names within max_distance (at most, and by default, that of the index) of 'name',
+        after folding both. Returns a list of FuzzyMatch, closest first, then the ones with the same
+        (normalized) name, then the most populous.
+        '''
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        folded = fold_place_name(name)
+        if not folded:
+            return []
+
+        hashes = np.array(sorted(get_hash(delete) for delete in
+                                 get_deletes(folded, max_distance, self.prefix_length)), dtype=np.uint32)
+        starts = np.searchsorted(self.hashes, hashes, side='left')
+        counts = np.searchsorted(self.hashes, hashes, side='right') - starts
+        positions = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        indices = np.unique(self.names[positions])
+        # names that differ more in length than max_distance are not close
+        indices = indices[np.abs(self.lengths[indices].astype(np.int64) - len(folded)) <= max_distance]
+
+        key = normalize_place_name(name)
+        pattern = get_pattern(folded)
+        matches = []
+        for index in indices.tolist():
+            other_folded, other_key, other_name = self.get_name(index)
+            distance = get_edit_distance(folded, other_folded, pattern)
+            if distance <= max_distance:
+                matches.append(FuzzyMatch(other_key, other_name, distance, int(self.populations[index])))
+
+        matches.sort(key=lambda match: (match.distance, match.key != key, -match.population, match.key))
+        return matches[:limit] if limit is not None else matches
+
+    def correct(self, name):
+        '''
+        Get the spelling of a place name to look it up with: the name of the closest match,
+        or name itself if that is in the gazetteer (or nothing is close). Short names are only corrected
+        over a smaller distance, see CORRECTION_DISTANCES.
+        '''
+        matches = self.lookup(name, self.get_correction_distance(len(fold_place_name(name))), limit=1)
+        if not matches or matches[0].key == normalize_place_name(name):
+            return name
+        return matches[0].name
+
+    def get_correction_distance(self, length):
+        for max_length, distance in self.CORRECTION_DISTANCES:
+            if length <= max_length:
+                return distance
+        return self.max_distance
+
+    def close(self):
+        # the arrays share the memory of the mmap, which cannot be closed while they exist
+        self.populations = self.offsets = self.hashes = self.names = self.lengths = None
+        self.data.close()
+
+    @classmethod
+    def build(cls, gazetteer, index_path, max_distance=2, prefix_length=9):
+        '''
+        Build an index file for the names in a Gazetteer.
+        The names are written to temporary files (next to the index file) as they are read, and the deletes
+        are sorted in runs of SORT_RUN_SIZE that are merged, so that the memory used does not grow with the gazetteer.
+
+        Keyword arguments:
+            max_distance -- The largest edit distance that can be looked up. Defaults to 2.
+            prefix_length -- The number of characters of a name that deletes are made of. Longer prefixes
+                             find fewer candidates to compute the edit distance to, but make the index larger.
+                             Defaults to 9.
+        '''
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(index_path))) as temp_dir:
+            populations_path = os.path.join(temp_dir, 'populations')
+            offsets_path = os.path.join(temp_dir, 'offsets')
+            hashes_path = os.path.join(temp_dir, 'hashes')
+            names_path = os.path.join(temp_dir, 'names')
+            lengths_path = os.path.join(temp_dir, 'lengths')
+            blob_path = os.path.join(temp_dir, 'blob')
+            name_count = 0
+            delete_count = 0
+            hashes = array('I')
+            names = array('I')
+            runs = []
+
+            with open(populations_path, 'wb') as populations, open(offsets_path, 'wb') as offsets, \
+                    open(lengths_path, 'wb') as lengths, open(blob_path, 'wb') as blob:
+                offsets.write(np.uint32(0).tobytes())
+
+                for key, entries in gazetteer.iter_names():
+                    folded = fold_place_name(key)
+                    if not folded:
+                        continue
+
+                    # look the name up by the primary name of an entry if it is one (to keep its case), otherwise by the key
+                    spelling = next((entry.name for entry in entries if normalize_place_name(entry.name) == key), key)
+                    populations.write(np.int64(max(entry.population for entry in entries)).tobytes())
+                    lengths.write(np.uint16(len(folded)).tobytes())
+                    blob.write('\t'.join([folded, key, spelling]).encode('utf-8'))
+                    offsets.write(np.uint32(blob.tell()).tobytes())
+
+                    for delete in get_deletes(folded, max_distance, prefix_length):
+                        hashes.append(get_hash(delete))
+                        names.append(name_count)
+                    name_count += 1
+
+                    if len(hashes) >= cls.SORT_RUN_SIZE:
+                        runs.append(write_run(hashes, names, os.path.join(temp_dir, 'run{}'.format(len(runs)))))
+                        hashes = array('I')
+                        names = array('I')
+
+            runs.append(write_run(hashes, names, os.path.join(temp_dir, 'run{}'.format(len(runs)))))
+            hashes = array('I')
+            names = array('I')
+
+            # the deletes are sorted by hash, then by name, and written in blocks
+            with open(hashes_path, 'wb') as hashes_file, open(names_path, 'wb') as names_file:
+                for delete_hash, name_index in heapq.merge(*[read_run(path) for path in runs]):
+                    hashes.append(delete_hash)
+                    names.append(name_index)
+                    delete_count += 1
+                    if len(hashes) >= 65536:
+                        hashes.tofile(hashes_file)
+                        names.tofile(names_file)
+                        hashes = array('I')
+                        names = array('I')
+                hashes.tofile(hashes_file)
+                names.tofile(names_file)
+
+            with open(index_path, 'wb') as fh:
+                fh.write(cls.HEADER.pack(cls.MAGIC, name_count, delete_count, max_distance, prefix_length))
+                for path in [populations_path, offsets_path, hashes_path, names_path, lengths_path, blob_path]:
+                    with open(path, 'rb') as part:
+                        shutil.copyfileobj(part, fh, 1024 * 1024)
+
+
+def write_run(hashes, names, path):
+    '''
+    Sort the deletes in a run (arrays of their hashes and the index of the name each belongs to) by hash,
+    then by name, and write them to a file as pairs of 32 bit integers. Returns the path.
+    '''
+    hashes = np.frombuffer(hashes, dtype=np.uint32)
+    names = np.frombuffer(names, dtype=np.uint32)
+    order = np.lexsort((names, hashes))
+    pairs = np.empty((len(order), 2), dtype=np.uint32)
+    pairs[:, 0] = hashes[order]
+    pairs[:, 1] = names[order]
+    pairs.tofile(path)
+    return path
+
+
+def read_run(path, block_size=65536):
+    with open(path, 'rb') as fh:
+        while True:
+            pairs = np.fromfile(fh, dtype=np.uint32, count=2 * block_size)
+            if not len(pairs):
+                break
+            yield from zip(pairs[0::2].tolist(), pairs[1::2].tolist())
+
+
+def parseArguments(sysArgs):
+    parser = argparse.ArgumentParser(
+        description='Build a fuzzy index over the names in a gazetteer index (see gazetteer.py)')
+
+    parser.add_argument(
+        '--gazetteer',
+        dest='gazetteer', required=True,
+        help="The gazetteer index to build the fuzzy index for")
+
+    parser.add_argument(
+        '--out',
+        dest='index_path', required=True,
+        help="The file to write the index to")
+
+    parser.add_argument(
+        '--max_distance',
+        dest='max_distance', default=2, type=int,
+        help="The largest edit distance that can be looked up. Defaults to 2.")
+
+    parser.add_argument(
+        '--prefix_length',
+        dest='prefix_length', default=9, type=int,
+        help="The number of characters of a name that the index is built from. Defaults to 9.")
+
+    parsedArgs = parser.parse_args()
+
+    return parsedArgs
+
+
+def main(sysArgs):
+    args = parseArguments(sysArgs)
+
+    if not os.path.isfile(args.gazetteer):
+        print("'{}' does not exist".format(args.gazetteer))
+        return 1
+
+    gazetteer = Gazetteer(args.gazetteer)
+    FuzzyIndex.build(gazetteer, args.index_path, args.max_distance, args.prefix_length)
+    gazetteer.close()
+    print("fuzzy index written to '{}'".format(args.index_path))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
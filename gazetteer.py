@@ -0,0 +1,271 @@
+import argparse
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from collections import namedtuple
+
+from helpers.geocode_cache import normalize_place_name
+
+
+GazetteerEntry = namedtuple(
+    'GazetteerEntry', ['geonameid', 'name', 'lat', 'lng', 'feature_class', 'country_code', 'population'])
+
+
+class Gazetteer:
+    '''
+    An offline, memory-mapped index over a GeoNames dump (allCountries.txt, cities*.txt),
+    that maps (normalized) names and alternate names to GeoNames entries. Create the index
+    file with Gazetteer.build (or by calling this script), then open it with Gazetteer(path).
+
+    The index file consists of a header, a table of fixed size records (one per GeoNames entry),
+    a table of (name, record) pairs sorted by name, and a blob containing the names as UTF-8.
+    '''
+
+    MAGIC = b'PNDGAZ01'
+    HEADER = struct.Struct('<8sII')
+    # geonameid, lat, lng, name offset, name length, feature class, country code, population
+    RECORD = struct.Struct('<IddIHc2sq')
+    # key offset, key length, record index
+    NAME = struct.Struct('<IHI')
+    # The number of names that are sorted in memory when building an index, more are sorted in runs that are merged
+    SORT_RUN_SIZE = 2 ** 20
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self.data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.record_count, self.name_count = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC:
+            raise ValueError("'{}' is not a gazetteer index".format(path))
+
+        self.records_start = self.HEADER.size
+        self.names_start = self.records_start + self.record_count * self.RECORD.size
+        self.blob_start = self.names_start + self.name_count * self.NAME.size
+
+    def __len__(self):
+        return self.record_count
+
+    def lookup(self, name, feature_class=None, limit=None):
+        '''
+        Find the entries with 'name' as name or alternate name (case and whitespace insensitive).
+        Returns a list of GazetteerEntry, most populous first.
+
+        Keyword arguments:
+            feature_class -- Only return entries of this GeoNames feature class (e.g. 'A' or 'P').
+            limit -- The maximum number of entries to return.
+        '''
+        key = normalize_place_name(name).encode('utf-8')
+        index = self.find_first(key)
+        entries = []
+
+        while index < self.name_count and self.get_key(index) == key:
+            entry = self.get_entry(self.NAME.unpack_from(self.data, self.get_name_position(index))[2])
+            if feature_class is None or entry.feature_class == feature_class:
+                entries.append(entry)
+            index += 1
+
+        entries.sort(key=lambda entry: entry.population, reverse=True)
+        return entries[:limit] if limit is not None else entries
+
+    def iter_names(self):
+        '''
+        Iterate over the (normalized) names and alternate names in the index, in order.
+        Yields the name and a list of the GazetteerEntry it belongs to.
+        '''
+        index = 0
+        while index < self.name_count:
+            key = self.get_key(index)
+            entries = []
+            while index < self.name_count and self.get_key(index) == key:
+                entries.append(self.get_entry(self.NAME.unpack_from(self.data, self.get_name_position(index))[2]))
+                index += 1
+            yield key.decode('utf-8'), entries
+
+    def find_first(self, key):
+        '''
+        Binary search for the index of the first name that is not smaller than key.
+        '''
+        low, high = 0, self.name_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get_key(self, index):
+        offset, length, record_index = self.NAME.unpack_from(self.data, self.get_name_position(index))
+        start = self.blob_start + offset
+        return self.data[start:start + length]
+
+    def get_name_position(self, index):
+        return self.names_start + index * self.NAME.size
+
+    def get_entry(self, record_index):
+        geonameid, lat, lng, name_offset, name_length, feature_class, country_code, population = \
+            self.RECORD.unpack_from(self.data, self.records_start + record_index * self.RECORD.size)
+        start = self.blob_start + name_offset
+        return GazetteerEntry(
+            geonameid, self.data[start:start + name_length].decode('utf-8'), lat, lng,
+            feature_class.decode('ascii').strip(), country_code.decode('ascii').strip(), population)
+
+    def close(self):
+        self.data.close()
+
+    @classmethod
+    def build(cls, dump_paths, index_path, feature_classes=None, min_population=0):
+        '''
+        Build an index file from one or more GeoNames dumps (tab separated, in the format of allCountries.txt).
+        The records and names are written to temporary files (next to the index file) as they are read,
+        and the names are sorted in runs of SORT_RUN_SIZE that are merged, so that large dumps fit in memory.
+
+        Keyword arguments:
+            feature_classes -- Only include entries of these feature classes. Defaults to 'None', i.e. all.
+            min_population -- Only include entries with at least this population. Defaults to 0.
+        '''
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(index_path))) as temp_dir:
+            records_path = os.path.join(temp_dir, 'records')
+            names_path = os.path.join(temp_dir, 'names')
+            blob_path = os.path.join(temp_dir, 'blob')
+            record_count = 0
+            name_count = 0
+            names = []
+            runs = []
+
+            with open(records_path, 'wb') as records, open(blob_path, 'wb') as blob:
+                for entry in read_dumps(dump_paths):
+                    if feature_classes is not None and entry.feature_class not in feature_classes:
+                        continue
+                    if entry.population < min_population:
+                        continue
+
+                    name = entry.name.encode('utf-8')
+                    records.write(cls.RECORD.pack(
+                        entry.geonameid, entry.lat, entry.lng, blob.tell(), len(name),
+                        (entry.feature_class or ' ').encode('ascii'),
+                        entry.country_code.ljust(2).encode('ascii'), entry.population))
+                    blob.write(name)
+
+                    for key in set(normalize_place_name(name) for name in entry.alternate_names + [entry.name]):
+                        if key:
+                            names.append((key, record_count))
+                    record_count += 1
+
+                    if len(names) >= cls.SORT_RUN_SIZE:
+                        runs.append(write_run(names, os.path.join(temp_dir, 'run{}'.format(len(runs)))))
+                        names = []
+
+                # the keys are added to the blob in order, so that each key is only stored once
+                names.sort()
+                with open(names_path, 'wb') as names_file:
+                    previous_key = None
+                    for key, record_index in heapq.merge(names, *[read_run(path) for path in runs]):
+                        if key != previous_key:
+                            encoded = key.encode('utf-8')
+                            key_offset = blob.tell()
+                            blob.write(encoded)
+                            previous_key = key
+                        names_file.write(cls.NAME.pack(key_offset, len(encoded), record_index))
+                        name_count += 1
+
+            with open(index_path, 'wb') as fh:
+                fh.write(cls.HEADER.pack(cls.MAGIC, record_count, name_count))
+                for path in [records_path, names_path, blob_path]:
+                    with open(path, 'rb') as part:
+                        shutil.copyfileobj(part, fh, 1024 * 1024)
+
+
+def write_run(names, path):
+    '''
+    Sort a list of (key, record index) and write it to a file, a line per name. Returns the path.
+    Normalized names (see normalize_place_name) do not contain tabs or line breaks.
+    '''
+    names.sort()
+    with open(path, 'w', encoding='utf-8', newline='\n') as fh:
+        for key, record_index in names:
+            fh.write('{}\t{}\n'.format(key, record_index))
+    return path
+
+
+def read_run(path):
+    with open(path, 'r', encoding='utf-8', newline='\n') as fh:
+        for line in fh:
+            key, record_index = line.rstrip('\n').rsplit('\t', 1)
+            yield key, int(record_index)
+
+
+DumpEntry = namedtuple(
+    'DumpEntry', ['geonameid', 'name', 'alternate_names', 'lat', 'lng', 'feature_class', 'country_code', 'population'])
+
+
+def read_dumps(dump_paths):
+    '''
+    Read the entries from GeoNames dump files. See http://download.geonames.org/export/dump/readme.txt for the format.
+    '''
+    for path in dump_paths:
+        with open(path, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                columns = line.rstrip('\n').split('\t')
+                if len(columns) < 15:
+                    continue
+
+                yield DumpEntry(
+                    int(columns[0]), columns[1], [columns[2]] + columns[3].split(','),
+                    float(columns[4]), float(columns[5]), columns[6], columns[8],
+                    int(columns[14]) if columns[14] else 0)
+
+
+# Input validation
+def feature_classes(input):
+    return input.upper().split(',')
+
+
+def parseArguments(sysArgs):
+    parser = argparse.ArgumentParser(
+        description='Build an offline gazetteer index from GeoNames dumps (e.g. allCountries.txt or cities1000.txt)')
+
+    parser.add_argument(
+        '--dump',
+        dest='dumps', required=True, nargs='+',
+        help="The GeoNames dump file(s) to include in the index")
+
+    parser.add_argument(
+        '--out',
+        dest='index_path', required=True,
+        help="The file to write the index to")
+
+    parser.add_argument(
+        '--feature_classes',
+        dest='feature_classes', default=None, type=feature_classes,
+        help="A comma separated list of the feature classes to include (e.g. 'A,P'). Defaults to all.")
+
+    parser.add_argument(
+        '--min_population',
+        dest='min_population', default=0, type=int,
+        help="Only include places with at least this population. Defaults to 0.")
+
+    parsedArgs = parser.parse_args()
+
+    return parsedArgs
+
+
+def main(sysArgs):
+    args = parseArguments(sysArgs)
+
+    for dump in args.dumps:
+        if not os.path.isfile(dump):
+            print("'{}' does not exist".format(dump))
+            return 1
+
+    Gazetteer.build(args.dumps, args.index_path, args.feature_classes, args.min_population)
+    print("gazetteer index written to '{}'".format(args.index_path))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,77 +1,241 @@
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 import geocoder
 import requests
 
+from config import GEOCODER_RATE_LIMITS, SERVICE_URLS
+from helpers.geocode_cache import GeocodeCache, normalize_place_name
+from helpers.rate_limiter import RateLimiter
+
+
+def create_rate_limiters(rate_limits=GEOCODER_RATE_LIMITS):
+    '''
+    Create a RateLimiter per provider. Share these between Geocoders to respect the limits for a whole run.
+    '''
+    return {provider: RateLimiter(rate, burst) for provider, (rate, burst) in rate_limits.items()}
+
+
+def get_service_urls(base_url):
+    '''
+    Get the URLs of the services (see SERVICE_URLS) on a stand-in server at base_url (e.g. 'http://localhost:8000'),
+    which serves them on the paths of the real ones (see fake_services.py).
+    '''
+    return {service: base_url.rstrip('/') + urlsplit(url).path for service, url in SERVICE_URLS.items()}
+
+
 class Geocoder:
     '''
     This is a very thin wrapper around the magnificent geocoder library (https://geocoder.readthedocs.io)
     It mainly handles HTTP sessions and errors. Throws EnvironmentError if either GOOGLE_API_KEY or GEONAMES_USERNAME
     is not present as an environment variable. Propagates geocoder's/requests' requests.exceptions.ConnectionError.  
+
+    Results are stored in (and read from) a GeocodeCache. Pass one that is shared across documents (and runs)
+    to avoid requesting the same place names over and over again.
+
+    The providers are queried concurrently, by a pool of 'workers' threads. The number of requests per provider
+    is limited by the RateLimiters in 'limiters' (see create_rate_limiters).
+
+    If a (offline) Gazetteer is provided, GeoNames coordinates are looked up in it instead of
+    requested from the GeoNames service (and GEONAMES_USERNAME is not required).
+
+    If a FuzzyIndex is provided, place names are corrected with it before they are looked up (see FuzzyIndex.correct),
+    so that historical, misspelled or OCR'd names (e.g. 'Amsteldam') are found.
+
+    The services can be replaced (e.g. by the local stand-ins of fake_services.py) by providing their URLs in 'urls',
+    by provider ('geonames', 'geonames_details', 'google' or 'osm'). The credentials of those are not required,
+    and their results are cached apart from those of the real services.
     '''
 
-    def __init__(self, named_entities, language):
-        if not "GEONAMES_USERNAME" in os.environ:
+    GEONAMES_FEATURE_CLASS = 'A'
+    PROVIDERS = ['geonames', 'google', 'osm']
+    # The credential sent to the services at 'urls', if it is not present as an environment variable
+    LOCAL_KEY = 'local'
+
+    def __init__(self, named_entities, language, cache=None, workers=3, limiters=None, gazetteer=None,
+                 fuzzy_index=None, urls=None):
+        self.urls = urls or {}
+        if gazetteer is None and not 'geonames' in self.urls and not "GEONAMES_USERNAME" in os.environ:
             raise EnvironmentError("GEONAMES_USERNAME is not present as an environment variable. Please export it")      
-        if not "GOOGLE_API_KEY" in os.environ:
+        if not 'google' in self.urls and not "GOOGLE_API_KEY" in os.environ:
             raise EnvironmentError("GOOGLE_API_KEY is not present as an environment variable. Please export it")
         
         self.named_entities = named_entities
         self.language = language
-        self.geonames_username = os.getenv('GEONAMES_USERNAME')
+        self.geonames_username = os.getenv('GEONAMES_USERNAME', self.LOCAL_KEY)
+        self.google_key = os.getenv('GOOGLE_API_KEY', self.LOCAL_KEY)
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.workers = workers
+        self.limiters = limiters if limiters is not None else create_rate_limiters()
+        self.gazetteer = gazetteer
+        self.fuzzy_index = fuzzy_index
+        self.local = threading.local()
+        self.sessions = []
+        self.sessions_lock = threading.Lock()
 
     def geocode_locations(self):
         '''
         Extract all entites tagged LOCATION and attempt to add lat, lng.
+        Each unique place name is looked up only once, the result is copied to all its mentions.
         As per geocoder documentation, use sessions when making severall 
-        requests to the same service.
+        requests to the same service (one per provider per thread).
+        '''
+        groups = self.group_locations()
+        # each lookup gets its own entity to write to, so that the results can be copied in a fixed order
+        spellings = {name: self.get_spelling(mentions[0]['ne']) for name, mentions in groups.items()}
+        lookups = OrderedDict(((name, provider), {'ne': spellings[name]})
+                              for name, mentions in groups.items() for provider in self.PROVIDERS)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self.set_geocode_from, provider, ent)
+                           for (name, provider), ent in lookups.items()]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            self.close_sessions()
+
+        for (name, provider), ent in lookups.items():
+            self.copy_geocodes(ent, groups[name])
+
+    def set_geocode_from(self, provider, named_entity):
+        if provider == 'geonames':
+            self.set_geocode_from_geonames(
+                self.get_session('geonames'), self.get_session('geonames_details'), named_entity)
+        elif provider == 'google':
+            self.set_geocode_from_google(self.get_session('google'), named_entity)
+        elif provider == 'osm':
+            self.set_geocode_from_osm(self.get_session('osm'), named_entity)
+
+    def get_session(self, name):
+        '''
+        Get the requests.Session for 'name' that belongs to the current thread.
+        '''
+        if not hasattr(self.local, 'sessions'):
+            self.local.sessions = {}
+
+        if not name in self.local.sessions:
+            session = requests.Session()
+            self.local.sessions[name] = session
+            with self.sessions_lock:
+                self.sessions.append(session)
+
+        return self.local.sessions[name]
+
+    def close_sessions(self):
+        with self.sessions_lock:
+            for session in self.sessions:
+                session.close()
+            self.sessions = []
+        self.local = threading.local()
+
+    def get_spelling(self, place_name):
+        '''
+        Get the spelling to look up a place name with, i.e. the place name corrected with the FuzzyIndex (if any).
+        '''
+        return self.fuzzy_index.correct(place_name) if self.fuzzy_index is not None else place_name
+
+    def group_locations(self):
         '''
-        with requests.Session() as google_session, requests.Session() as osm_session:
-            with requests.Session() as gn_session, requests.Session() as gn_detail_session:
-                for ent in self.named_entities:
-                    if (ent['type'] == 'LOCATION'):
-                        self.set_geocode_from_geonames(
-                            gn_session, gn_detail_session, ent)
-                        self.set_geocode_from_google(google_session, ent)
-                        self.set_geocode_from_osm(osm_session, ent)
+        Group the entities tagged LOCATION by their normalized name.
+        Returns an OrderedDict of normalized name -> list of entities.
+        '''
+        groups = OrderedDict()
+        for ent in self.named_entities:
+            if (ent['type'] == 'LOCATION'):
+                groups.setdefault(normalize_place_name(ent['ne']), []).append(ent)
+        return groups
 
-                        # TODO: keep track of names lat, lng was already collected for and reuse
+    def copy_geocodes(self, source, targets):
+        for provider in self.PROVIDERS:
+            for coordinate in ['lat', 'lng']:
+                key = '{}_{}'.format(provider, coordinate)
+                if key in source:
+                    for target in targets:
+                        target[key] = source[key]
 
     def set_geocode_from_geonames(self, session, details_session, named_entity):
-        g = geocoder.geonames(
-            named_entity['ne'], key=self.geonames_username, featureClass='A')
+        if self.gazetteer is not None:
+            self.set_geocode_from_gazetteer(named_entity)
+            return
 
-        if (g.ok):
-            g_details = geocoder.geonames(
-                g.geonames_id, method='details', key=self.geonames_username, session=details_session)
+        def lookup(place_name):
+            self.limiters['geonames'].acquire()
+            g = geocoder.geonames(
+                place_name, key=self.geonames_username, featureClass=self.GEONAMES_FEATURE_CLASS, session=session,
+                url=self.urls.get('geonames'))
 
-            if (g_details.ok):
-                named_entity['geonames_lat'] = g_details.lat
-                named_entity['geonames_lng'] = g_details.lng
-            else:
-                self.handle_error(g_details)
-        else:
-            self.handle_error(g)
+            if not g.ok:
+                return g
+            self.limiters['geonames'].acquire()
+            return geocoder.geonames(
+                g.geonames_id, method='details', key=self.geonames_username, session=details_session,
+                url=self.urls.get('geonames_details'))
+
+        self.set_geocode('geonames', named_entity, lookup, feature_class=self.GEONAMES_FEATURE_CLASS)
+
+    def set_geocode_from_gazetteer(self, named_entity):
+        entries = self.gazetteer.lookup(
+            named_entity['ne'], feature_class=self.GEONAMES_FEATURE_CLASS, limit=1)
+
+        if entries:
+            named_entity['geonames_lat'] = entries[0].lat
+            named_entity['geonames_lng'] = entries[0].lng
 
     def set_geocode_from_osm(self, session, named_entity):
-        place_name = named_entity['ne']
-        g = geocoder.osm(place_name, session=session)
+        def lookup(place_name):
+            self.limiters['osm'].acquire()
+            return geocoder.osm(place_name, session=session, url=self.urls.get('osm'))
 
-        if (g.ok):
-            named_entity['osm_lat'] = g.lat
-            named_entity['osm_lng'] = g.lng
-        else:
-            self.handle_error(g)
+        self.set_geocode('osm', named_entity, lookup)
 
     def set_geocode_from_google(self, session, named_entity):
+        def lookup(place_name):
+            self.limiters['google'].acquire()
+            return geocoder.google(place_name, key=self.google_key, session=session, method='places',
+                                   language=self.language, url=self.urls.get('google'))
+
+        self.set_geocode('google', named_entity, lookup, language=self.language)
+
+    def set_geocode(self, provider, named_entity, lookup, language=None, feature_class=None):
+        '''
+        Set '<provider>_lat' and '<provider>_lng' on the named entity, from the cache if possible.
+        Otherwise, call lookup (a function that takes a place name and returns a geocoder result)
+        and cache its outcome. Errors other than 'No results found' are printed and not cached.
+        '''
         place_name = named_entity['ne']
-        g = geocoder.google(place_name, session=session, method='places', language=self.language)
-        
-        if (g.ok):
-            named_entity['google_lat'] = g.lat
-            named_entity['google_lng'] = g.lng
+        # results of services at other URLs are cached under the URL as well
+        if provider in self.urls:
+            cache_provider = '{} {}'.format(provider, self.urls[provider])
         else:
-            self.handle_error(g)
+            cache_provider = provider
+        hit, coordinates = self.cache.get(cache_provider, place_name, language, feature_class)
+
+        if not hit:
+            g = lookup(place_name)
+
+            if g.ok:
+                coordinates = (g.lat, g.lng)
+                self.cache.set(cache_provider, place_name, coordinates, language, feature_class)
+            elif self.is_not_found(g):
+                self.cache.set(cache_provider, place_name, None, language, feature_class)
+            else:
+                self.handle_error(g)
+
+        if coordinates is not None:
+            named_entity['{}_lat'.format(provider)] = coordinates[0]
+            named_entity['{}_lng'.format(provider)] = coordinates[1]
+
+    def is_not_found(self, g):
+        return 'No results found' in g.status
 
     def handle_error(self, g):
-        if not 'No results found' in g.status:
+        if not self.is_not_found(g):
             print(g.status)
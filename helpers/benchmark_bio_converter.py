@@ -0,0 +1,115 @@
+import argparse
+import random
+import sys
+import timeit
+
+from bio_converter import convert_to_bio, translate_to_bio
+
+
+def convert_to_bio_previous(text, entities):
+    '''
+    The previous implementation of convert_to_bio (copied from bio_converter.py, without its commented out code),
+    which reconstructs offsets from text.split(), for comparison.
+    '''
+    text_index = 1
+    current_entity_index = 0
+
+    bio_tagged = []
+
+    for word in text.split():
+        if current_entity_index < len(entities) and is_part_of_entity(text_index, entities[current_entity_index]):
+            tag_entity(bio_tagged, entities[current_entity_index], word)
+
+            if (ends_entity(word, entities[current_entity_index])):
+                current_entity_index = current_entity_index + 1
+        else:
+            tag_non_entities(bio_tagged, word)
+
+        text_index = text_index + len(word) + 1
+
+    return bio_tagged
+
+
+def is_part_of_entity(text_index, entity):
+    return entity['pos'] <= text_index and text_index <= entity['pos'] + len(entity['ne'])
+
+def ends_entity(word, entity):
+    return entity['ne'].endswith(word)
+
+
+def tag_non_entities(bio_tagged, text):
+    for word in text.split(' '):
+        bio_tagged.append("{} O".format(word))
+
+
+def tag_entity(bio_tagged, entity, word):
+    tag = translate_to_bio(entity['type'])
+    bio_tagged.append("{} {}".format(word, tag))
+
+
+def create_document(token_count, entity_ratio, seed=0):
+    '''
+    Create a text with entities for (roughly) entity_ratio of its tokens, and the expected BIO tags.
+    Words are separated by single spaces, which the previous implementation requires.
+    '''
+    rng = random.Random(seed)
+    words = []
+    entities = []
+    expected = []
+    position = 0
+
+    for index in range(token_count):
+        word = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for i in range(rng.randint(1, 10)))
+        if rng.random() < entity_ratio:
+            word = word.capitalize()
+            entity_type = rng.choice(['LOCATION', 'PERSON', 'ORGANIZATION'])
+            entities.append({'ne': word, 'pos': position, 'type': entity_type})
+            expected.append("{} {}".format(word, translate_to_bio(entity_type)))
+        else:
+            expected.append("{} O".format(word))
+        words.append(word)
+        position += len(word) + 1
+
+    return ' '.join(words), entities, expected
+
+
+def parseArguments(sysArgs):
+    parser = argparse.ArgumentParser(
+        description='Compare the speed and the output of convert_to_bio with its previous implementation')
+
+    parser.add_argument(
+        '--tokens',
+        dest='tokens', default=1000000, type=int,
+        help="The number of tokens in the generated document. Defaults to 1000000.")
+
+    parser.add_argument(
+        '--entity_ratio',
+        dest='entity_ratio', default=0.05, type=float,
+        help="The fraction of tokens that are an entity. Defaults to 0.05.")
+
+    parser.add_argument(
+        '--repeat',
+        dest='repeat', default=3, type=int,
+        help="The number of times to run each implementation. Defaults to 3.")
+
+    return parser.parse_args()
+
+
+def main(sysArgs):
+    args = parseArguments(sysArgs)
+    text, entities, expected = create_document(args.tokens, args.entity_ratio)
+    implementations = [('current', convert_to_bio), ('previous', convert_to_bio_previous)]
+
+    # only compare the speed of implementations that give the same (expected) output
+    for name, function in implementations:
+        if function(text, entities) != expected:
+            print("The {} implementation does not give the expected output".format(name), file=sys.stderr)
+            return 1
+
+    for name, function in implementations:
+        seconds = min(timeit.repeat(lambda: function(text, entities), number=1, repeat=args.repeat))
+        print("{:>9}: {:.3f}s for {} tokens".format(name, seconds, len(expected)))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
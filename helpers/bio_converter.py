@@ -1,58 +1,94 @@
+import re
 
 
-def convert_to_bio(text, entities):
-    text_index = 1
-    current_entity_index = 0
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*$')
 
-    bio_tagged = []
 
-    for word in text.split():
-        if current_entity_index < len(entities) and is_part_of_entity(text_index, entities[current_entity_index]):
-            tag_entity(bio_tagged, entities[current_entity_index], word)
+def convert_to_bio(text, entities, scheme='io', sentence_breaks=False):
+    '''
+    Tag each (whitespace separated) token in text with the type of the entity it is part of,
+    or 'O' if it is not part of an entity. Returns a list of 'token TAG' strings.
+    See iter_bio for details, use that to avoid keeping all tokens in memory.
+    '''
+    return list(iter_bio(text, entities, scheme, sentence_breaks))
 
-            if (ends_entity(word, entities[current_entity_index])):
-                current_entity_index = current_entity_index + 1
-        else:
-            tag_non_entities(bio_tagged, word)
-
-        text_index = text_index + len(word) + 1
-
-    # prev_entity_end = 0
 
-    # for entity in entities:
-    #     index = entity['pos']
-    #     entity_to_end = len(text) - index + 1
+def iter_bio(text, entities, scheme='io', sentence_breaks=False):
+    '''
+    Generate a 'token TAG' string for each (whitespace separated) token in text, where TAG is the type
+    of the entity the token is part of, or 'O' if it is not part of an entity.
 
-    #     text_in_between_entities = text[prev_entity_end:-entity_to_end]
-    #     prev_entity_end = index + len(entity['ne'])
+    A token is part of an entity if their character offsets overlap ('pos' is the offset of an entity in text).
+    Entities are handled in order of position, in a single sweep over the text: the text between two entities
+    is tokenized in blocks, the boundaries of an entity are extended to the tokens it overlaps.
 
-    #     tag_non_entities(bio_tagged, text_in_between_entities)
-    #     tag_entity(bio_tagged, entity)
+    Keyword arguments:
+        scheme -- 'io' to tag all tokens of an entity with its type (e.g. 'LOC'),
+            'bio2' to prefix the first token of an entity with 'B-' and the rest with 'I-'. Defaults to 'io'.
+        sentence_breaks -- Generate an empty string after each token that ends a sentence (as in CoNLL files).
+            Defaults to False.
+    '''
+    if scheme not in ['io', 'bio2']:
+        raise ValueError("Unknown scheme '{}'".format(scheme))
 
-    # text_after_last_entity = text[prev_entity_end:]
+    spans = sorted(((entity['pos'], entity['pos'] + len(entity['ne']), entity) for entity in entities),
+                   key=lambda span: span[:2])
+    length = len(text)
+    position = 0
 
-    # print(len(bio_tagged))
+    for entity_start, entity_end, entity in spans:
+        # skip entities that end before the current position (i.e. overlap with the previous one)
+        if entity_end <= position:
+            continue
 
-    # tag_non_entities(bio_tagged, text_after_last_entity)
+        start = max(entity_start, position)
+        if start < length and not text[start].isspace():
+            while start > position and not text[start - 1].isspace():
+                start = start - 1
 
-    return bio_tagged
+        end = min(entity_end, length)
+        if end > start and not text[end - 1].isspace():
+            while end < length and not text[end].isspace():
+                end = end + 1
 
+        yield from tag_non_entities(text, position, start, sentence_breaks)
+        yield from tag_entity(entity, text[start:end], scheme, sentence_breaks)
+        position = max(end, start)
 
-def is_part_of_entity(text_index, entity):
-    return entity['pos'] <= text_index and text_index <= entity['pos'] + len(entity['ne'])
+    yield from tag_non_entities(text, position, length, sentence_breaks)
 
-def ends_entity(word, entity):
-    return entity['ne'].endswith(word)
 
+def tag_non_entities(text, start, end, sentence_breaks):
+    for word in iter_words(text, start, end):
+        yield word + ' O'
+        if sentence_breaks and SENTENCE_END.search(word):
+            yield ''
 
-def tag_non_entities(bio_tagged, text):
-    for word in text.split(' '):
-        bio_tagged.append("{} O".format(word))
 
-
-def tag_entity(bio_tagged, entity, word):
+def tag_entity(entity, text, scheme, sentence_breaks):
     tag = translate_to_bio(entity['type'])
-    bio_tagged.append("{} {}".format(word, tag))
+    words = text.split()
+
+    for index, word in enumerate(words):
+        if scheme == 'bio2':
+            yield "{} {}-{}".format(word, 'B' if index == 0 else 'I', tag)
+        else:
+            yield "{} {}".format(word, tag)
+
+    if sentence_breaks and words and SENTENCE_END.search(words[-1]):
+        yield ''
+
+
+def iter_words(text, start, end, block_size=65536):
+    '''
+    Generate the (whitespace separated) words in text[start:end], splitting blocks of about block_size characters at a time.
+    '''
+    while start < end:
+        stop = min(end, start + block_size)
+        while stop < end and not text[stop].isspace():
+            stop = stop + 1
+        yield from text[start:stop].split()
+        start = stop
 
 
 def translate_to_bio(entity_type):
@@ -0,0 +1,106 @@
+import copy
+import re
+
+
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+WHITESPACE = re.compile(r'\s+')
+
+
+def split_into_chunks(text, max_length):
+    '''
+    Split text into chunks of at most max_length characters, preferably after the end of a sentence,
+    otherwise at whitespace (or, if a chunk contains neither, at max_length).
+    Returns a list of (offset, chunk) tuples. Together, the chunks contain the complete text.
+    '''
+    chunks = []
+    start = 0
+
+    while len(text) - start > max_length:
+        end = find_split(text, start, start + max_length)
+        chunks.append((start, text[start:end]))
+        start = end
+
+    if start < len(text) or not chunks:
+        chunks.append((start, text[start:]))
+    return chunks
+
+
+def find_split(text, start, end):
+    '''
+    Find the position to split text[start:end] at, i.e. after the last sentence end or whitespace.
+    '''
+    for pattern in [SENTENCE_END, WHITESPACE]:
+        split = None
+        for match in pattern.finditer(text, start, end):
+            split = match.end()
+        if split is not None and split > start:
+            return split
+    return end
+
+
+def merge_responses(text, chunks, responses, context_length):
+    '''
+    Merge the multiNER responses for the chunks of a text into a response for the complete text.
+    The positions of entities are made relative to the complete text, the context of entities close to
+    the boundaries of a chunk is collected from the complete text, and the counts of entities are summed.
+
+    Keyword arguments:
+        text -- The complete text.
+        chunks -- The (offset, chunk) tuples (see split_into_chunks).
+        responses -- The multiNER response for each chunk.
+        context_length -- The number of words in the left and right context of an entity.
+    '''
+    merged = copy.deepcopy(responses[0])
+    entities = []
+    counts = {}
+
+    for index, ((offset, chunk), response) in enumerate(zip(chunks, responses)):
+        chunk_counts = {}
+
+        for entity in response['text']['entities']:
+            entity = dict(entity)
+            start = entity['pos']
+            end = start + len(entity['ne'])
+
+            # the context of entities close to the chunk boundaries is incomplete
+            if offset > 0 and len(get_left_context(chunk, start, context_length).split()) < context_length:
+                entity['left_context'] = get_left_context(text, offset + start, context_length)
+            if index < len(chunks) - 1 and len(get_right_context(chunk, end, context_length).split()) < context_length:
+                entity['right_context'] = get_right_context(text, offset + end, context_length)
+
+            entity['pos'] = offset + start
+            if 'count' in entity:
+                chunk_counts.setdefault(entity['ne'], entity['count'])
+            entities.append(entity)
+
+        for ne, count in chunk_counts.items():
+            counts[ne] = counts.get(ne, 0) + count
+
+    for entity in entities:
+        if 'count' in entity:
+            entity['count'] = counts[entity['ne']]
+
+    merged['text']['entities'] = entities
+    return merged
+
+
+def get_left_context(text, position, context_length):
+    window = 100
+    while True:
+        start = max(0, position - window)
+        words = text[start:position].split()
+        # the first word in the window might be incomplete
+        if start == 0 or len(words) > context_length:
+            return ' '.join(words[-context_length:]) if context_length else ''
+        window *= 2
+
+
+def get_right_context(text, position, context_length):
+    window = 100
+    while True:
+        end = min(len(text), position + window)
+        words = text[position:end].split()
+        # the last word in the window might be incomplete
+        if end == len(text) or len(words) > context_length:
+            return ' '.join(words[:context_length])
+        window *= 2
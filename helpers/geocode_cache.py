@@ -0,0 +1,87 @@
+import sqlite3
+import threading
+import time
+
+
+def normalize_place_name(name):
+    '''
+    Normalize a place name for use as a cache key, i.e. collapse whitespace and ignore case.
+    '''
+    return ' '.join(name.split()).casefold()
+
+
+class GeocodeCache:
+    '''
+    Persistent cache for geocoder results, stored in a SQLite database so that it can be shared across runs.
+    Results are keyed on provider, normalized place name, language and (GeoNames) feature class.
+    'No results found' is cached as well (as a negative result), so unknown names are not requested again.
+
+    Keyword arguments:
+        path -- The SQLite file to store the cache in. Defaults to ':memory:', i.e. a cache that lives as long as the run.
+        ttl -- The number of seconds a result stays valid. Defaults to 'None', i.e. results never expire.
+
+    The cache can be used from several threads.
+    '''
+
+    def __init__(self, path=':memory:', ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS geocodes (
+                provider TEXT NOT NULL,
+                name TEXT NOT NULL,
+                language TEXT NOT NULL,
+                feature_class TEXT NOT NULL,
+                lat REAL,
+                lng REAL,
+                created REAL NOT NULL,
+                PRIMARY KEY (provider, name, language, feature_class)
+            )''')
+        self.connection.commit()
+
+    def get(self, provider, name, language=None, feature_class=None):
+        '''
+        Look up a place name. Returns a tuple '(hit, coordinates)', where coordinates is a '(lat, lng)' tuple,
+        or 'None' if the provider did not find the place (or if it is not in the cache, i.e. hit is False).
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT lat, lng, created FROM geocodes WHERE provider=? AND name=? AND language=? AND feature_class=?',
+                self.get_key(provider, name, language, feature_class)).fetchone()
+
+            if row is None or self.is_expired(row[2]):
+                self.misses += 1
+                return False, None
+
+            self.hits += 1
+
+        if row[0] is None:
+            return True, None
+        return True, (row[0], row[1])
+
+    def set(self, provider, name, coordinates, language=None, feature_class=None):
+        '''
+        Store the coordinates ('(lat, lng)') found for a place name. Pass 'None' to store a negative result.
+        '''
+        lat, lng = coordinates if coordinates is not None else (None, None)
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                self.get_key(provider, name, language, feature_class) + (lat, lng, time.time()))
+            self.connection.commit()
+
+    def get_key(self, provider, name, language, feature_class):
+        return (provider, normalize_place_name(name), language or '', feature_class or '')
+
+    def is_expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get_stats(self):
+        return "geocode cache: {} hits, {} misses".format(self.hits, self.misses)
+
+    def close(self):
+        self.connection.close()
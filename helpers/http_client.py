@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(Exception):
+    '''
+    Raised instead of making a request while the circuit breaker is open, i.e. after too many consecutive failures.
+    '''
+    pass
+
+
+class HttpClient:
+    '''
+    A thin wrapper around a (pooled) requests.Session that adds timeouts, retries with
+    exponential backoff on connection errors, 429 and 5xx responses, a circuit breaker,
+    and latency metrics. It can be shared between threads.
+
+    Keyword arguments:
+        timeout -- The timeout per request in seconds (or a (connect, read) tuple).
+        retries -- The number of times a failed request is retried.
+        backoff -- The number of seconds to wait before the first retry. Doubles with every retry.
+        max_backoff -- The maximum number of seconds to wait before a retry, also if the service asks
+                       for a longer wait (with a Retry-After header).
+        pool_size -- The number of connections kept open per host.
+        failure_threshold -- The number of consecutive failed requests (after retries) that opens the circuit.
+        reset_after -- The number of seconds the circuit stays open before a request is tried again.
+
+    The latency metrics are kept as a running count, total and maximum, and the median of a uniform sample
+    of at most LATENCY_SAMPLES latencies (a reservoir), so that they take constant memory on long runs.
+    '''
+
+    LATENCY_SAMPLES = 1024
+
+    def __init__(self, timeout=300, retries=3, backoff=1.0, pool_size=10, failure_threshold=5, reset_after=60,
+                 max_backoff=60, sleep=time.sleep, clock=time.monotonic):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.sleep = sleep
+        self.clock = clock
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.request_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.latencies = []
+        self.random = random.Random(0)
+
+    def request(self, method, url, **kwargs):
+        '''
+        Make a request, retrying if needed. Returns the (last) response, which can still have
+        a 429 or 5xx status code if all retries failed. Raises CircuitOpenError if the circuit is open,
+        and propagates requests' exceptions if the last attempt failed to connect or timed out.
+        '''
+        self.check_circuit()
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.retries + 1):
+            is_last = attempt == self.retries
+            start = self.clock()
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.record_latency(start)
+                if is_last:
+                    self.record_failure()
+                    raise
+                self.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+                continue
+
+            self.record_latency(start)
+            if not self.should_retry(response):
+                self.record_success()
+                return response
+            if is_last:
+                self.record_failure()
+                return response
+            self.sleep(min(self.get_retry_after(response) or self.backoff * 2 ** attempt, self.max_backoff))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def should_retry(self, response):
+        return response.status_code == 429 or 500 <= response.status_code < 600
+
+    def get_retry_after(self, response):
+        try:
+            retry_after = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+        return retry_after if retry_after >= 0 else None
+
+    def check_circuit(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.clock() - self.opened_at < self.reset_after:
+                raise CircuitOpenError(
+                    "Not making requests for {} seconds after {} consecutive failures".format(
+                        self.reset_after, self.consecutive_failures))
+            # half open: let this request through, a failure will open the circuit again
+            self.opened_at = None
+            self.consecutive_failures = self.failure_threshold - 1
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+    def record_latency(self, start):
+        latency = self.clock() - start
+        with self.lock:
+            self.request_count += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            # each of the latencies so far is in the sample with the same probability
+            if len(self.latencies) < self.LATENCY_SAMPLES:
+                self.latencies.append(latency)
+            else:
+                index = self.random.randrange(self.request_count)
+                if index < self.LATENCY_SAMPLES:
+                    self.latencies[index] = latency
+
+    def get_stats(self):
+        with self.lock:
+            count, total, maximum = self.request_count, self.total_latency, self.max_latency
+            latencies = sorted(self.latencies)
+
+        if not count:
+            return "0 requests"
+        return "{} requests, latency mean {:.3f}s, median {:.3f}s, max {:.3f}s".format(
+            count, total / count, latencies[len(latencies) // 2], maximum)
+
+    def close(self):
+        self.session.close()
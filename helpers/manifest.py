@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+
+class Manifest:
+    '''
+    Keeps track (in a SQLite database) of the input files that were processed, and which stages
+    of the processing were completed for each of them. A file is identified by its path, and
+    considered changed if its content hash differs from the one recorded (size and mtime are
+    recorded as well, so unchanged files do not need to be hashed again).
+
+    Files are tracked per 'settings' (a dict of the settings that affect the output of a run, e.g. the output folder
+    and language), so that a run with other settings processes them again. The entities found in a file are stored
+    along with the stage that produced them, so that a run can resume from the last completed stage.
+
+    The manifest can be used from several threads.
+    '''
+
+    STAGES = ['ner', 'geocode', 'json', 'html', 'bio']
+
+    def __init__(self, path, settings=None):
+        self.path = path
+        self.settings = get_settings_hash(settings or {})
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                hash TEXT NOT NULL,
+                entities TEXT,
+                {},
+                PRIMARY KEY (path, settings)
+            )'''.format(', '.join('{} INTEGER NOT NULL DEFAULT 0'.format(stage) for stage in self.STAGES)))
+        self.connection.commit()
+
+    def start(self, path):
+        '''
+        Start processing a file. Returns the set of stages that were already completed for it,
+        which is empty if the file is new or has changed since it was recorded.
+        '''
+        stat = os.stat(path)
+        key = (os.path.abspath(path), self.settings)
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT size, mtime, hash, {} FROM files WHERE path=? AND settings=?'.format(', '.join(self.STAGES)),
+                key).fetchone()
+
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return self.get_completed(row[3:])
+
+        content_hash = get_hash(path)
+
+        with self.lock:
+            if row is not None and row[2] == content_hash:
+                self.connection.execute(
+                    'UPDATE files SET size=?, mtime=? WHERE path=? AND settings=?', (stat.st_size, stat.st_mtime) + key)
+                self.connection.commit()
+                return self.get_completed(row[3:])
+
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files (path, settings, size, mtime, hash) VALUES (?, ?, ?, ?, ?)',
+                key + (stat.st_size, stat.st_mtime, content_hash))
+            self.connection.commit()
+            return set()
+
+    def mark_done(self, path, stage, entities=None):
+        '''
+        Mark a stage as completed for a file. Pass the entities the stage produced (if any) to store them.
+        '''
+        if stage not in self.STAGES:
+            raise ValueError("Unknown stage '{}'".format(stage))
+
+        with self.lock:
+            if entities is not None:
+                self.connection.execute(
+                    'UPDATE files SET {}=1, entities=? WHERE path=? AND settings=?'.format(stage),
+                    (json.dumps(entities), os.path.abspath(path), self.settings))
+            else:
+                self.connection.execute(
+                    'UPDATE files SET {}=1 WHERE path=? AND settings=?'.format(stage),
+                    (os.path.abspath(path), self.settings))
+            self.connection.commit()
+
+    def get_entities(self, path):
+        '''
+        Get the entities stored for a file by the last stage that produced them, or 'None'.
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT entities FROM files WHERE path=? AND settings=?',
+                (os.path.abspath(path), self.settings)).fetchone()
+        return json.loads(row[0]) if row is not None and row[0] is not None else None
+
+    def get_completed(self, statuses):
+        return set(stage for stage, done in zip(self.STAGES, statuses) if done)
+
+    def close(self):
+        self.connection.close()
+
+
+def get_settings_hash(settings):
+    # sets (e.g. of feature classes) are stored in order
+    content = json.dumps(settings, sort_keys=True, default=sorted)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
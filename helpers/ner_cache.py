@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class NerCache:
+    '''
+    A content addressed cache of multiNER responses, stored as json files in a folder.
+    Responses are keyed on a hash of the text and the configuration sent to the service, and the URL of
+    the service if it is not the multiNER service (e.g. a stand-in, see fake_services.py).
+    If the folder grows larger than max_size bytes, the least recently used responses are removed.
+    The cache can be used from several threads.
+    '''
+
+    # The age (in seconds) from which a temporary file is left over from an interrupted write, and removed
+    STALE_TEMP_AGE = 3600
+
+    def __init__(self, folder, max_size=None):
+        self.folder = folder
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(folder, exist_ok=True)
+        self.remove_stale_temp_files()
+        self.size = sum(os.path.getsize(path) for path in self.get_paths())
+
+    def get_key(self, text, configuration, url=None):
+        content = {'text': text, 'configuration': configuration}
+        if url is not None:
+            content['url'] = url
+        content = json.dumps(content, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        '''
+        Get the response stored under key, or 'None' if it is not in the cache.
+        '''
+        path = self.get_path(key)
+
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                response = json.load(fh)
+            # mark as recently used
+            os.utime(path, None)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return response
+
+    def set(self, key, response):
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first, so that readers never see a partial response
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            json.dump(response, fh)
+
+        with self.lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(temp_path, path)
+            self.size += os.path.getsize(path)
+
+            if self.max_size is not None and self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used responses until the cache is at 90% of max_size.
+        '''
+        paths = sorted(self.get_paths(), key=os.path.getmtime)
+
+        for path in paths:
+            if self.size <= self.max_size * 0.9:
+                break
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.size -= size
+
+    def get_path(self, key):
+        return os.path.join(self.folder, key[:2], '{}.json'.format(key))
+
+    def get_paths(self, extension='.json'):
+        for folder, subs, files in os.walk(self.folder):
+            for filename in files:
+                if filename.endswith(extension):
+                    yield os.path.join(folder, filename)
+
+    def remove_stale_temp_files(self):
+        '''
+        Remove the temporary files of writes that were interrupted (e.g. by killing a run). Recent ones
+        can belong to another run that is writing to the cache.
+        '''
+        for path in self.get_paths('.tmp'):
+            try:
+                if time.time() - os.path.getmtime(path) > self.STALE_TEMP_AGE:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def get_stats(self):
+        return "NER cache: {} hits, {} misses".format(self.hits, self.misses)
@@ -0,0 +1,72 @@
+import queue
+import threading
+
+
+STOP = object()
+
+
+class Pipeline:
+    '''
+    Runs items through a sequence of stages. Each stage has its own pool of threads,
+    and the stages are connected by bounded queues, so that (for example) network-bound
+    and disk-bound stages overlap without reading all input into memory.
+
+    Keyword arguments:
+        stages -- A list of (function, workers) tuples. Each function takes an item and returns
+            the item for the next stage (or 'None' to drop it).
+        queue_size -- The maximum number of items waiting for a stage. Defaults to twice its number of workers.
+
+    If a stage raises (including SystemExit), no new items are started and
+    the first exception is re-raised by run() once all threads have finished.
+    '''
+
+    def __init__(self, stages, queue_size=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.error = None
+        self.error_lock = threading.Lock()
+
+    def run(self, items):
+        queues = [queue.Queue(self.queue_size or 2 * workers) for function, workers in self.stages]
+        pools = []
+
+        for index, (function, workers) in enumerate(self.stages):
+            next_queue = queues[index + 1] if index + 1 < len(queues) else None
+            pool = [threading.Thread(target=self.work, args=(function, queues[index], next_queue), daemon=True)
+                    for i in range(workers)]
+            for thread in pool:
+                thread.start()
+            pools.append(pool)
+
+        for item in items:
+            if self.error is not None:
+                break
+            queues[0].put(item)
+
+        for index, pool in enumerate(pools):
+            for thread in pool:
+                queues[index].put(STOP)
+            for thread in pool:
+                thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def work(self, function, input_queue, output_queue):
+        while True:
+            item = input_queue.get()
+            if item is STOP:
+                return
+            if self.error is not None:
+                continue
+
+            try:
+                result = function(item)
+            except BaseException as e:
+                with self.error_lock:
+                    if self.error is None:
+                        self.error = e
+                continue
+
+            if output_queue is not None and result is not None:
+                output_queue.put(result)
@@ -0,0 +1,38 @@
+import threading
+import time
+
+
+class RateLimiter:
+    '''
+    A (thread safe) token bucket. Allows on average 'rate' requests per second,
+    with bursts of at most 'burst' requests. Call acquire() before each request,
+    it blocks until the request is allowed.
+
+    Keyword arguments:
+        rate -- The number of requests per second.
+        burst -- The maximum number of requests that can be made at once. Defaults to 1.
+    '''
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.last_refill = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
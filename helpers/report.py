@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import threading
+
+
+ASSETS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'report')
+ASSETS = ['report.css', 'report.js', 'index.html']
+INDEX_FILE = 'index.js'
+
+
+def copy_assets(folder):
+    '''
+    Copy the files shared by all pages of the report (styling, scripts and the index page) to folder.
+    '''
+    for asset in ASSETS:
+        shutil.copyfile(os.path.join(ASSETS_FOLDER, asset), os.path.join(folder, asset))
+
+
+def write_data_file(folder, filename, text, entities):
+    '''
+    Write the text and entities of a document as a script that passes them to pndDocument (see report.js).
+    '''
+    with open(os.path.join(folder, filename), 'w', encoding='utf-8') as fh:
+        fh.write('pndDocument(')
+        json.dump({'text': text, 'entities': entities}, fh, separators=(',', ':'))
+        fh.write(');\n')
+
+
+class ReportIndex:
+    '''
+    The list of documents in a report, written as a script that passes it to pndIndex (see report.js).
+    Documents listed by an existing index in the folder (i.e. from earlier runs) are kept.
+    Documents can be added from several threads.
+    '''
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.documents = {}
+        self.lock = threading.Lock()
+
+        path = os.path.join(folder, INDEX_FILE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as fh:
+                content = fh.read().strip()
+            for document in json.loads(content[len('pndIndex('):-len(');')]):
+                self.documents[document['html']] = document
+
+    def add(self, name, html_name, entities):
+        with self.lock:
+            self.documents[html_name] = {
+                'name': name,
+                'html': html_name,
+                'entities': len(entities),
+                'locations': len([entity for entity in entities if entity['type'] == 'LOCATION'])
+            }
+
+    def write(self):
+        with self.lock:
+            documents = sorted(self.documents.values(), key=lambda document: document['name'])
+
+        with open(os.path.join(self.folder, INDEX_FILE), 'w', encoding='utf-8') as fh:
+            fh.write('pndIndex(')
+            json.dump(documents, fh, separators=(',', ':'))
+            fh.write(');\n')
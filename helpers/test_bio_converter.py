@@ -1,6 +1,8 @@
 import os
 import json
-from bio_converter import convert_to_bio
+import random
+import re
+from bio_converter import convert_to_bio, iter_bio, iter_words
 
 
 def test_convert_to_bio_one_entity():
@@ -169,3 +171,95 @@ def test_convert_to_bio_real_example(tmpdir):
         expected = fh.readlines()
 
     assert actual == expected
+
+
+def test_convert_to_bio_irregular_whitespace():
+    text = "In  the\tcity of\n\nNew   York ,   near Utrecht"
+
+    entities = [
+        {"type": "LOCATION", "pos": 37, "ne": "Utrecht"},
+        {"type": "LOCATION", "pos": 17, "ne": "New   York"}
+    ]
+
+    bio = convert_to_bio(text, entities)
+    expected = ['In O', 'the O', 'city O', 'of O', 'New LOC', 'York LOC', ', O', 'near O', 'Utrecht LOC']
+    assert bio == expected
+
+
+def test_convert_to_bio_repeated_word_ends_entity():
+    text = "Den Bosch Bosch is nice"
+
+    entities = [{"type": "LOCATION", "pos": 0, "ne": "Den Bosch"}]
+
+    bio = convert_to_bio(text, entities)
+    assert bio == ['Den LOC', 'Bosch LOC', 'Bosch O', 'is O', 'nice O']
+
+
+def test_convert_to_bio_bio2():
+    text = "Alta Austria Wien and Jan"
+
+    entities = [
+        {"type": "LOCATION", "pos": 0, "ne": "Alta Austria"},
+        {"type": "LOCATION", "pos": 13, "ne": "Wien"},
+        {"type": "PERSON", "pos": 22, "ne": "Jan"},
+    ]
+
+    bio = convert_to_bio(text, entities, scheme='bio2')
+    assert bio == ['Alta B-LOC', 'Austria I-LOC', 'Wien B-LOC', 'and O', 'Jan B-PER']
+
+
+def test_convert_to_bio_duplicate_entities():
+    text = "to Utrecht"
+
+    entities = [
+        {"type": "LOCATION", "pos": 3, "ne": "Utrecht"},
+        {"type": "LOCATION", "pos": 3, "ne": "Utrecht"},
+    ]
+
+    assert convert_to_bio(text, entities) == ['to O', 'Utrecht LOC']
+
+
+def test_convert_to_bio_matches_token_overlap():
+    '''
+    Compare with a straightforward implementation: a token is part of the first entity it overlaps with.
+    '''
+    rng = random.Random(1)
+    for i in range(50):
+        text = ''.join(rng.choice('ab  \n\t') for j in range(200))
+        entities = []
+        for j in range(10):
+            pos = rng.randint(0, 190)
+            entities.append({'type': 'LOCATION', 'pos': pos, 'ne': text[pos:pos + rng.randint(1, 12)]})
+
+        expected = []
+        for match in re.finditer(r'\S+', text):
+            overlapping = [e for e in sorted(entities, key=lambda e: e['pos'])
+                           if e['pos'] < match.end() and match.start() < e['pos'] + len(e['ne'])]
+            expected.append("{} {}".format(match.group(), 'LOC' if overlapping else 'O'))
+
+        assert convert_to_bio(text, entities) == expected
+
+
+def test_iter_bio_is_lazy():
+    bio = iter_bio("one two three", [])
+    assert next(bio) == 'one O'
+    assert list(bio) == ['two O', 'three O']
+
+
+def test_iter_bio_sentence_breaks():
+    text = "He went to St. Louis. Then \"to Utrecht!\" And more"
+
+    entities = [
+        {"type": "LOCATION", "pos": 11, "ne": "St. Louis"},
+        {"type": "LOCATION", "pos": 31, "ne": "Utrecht"},
+    ]
+
+    bio = list(iter_bio(text, entities, sentence_breaks=True))
+    assert bio == ['He O', 'went O', 'to O', 'St. LOC', 'Louis. LOC', '', 'Then O',
+                   '"to O', 'Utrecht!" LOC', '', 'And O', 'more O']
+
+
+def test_iter_words_blocks():
+    text = "  a bb  ccc\tdddd eeeee "
+    assert list(iter_words(text, 0, len(text), block_size=3)) == text.split()
+    assert list(iter_words(text, 3, 10, block_size=2)) == ['bb', 'cc']
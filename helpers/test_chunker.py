@@ -0,0 +1,66 @@
+from chunker import split_into_chunks, merge_responses
+
+
+def test_split_short_text():
+    assert split_into_chunks("One sentence.", 100) == [(0, "One sentence.")]
+    assert split_into_chunks("", 100) == [(0, "")]
+
+
+def test_split_after_sentence():
+    text = "First sentence here. Second one. Third sentence is longer."
+    chunks = split_into_chunks(text, 35)
+    assert chunks == [(0, "First sentence here. Second one. "), (33, "Third sentence is longer.")]
+
+
+def test_split_at_whitespace_without_sentence_end():
+    text = "no sentence ends in this text at all"
+    chunks = split_into_chunks(text, 10)
+    assert ''.join(chunk for offset, chunk in chunks) == text
+    assert all(len(chunk) <= 10 for offset, chunk in chunks)
+    assert all(text[offset:offset + len(chunk)] == chunk for offset, chunk in chunks)
+    assert chunks[0] == (0, "no ")
+
+
+def test_split_long_word():
+    chunks = split_into_chunks("abcdefghij", 4)
+    assert chunks == [(0, "abcd"), (4, "efgh"), (8, "ij")]
+
+
+def entity(ne, pos, left_context='', right_context='', count=1):
+    return {'ne': ne, 'pos': pos, 'type': 'LOCATION', 'count': count,
+            'left_context': left_context, 'right_context': right_context}
+
+
+def test_merge_responses():
+    text = "Utrecht is nice. I went from Utrecht to Madrid. Madrid is far."
+    chunks = [(0, "Utrecht is nice. I went from "), (29, "Utrecht to Madrid. Madrid is far.")]
+    responses = [
+        {'text': {'title': 'test', 'entities': [entity('Utrecht', 0, '', 'is nice. I')]}},
+        {'text': {'title': 'test', 'entities': [
+            entity('Utrecht', 0, '', 'to Madrid. Madrid', 1),
+            entity('Madrid', 11, 'Utrecht to', 'Madrid is far.', 2),
+            entity('Madrid', 19, 'to Madrid.', 'is far.', 2)]}}]
+
+    merged = merge_responses(text, chunks, responses, 3)
+    entities = merged['text']['entities']
+
+    assert merged['text']['title'] == 'test'
+    assert [e['pos'] for e in entities] == [0, 29, 40, 48]
+    assert all(text[e['pos']:e['pos'] + len(e['ne'])] == e['ne'] for e in entities)
+    assert entities[1]['left_context'] == 'I went from'
+    assert entities[2]['left_context'] == 'from Utrecht to'
+    assert entities[3]['left_context'] == 'to Madrid.'
+    assert entities[0]['right_context'] == 'is nice. I'
+    assert [e['count'] for e in entities] == [2, 2, 2, 2]
+    assert responses[0]['text']['entities'][0]['pos'] == 0
+
+
+def test_merge_repairs_right_context():
+    text = "Far away in Utrecht the sun shines."
+    chunks = [(0, "Far away in Utrecht "), (20, "the sun shines.")]
+    responses = [
+        {'text': {'entities': [entity('Utrecht', 12, 'Far away in', '')]}},
+        {'text': {'entities': []}}]
+
+    merged = merge_responses(text, chunks, responses, 3)
+    assert merged['text']['entities'][0]['right_context'] == 'the sun shines.'
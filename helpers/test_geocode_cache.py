@@ -0,0 +1,52 @@
+import time
+from geocode_cache import GeocodeCache, normalize_place_name
+
+
+def test_normalize_place_name():
+    assert normalize_place_name('  New   York ') == 'new york'
+
+
+def test_get_miss():
+    cache = GeocodeCache()
+    assert cache.get('osm', 'Utrecht') == (False, None)
+    assert cache.misses == 1
+    assert cache.hits == 0
+
+
+def test_set_and_get():
+    cache = GeocodeCache()
+    cache.set('osm', 'Utrecht', (52.09, 5.12))
+    assert cache.get('osm', 'utrecht ') == (True, (52.09, 5.12))
+    assert cache.hits == 1
+
+
+def test_negative_result():
+    cache = GeocodeCache()
+    cache.set('osm', 'Nowhere', None)
+    assert cache.get('osm', 'Nowhere') == (True, None)
+
+
+def test_key_includes_provider_language_and_feature_class():
+    cache = GeocodeCache()
+    cache.set('google', 'Utrecht', (52.09, 5.12), language='nl')
+    cache.set('geonames', 'Utrecht', (52.0, 5.0), feature_class='A')
+    assert cache.get('google', 'Utrecht', language='en') == (False, None)
+    assert cache.get('osm', 'Utrecht', language='nl') == (False, None)
+    assert cache.get('geonames', 'Utrecht') == (False, None)
+    assert cache.get('geonames', 'Utrecht', feature_class='A') == (True, (52.0, 5.0))
+
+
+def test_expired():
+    cache = GeocodeCache(ttl=10)
+    cache.set('osm', 'Utrecht', (52.09, 5.12))
+    cache.connection.execute('UPDATE geocodes SET created=?', (time.time() - 20,))
+    assert cache.get('osm', 'Utrecht') == (False, None)
+
+
+def test_persists_across_instances(tmpdir):
+    path = str(tmpdir.join('geocodes.sqlite'))
+    cache = GeocodeCache(path)
+    cache.set('osm', 'Utrecht', (52.09, 5.12))
+    cache.close()
+
+    assert GeocodeCache(path).get('osm', 'Utrecht') == (True, (52.09, 5.12))
@@ -0,0 +1,143 @@
+import pytest
+import requests
+from http_client import HttpClient, CircuitOpenError
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    '''
+    Returns (or raises) the given outcomes in order.
+    '''
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, FakeResponse):
+            return outcome
+        return FakeResponse(outcome)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def create_client(outcomes, **kwargs):
+    clock = FakeClock()
+    client = HttpClient(sleep=clock.sleep, clock=clock, **kwargs)
+    client.session = FakeSession(outcomes)
+    return client, clock
+
+
+def test_success():
+    client, clock = create_client([200], timeout=5)
+    assert client.get('http://ner').status_code == 200
+    assert client.session.calls[0][2]['timeout'] == 5
+    assert clock.sleeps == []
+
+
+def test_retry_with_backoff():
+    client, clock = create_client([503, 500, 200], retries=3, backoff=1)
+    assert client.get('http://ner').status_code == 200
+    assert clock.sleeps == [1, 2]
+
+
+def test_retry_after_header():
+    client, clock = create_client([FakeResponse(429, {'Retry-After': '7'}), 200])
+    assert client.get('http://ner').status_code == 200
+    assert clock.sleeps == [7.0]
+
+
+def test_retry_after_header_is_limited():
+    client, clock = create_client([FakeResponse(503, {'Retry-After': '86400'}), 500, 200], max_backoff=10, backoff=8)
+    assert client.get('http://ner').status_code == 200
+    assert clock.sleeps == [10, 10]
+
+    client, clock = create_client([FakeResponse(503, {'Retry-After': '-5'}), 200], backoff=1)
+    assert client.get('http://ner').status_code == 200
+    assert clock.sleeps == [1]
+
+
+def test_no_retry_on_client_error():
+    client, clock = create_client([404])
+    assert client.get('http://ner').status_code == 404
+    assert len(client.session.calls) == 1
+
+
+def test_retries_exhausted():
+    client, clock = create_client([500, 500], retries=1)
+    assert client.get('http://ner').status_code == 500
+
+
+def test_connection_error_is_retried_and_raised():
+    error = requests.exceptions.ConnectionError('down')
+    client, clock = create_client([error, error], retries=1)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('http://ner')
+    assert len(client.session.calls) == 2
+
+
+def test_circuit_breaker():
+    client, clock = create_client([500, 500, 200, 500], retries=0, failure_threshold=2, reset_after=60)
+    client.get('http://ner')
+    client.get('http://ner')
+
+    with pytest.raises(CircuitOpenError):
+        client.get('http://ner')
+    assert len(client.session.calls) == 2
+
+    clock.now += 61
+    assert client.get('http://ner').status_code == 200
+    assert client.opened_at is None
+
+    client.get('http://ner')
+    assert client.consecutive_failures == 1
+    assert client.opened_at is None
+
+
+def test_circuit_reopens_after_failed_trial():
+    client, clock = create_client([500, 500], retries=0, failure_threshold=2, reset_after=60)
+    client.get('http://ner')
+    client.get('http://ner')
+    clock.now += 61
+
+    client.session.outcomes = [500]
+    client.get('http://ner')
+    with pytest.raises(CircuitOpenError):
+        client.get('http://ner')
+
+
+def test_stats():
+    client, clock = create_client([200])
+    assert client.get_stats() == "0 requests"
+    client.get('http://ner')
+    assert client.get_stats().startswith("1 requests")
+
+
+def test_stats_bounded(monkeypatch):
+    monkeypatch.setattr(HttpClient, 'LATENCY_SAMPLES', 4)
+    client, clock = create_client([200] * 100)
+    for _ in range(100):
+        client.get('http://ner')
+
+    assert client.get_stats().startswith("100 requests")
+    assert len(client.latencies) == 4
@@ -0,0 +1,94 @@
+import os
+import pytest
+from manifest import Manifest
+
+
+@pytest.fixture
+def manifest(tmpdir):
+    manifest = Manifest(str(tmpdir.join('manifest.sqlite')))
+    yield manifest
+    manifest.close()
+
+
+def test_new_file(manifest, tmpdir):
+    path = tmpdir.join('doc.txt')
+    path.write('text')
+    assert manifest.start(str(path)) == set()
+
+
+def test_completed_stages(manifest, tmpdir):
+    path = tmpdir.join('doc.txt')
+    path.write('text')
+    manifest.start(str(path))
+    manifest.mark_done(str(path), 'ner')
+    manifest.mark_done(str(path), 'json')
+
+    assert manifest.start(str(path)) == {'ner', 'json'}
+
+
+def test_changed_file(manifest, tmpdir):
+    path = tmpdir.join('doc.txt')
+    path.write('text')
+    manifest.start(str(path))
+    manifest.mark_done(str(path), 'ner')
+
+    path.write('other text')
+    assert manifest.start(str(path)) == set()
+
+
+def test_touched_file(manifest, tmpdir):
+    path = tmpdir.join('doc.txt')
+    path.write('text')
+    manifest.start(str(path))
+    manifest.mark_done(str(path), 'ner')
+
+    os.utime(str(path), (0, 0))
+    assert manifest.start(str(path)) == {'ner'}
+
+
+def test_persists(tmpdir):
+    path = tmpdir.join('doc.txt')
+    path.write('text')
+    manifest = Manifest(str(tmpdir.join('manifest.sqlite')))
+    manifest.start(str(path))
+    manifest.mark_done(str(path), 'bio')
+    manifest.close()
+
+    assert Manifest(str(tmpdir.join('manifest.sqlite'))).start(str(path)) == {'bio'}
+
+
+def test_unknown_stage(manifest, tmpdir):
+    with pytest.raises(ValueError):
+        manifest.mark_done(str(tmpdir.join('doc.txt')), 'unknown')
+
+
+def test_settings(tmpdir):
+    path = tmpdir.join('doc.txt')
+    path.write('text')
+    manifest = Manifest(str(tmpdir.join('manifest.sqlite')), {'output_dir': 'out', 'language': 'en'})
+    manifest.start(str(path))
+    manifest.mark_done(str(path), 'ner')
+    manifest.close()
+
+    other = Manifest(str(tmpdir.join('manifest.sqlite')), {'output_dir': 'other', 'language': 'en'})
+    assert other.start(str(path)) == set()
+    other.close()
+    same = Manifest(str(tmpdir.join('manifest.sqlite')), {'language': 'en', 'output_dir': 'out'})
+    assert same.start(str(path)) == {'ner'}
+    same.close()
+
+
+def test_entities(manifest, tmpdir):
+    path = tmpdir.join('doc.txt')
+    path.write('text')
+    manifest.start(str(path))
+    assert manifest.get_entities(str(path)) is None
+
+    manifest.mark_done(str(path), 'ner', {'text': {'entities': []}})
+    manifest.mark_done(str(path), 'json')
+    assert manifest.get_entities(str(path)) == {'text': {'entities': []}}
+
+    path.write('other text')
+    manifest.start(str(path))
+    assert manifest.get_entities(str(path)) is None
+
@@ -0,0 +1,65 @@
+import os
+from ner_cache import NerCache
+
+
+CONFIGURATION = {'language': 'nl', 'context_length': 3}
+
+
+def test_key_depends_on_text_and_configuration(tmpdir):
+    cache = NerCache(str(tmpdir))
+    key = cache.get_key('text', CONFIGURATION)
+
+    assert key == cache.get_key('text', dict(CONFIGURATION))
+    assert key != cache.get_key('other text', CONFIGURATION)
+    assert key != cache.get_key('text', CONFIGURATION, 'http://localhost:8000/ner/collect_from_text')
+    assert key != cache.get_key('text', {'language': 'en', 'context_length': 3})
+
+
+def test_get_and_set(tmpdir):
+    cache = NerCache(str(tmpdir))
+    key = cache.get_key('text', CONFIGURATION)
+
+    assert cache.get(key) is None
+    cache.set(key, {'text': {'entities': []}})
+    assert cache.get(key) == {'text': {'entities': []}}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_persists(tmpdir):
+    cache = NerCache(str(tmpdir))
+    key = cache.get_key('text', CONFIGURATION)
+    cache.set(key, {'text': {'entities': []}})
+
+    assert NerCache(str(tmpdir)).get(key) == {'text': {'entities': []}}
+
+
+def test_evicts_least_recently_used(tmpdir):
+    response = {'text': {'entities': [], 'padding': 'x' * 100}}
+    cache = NerCache(str(tmpdir), max_size=450)
+    keys = [cache.get_key(str(i), CONFIGURATION) for i in range(4)]
+
+    for index, key in enumerate(keys[:3]):
+        cache.set(key, response)
+        os.utime(cache.get_path(key), (index, index))
+    # use the first, so that the second is the least recently used
+    cache.get(keys[0])
+    cache.set(keys[3], response)
+
+    assert cache.size <= 450
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == response
+    assert cache.get(keys[3]) == response
+
+
+def test_removes_stale_temporary_files(tmpdir):
+    stale = tmpdir.join('stale.tmp')
+    stale.write_text('{"partial', encoding='utf-8')
+    os.utime(str(stale), (0, 0))
+    recent = tmpdir.join('recent.tmp')
+    recent.write_text('{"partial', encoding='utf-8')
+
+    cache = NerCache(str(tmpdir))
+
+    assert not stale.check()
+    assert recent.check()
+    assert cache.size == 0
@@ -0,0 +1,52 @@
+import threading
+import time
+import pytest
+from pipeline import Pipeline
+
+
+def test_run_all_stages():
+    results = []
+    lock = threading.Lock()
+
+    def collect(item):
+        with lock:
+            results.append(item)
+
+    Pipeline([(lambda x: x * 2, 3), (lambda x: x + 1, 2), (collect, 1)]).run(range(20))
+
+    assert sorted(results) == [x * 2 + 1 for x in range(20)]
+
+
+def test_none_drops_item():
+    results = []
+    Pipeline([(lambda x: x if x % 2 else None, 2), (results.append, 1)]).run(range(10))
+    assert sorted(results) == [1, 3, 5, 7, 9]
+
+
+def test_stages_overlap():
+    def slow(item):
+        time.sleep(0.05)
+        return item
+
+    start = time.time()
+    Pipeline([(slow, 4), (slow, 4)]).run(range(8))
+
+    assert time.time() - start < 8 * 2 * 0.05
+
+
+def test_error_is_raised():
+    def fail(item):
+        if item == 3:
+            raise ValueError('three')
+        return item
+
+    with pytest.raises(ValueError):
+        Pipeline([(fail, 2), (lambda x: x, 1)]).run(range(100))
+
+
+def test_system_exit_is_raised():
+    def fail(item):
+        exit()
+
+    with pytest.raises(SystemExit):
+        Pipeline([(fail, 2)]).run(range(10))
@@ -0,0 +1,49 @@
+from rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_acquire_within_burst_does_not_wait():
+    clock = FakeClock()
+    limiter = RateLimiter(1, burst=3, clock=clock, sleep=clock.sleep)
+
+    for i in range(3):
+        limiter.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_acquire_waits_for_rate():
+    clock = FakeClock()
+    limiter = RateLimiter(2, clock=clock, sleep=clock.sleep)
+
+    for i in range(5):
+        limiter.acquire()
+
+    assert clock.now == 2.0
+
+
+def test_tokens_refill_up_to_burst():
+    clock = FakeClock()
+    limiter = RateLimiter(1, burst=2, clock=clock, sleep=clock.sleep)
+    limiter.acquire()
+    limiter.acquire()
+
+    clock.now += 100
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.sleeps == []
+
+    limiter.acquire()
+    assert clock.sleeps == [1.0]
@@ -0,0 +1,30 @@
+import os
+from report import ReportIndex, copy_assets, write_data_file
+
+
+def test_write_data_file(tmpdir):
+    write_data_file(str(tmpdir), 'doc.entities.js', 'Text "quoted"', [{'ne': 'Text', 'pos': 0}])
+    assert tmpdir.join('doc.entities.js').read() == \
+        'pndDocument({"text":"Text \\"quoted\\"","entities":[{"ne":"Text","pos":0}]});\n'
+
+
+def test_copy_assets(tmpdir):
+    copy_assets(str(tmpdir))
+    assert sorted(os.listdir(str(tmpdir))) == ['index.html', 'report.css', 'report.js']
+
+
+def test_index_keeps_documents_from_earlier_runs(tmpdir):
+    index = ReportIndex(str(tmpdir))
+    index.add('b.txt', 'b.html', [{'type': 'LOCATION'}, {'type': 'PERSON'}])
+    index.add('a.txt', 'a.html', [])
+    index.write()
+    assert tmpdir.join('index.js').read() == \
+        'pndIndex([{"name":"a.txt","html":"a.html","entities":0,"locations":0},' \
+        '{"name":"b.txt","html":"b.html","entities":2,"locations":1}]);\n'
+
+    index = ReportIndex(str(tmpdir))
+    index.add('a.txt', 'a.html', [{'type': 'LOCATION'}])
+    index.write()
+    assert tmpdir.join('index.js').read() == \
+        'pndIndex([{"name":"a.txt","html":"a.html","entities":1,"locations":1},' \
+        '{"name":"b.txt","html":"b.html","entities":2,"locations":1}]);\n'
@@ -0,0 +1,57 @@
+import random
+import numpy as np
+from token_alignment import align_characters, align_tokens
+
+
+def test_same_tokens():
+    tokens = ['Jan', 'woont', 'in', 'Amsterdam']
+    assert list(align_tokens(tokens, list(tokens))) == [0, 1, 2, 3]
+
+
+def test_joined_and_split_tokens():
+    assert list(align_tokens(['New', 'York', 'is', 'groot'], ['NewYork', 'is', 'groot'])) == [0, 0, 1, 2]
+    assert list(align_tokens(['Amsterdam', 'en', 'Haarlem'], ['Amster', 'dam', 'en', 'Haarlem'])) == [0, 2, 3]
+
+
+def test_ocr_errors():
+    gold = ['Amsterdam', 'en', 'Haarlem', 'zijn', 'steden']
+    pred = ['Amsterdarn', 'en', 'Haar1em', 'zjin', 'ste', 'den']
+    assert list(align_tokens(gold, pred)) == [0, 1, 2, 3, 4]
+
+
+def test_unaligned_tokens():
+    assert list(align_tokens(['Oslo', '|||', 'is', 'mooi'], ['Oslo', 'is', 'mooi'])) == [0, -1, 1, 2]
+    assert list(align_tokens(['a', 'b'], [])) == [-1, -1]
+    assert list(align_tokens([], ['a'])) == []
+
+
+def test_align_characters_is_monotonic():
+    rng = random.Random(0)
+
+    for test in range(200):
+        a = ''.join(rng.choice('abc') for i in range(rng.randint(0, 300)))
+        b = list(a)
+        for edit in range(rng.randint(0, 20)):
+            position = rng.randint(0, len(b))
+            choice = rng.random()
+            if choice < 0.3 and position < len(b):
+                b[position] = rng.choice('xyz')
+            elif choice < 0.6:
+                b.insert(position, rng.choice('xyz'))
+            elif position < len(b):
+                del b[position]
+        b = ''.join(b)
+
+        alignment = align_characters(a, b)
+        aligned = alignment[alignment >= 0]
+        assert len(alignment) == len(a)
+        assert (np.diff(aligned) > 0).all()
+        assert (aligned < len(b)).all()
+
+
+def test_align_characters_far_apart():
+    a = 'x' * 50 + 'abcdefghijklmnop'
+    b = 'y' * 300 + 'abcdefghijklmnop'
+    alignment = align_characters(a, b, band=8, window=64)
+    assert len(alignment) == len(a)
+    assert (np.diff(alignment[alignment >= 0]) > 0).all()
@@ -0,0 +1,167 @@
+import numpy as np
+
+
+def align_tokens(gold_tokens, pred_tokens, band=16, window=128, resync=8):
+    '''
+    Align two tokenizations of (roughly) the same text, e.g. with different whitespace because of OCR errors.
+    Tokens are aligned by their characters (ignoring whitespace), see align_characters.
+    Returns an array with, for each gold token, the index of the predicted token that its first aligned
+    character is part of, or -1 if none of its characters could be aligned.
+    '''
+    gold_text, gold_owners = join_tokens(gold_tokens)
+    pred_text, pred_owners = join_tokens(pred_tokens)
+    character_alignment = align_characters(gold_text, pred_text, band, window, resync)
+
+    alignment = np.full(len(gold_tokens), -1, dtype=np.int64)
+    aligned = np.flatnonzero(character_alignment >= 0)
+    # the first aligned character of each gold token
+    tokens, first = np.unique(gold_owners[aligned], return_index=True)
+    alignment[tokens] = pred_owners[character_alignment[aligned[first]]]
+    return alignment
+
+
+def join_tokens(tokens):
+    '''
+    Concatenate tokens, returns the text and an array with the index of the token each character is part of.
+    '''
+    text = ''.join(tokens)
+    owners = np.repeat(np.arange(len(tokens), dtype=np.int64), [len(token) for token in tokens])
+    return text, owners
+
+
+def align_characters(a, b, band=16, window=128, resync=8):
+    '''
+    Align the characters of a with those of b, in time and memory linear in their length
+    if they differ in a limited number of places.
+
+    Like a diff, the strings are walked in parallel while they are equal. At a difference, the walk
+    is resumed after the cheapest small edit (a substitution, insertion or deletion of one or two characters)
+    after which the next resync characters are equal again. If there is none, the edits up to the point
+    where the strings are equal again are found with an edit distance over the next window characters,
+    restricted to a band of band characters around the diagonal.
+
+    Returns an array with, for each character in a, the index of the character in b it is aligned with,
+    or -1 if it is not aligned (i.e. deleted). Substituted characters are aligned.
+    '''
+    alignment = np.full(len(a), -1, dtype=np.int64)
+    i = 0
+    j = 0
+
+    while i < len(a) and j < len(b):
+        length = get_match_length(a, i, b, j)
+        if length:
+            alignment[i:i + length] = np.arange(j, j + length)
+            i += length
+            j += length
+            continue
+
+        edits = find_small_edit(a, i, b, j, resync)
+        if edits is None:
+            edits = find_banded_edits(a, i, b, j, band, window, resync)
+
+        for x, y in edits[0]:
+            alignment[i + x] = j + y
+        i += edits[1]
+        j += edits[2]
+
+    return alignment
+
+
+def get_match_length(a, i, b, j):
+    '''
+    The number of equal characters in a and b from i and j on, found by comparing blocks of increasing size.
+    '''
+    length = 0
+    step = 64
+
+    while step:
+        if a[i + length:i + length + step] == b[j + length:j + length + step] and \
+                i + length + step <= len(a) and j + length + step <= len(b):
+            length += step
+            step *= 2
+        else:
+            step //= 2
+
+    while i + length < len(a) and j + length < len(b) and a[i + length] == b[j + length]:
+        length += 1
+
+    return length
+
+
+# Small edits (characters skipped in a, characters skipped in b), cheapest first
+SMALL_EDITS = [(1, 1), (1, 0), (0, 1), (2, 2), (2, 1), (1, 2), (2, 0), (0, 2)]
+
+
+def is_resynced(a, i, b, j, resync):
+    '''
+    Whether a and b are equal for the next resync characters from i and j on (or up to their ends).
+    '''
+    return a[i:i + resync] == b[j:j + resync]
+
+
+def find_small_edit(a, i, b, j, resync):
+    '''
+    Find the cheapest small edit at i and j after which a and b are equal again.
+    Returns the aligned (substituted) characters as offsets from i and j and the number of characters
+    skipped in a and b, or None.
+    '''
+    for skip_a, skip_b in SMALL_EDITS:
+        if i + skip_a <= len(a) and j + skip_b <= len(b) and is_resynced(a, i + skip_a, b, j + skip_b, resync):
+            return [(k, k) for k in range(min(skip_a, skip_b))], skip_a, skip_b
+    return None
+
+
+def find_banded_edits(a, i, b, j, band, window, resync):
+    '''
+    Find the edits from i and j on with the lowest edit distance after which a and b are equal again,
+    within the next window characters and a band around the diagonal. If a and b are not equal again
+    within the window, the edits up to its end are returned. Returns the same as find_small_edit.
+    '''
+    rows = min(window, len(a) - i)
+    columns = min(window, len(b) - j)
+    width = 2 * band + 1
+    infinity = rows + columns + 1
+    # costs[x][band + y - x] is the edit distance between a[i:i + x] and b[j:j + y]
+    costs = [[infinity] * width for x in range(rows + 1)]
+    best = None
+
+    for x in range(rows + 1):
+        row = costs[x]
+        previous = costs[x - 1] if x else None
+        for y in range(max(0, x - band), min(columns, x + band) + 1):
+            k = band + y - x
+            if x == 0 or y == 0:
+                cost = x + y
+            else:
+                cost = previous[k] + (a[i + x - 1] != b[j + y - 1])
+                if k > 0:
+                    cost = min(cost, row[k - 1] + 1)
+                if k < width - 1:
+                    cost = min(cost, previous[k + 1] + 1)
+            row[k] = cost
+
+            if x + y and (best is None or (cost, x + y) < best[:2]):
+                if is_resynced(a, i + x, b, j + y, resync) or x == rows or y == columns:
+                    best = (cost, x + y, x, y)
+
+    if best is None:
+        # the band does not reach the end of the window, skip it in both strings
+        return [], rows, columns
+
+    # trace back the path to the best end point, keeping the diagonal steps
+    aligned = []
+    x, y = best[2], best[3]
+    while x and y:
+        k = band + y - x
+        cost = costs[x][k]
+        if cost == costs[x - 1][k] + (a[i + x - 1] != b[j + y - 1]):
+            aligned.append((x - 1, y - 1))
+            x -= 1
+            y -= 1
+        elif k > 0 and cost == costs[x][k - 1] + 1:
+            y -= 1
+        else:
+            x -= 1
+    aligned.reverse()
+
+    return aligned, best[2], best[3]
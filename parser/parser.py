@@ -1,8 +1,27 @@
 import argparse
+import codecs
 import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
+import soupsieve
 from bs4 import BeautifulSoup
+from lxml import etree
+
+# The libraries that can be used to parse the input files
+BACKENDS = ['beautifulsoup', 'lxml']
+
+# Element and attribute names that can be used in a route
+NAME = re.compile(r'^[^\W\d][\w.:-]*$')
+
+# The encodings tried (in this order) to decode an input file, latin-1 can decode any file
+ENCODINGS = ['utf-8', 'cp1252', 'latin-1']
+
+
+class ConversionError(Exception):
+    pass
 
 ###
 #  Input validation
@@ -67,8 +86,9 @@ def parseArguments(sysArgs):
 
     parser.add_argument(
         '--route_to_content',
-        dest='route',
+        dest='routes',
         required=True,
+        nargs='+',
         help="""The route (i.e. path) to the node the textual content needs to be extracted from.
                 To extract the content from all 'content' nodes that are direct children of 'parent',
                 provide 'parent#content'. If the content is in an attribute, you can do:
@@ -78,9 +98,35 @@ def parseArguments(sysArgs):
                 If, for example, you need to extract text from a node 'text' that lives in 'sibling1' and 'sibling2',
                 which are both direct children of 'parent', you can provide 'parent#*#text'.                
 
+                Several routes can be provided (e.g. 'title content[text]'), the content of the elements that
+                match any of them is extracted in the order of the document.
+
                 More info and examples in the README""",
         type=route)
 
+    parser.add_argument(
+        '--backend',
+        dest='backend',
+        choices=BACKENDS,
+        default='beautifulsoup',
+        help="""The library used to parse the input files. 'beautifulsoup' uses BeautifulSoup's pure Python HTML parser,
+                'lxml' uses the (much faster) HTML parser of lxml, that handles files the same way.
+                Defaults to 'beautifulsoup'.""")
+
+    parser.add_argument(
+        '--stream',
+        dest='stream',
+        action='store_true',
+        help="""Parse the input files incrementally (with lxml), and write the text content to the output
+                as soon as it is found. Use this for files that are too large to fit in memory.""")
+
+    parser.add_argument(
+        '--jobs',
+        dest='jobs',
+        default=1,
+        type=int,
+        help="The number of processes that convert files in parallel. Defaults to 1.")
+
     parsedArgs = parser.parse_args()
 
     return parsedArgs
@@ -97,44 +143,346 @@ def fatal(message):
 
 def main(sysArgs):
     args = parseArguments(sysArgs)
+    # compile the routes once, the compiled routes are passed to all workers
+    routes = compile_routes(args.routes, 'lxml' if args.stream else args.backend)
 
-    for folder, subs, files in os.walk(args.root_dir):
+    files = list(find_files(args.root_dir, args.extension, args.output_folder))
+    convert = partial(convert_file, routes=routes, backend=args.backend, stream=args.stream)
+
+    if args.jobs > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            errors = list(executor.map(convert, *zip(*files), chunksize=8)) if files else []
+    else:
+        errors = [convert(input_path, output_path) for input_path, output_path in files]
+
+    failures = [(input_path, error) for (input_path, output_path), error in zip(files, errors) if error]
+    if failures:
+        print("Failed to convert {} of {} files:".format(len(failures), len(files)))
+        for input_path, error in failures:
+            print("  '{}': {}".format(input_path, error))
+        return 1
+
+
+def find_files(root_dir, extension, output_folder):
+    '''
+    Find the files to convert, returns (input path, output path) tuples.
+    Files that have been converted already (i.e. for which the output file exists) are skipped.
+    '''
+    for folder, subs, files in os.walk(root_dir):
         for filename in files:
-            if filename.endswith(args.extension):
-                new_name = filename.replace(args.extension, '.txt')
-                
-                if not os.path.exists(os.path.join(args.output_folder, new_name)):
-                    print("Processing '{}'".format(filename))
-                    text = extract_text(os.path.join(folder, filename), args.route)
-                    write_to_file(args.output_folder, new_name, text)
+            if filename.endswith(extension):
+                new_name = filename.replace(extension, '.txt')
+                output_path = os.path.join(output_folder, new_name)
+
+                if not os.path.exists(output_path):
+                    yield os.path.join(folder, filename), output_path
+
+
+def convert_file(input_path, output_path, routes, backend, stream):
+    '''
+    Extract the text content from a file and write it to output_path.
+    Returns a description of the error if that failed, or 'None'.
+    '''
+    print("Processing '{}'".format(os.path.basename(input_path)))
+
+    try:
+        folder, filename = os.path.split(output_path)
+        if stream:
+            write_stream_to_file(folder, filename, iter_text(input_path, routes))
+        else:
+            write_to_file(folder, filename, extract_text(input_path, routes, backend))
+    except ConversionError as e:
+        return str(e)
+    except Exception as e:
+        return "{}: {}".format(type(e).__name__, e)
+
+
+def compile_routes(routes, backend='beautifulsoup'):
+    '''
+    Compile one or more routes for a backend (see RouteMatcher), or exit if a route contains invalid syntax.
+    routes can also be a RouteMatcher, which is returned as it is if it was compiled for the same backend.
+    '''
+    if isinstance(routes, RouteMatcher):
+        if routes.backend == backend:
+            return routes
+        routes = routes.routes
+
+    try:
+        return RouteMatcher(routes, backend)
+    except ValueError:
+        fatal("Your route contains invalid syntax. Please review it and try again.")
 
 
-def extract_text(file_path, route_to_text):
+class RouteMatcher:
+    '''
+    One or more routes (see parse_route), compiled once for a backend ('beautifulsoup' or 'lxml', which is
+    also used when streaming) so that they can be matched against any number of documents.
+    Elements that match any of the routes are selected in document order, the text of an element is taken
+    from the attribute of the (first) route it matches. Raises ValueError if a route contains invalid syntax.
+
+    A RouteMatcher can be sent to other processes. Compiled XPath expressions cannot be pickled,
+    these are compiled again when they are first used.
+    '''
+
+    def __init__(self, routes, backend='beautifulsoup'):
+        self.routes = [routes] if isinstance(routes, str) else list(routes)
+        self.backend = backend
+        parsed_routes = [parse_route(route) for route in self.routes]
+
+        if backend == 'beautifulsoup':
+            self.attributes = [parsed_route['attr'] for parsed_route in parsed_routes]
+            try:
+                self.selector = soupsieve.compile(', '.join(parsed_route['query'] for parsed_route in parsed_routes))
+                self.route_selectors = [soupsieve.compile(parsed_route['query']) for parsed_route in parsed_routes]
+            except (SyntaxError, soupsieve.SelectorSyntaxError) as e:
+                raise ValueError(str(e))
+        else:
+            self.names = [get_route_names(route) for route in self.routes]
+            self.attributes = [attribute for tags, attribute in self.names]
+            self.xpaths = [get_xpath(route) for route in self.routes]
+            self.compiled = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['compiled'] = None
+        return state
+
+    def select(self, document):
+        '''
+        Get the elements in a document (a BeautifulSoup instance, or a tree parsed by lxml)
+        that match one of the routes, returns (element, attribute) tuples.
+        '''
+        if self.backend == 'beautifulsoup':
+            elements = self.selector.select(document)
+            route_matchers = [selector.match for selector in self.route_selectors]
+        else:
+            if self.compiled is None:
+                # the XPath expressions are of the form '//test', test the elements themselves with 'self::test'
+                self.compiled = (etree.XPath(' | '.join(self.xpaths)),
+                                 [etree.XPath('boolean(self::{})'.format(xpath[2:])) for xpath in self.xpaths])
+            elements = self.compiled[0](document)
+            route_matchers = self.compiled[1]
+
+        for element in elements:
+            if len(self.routes) == 1:
+                yield element, self.attributes[0]
+            else:
+                index = next(index for index, is_match in enumerate(route_matchers) if is_match(element))
+                yield element, self.attributes[index]
+
+    def start(self, states, tag, get_attribute):
+        '''
+        Match an element while parsing incrementally. states is the result of start for its parent
+        (or 'None' for the root), per route the number of leading tags of the route matched by its ancestors.
+        Returns the states for the element and the attribute of the (first) route it matches,
+        '' if it matches a route on its text, or 'None' if it does not match.
+        '''
+        if states is None:
+            states = [0] * len(self.routes)
+
+        attribute = None
+        element_states = []
+        for (tags, route_attribute), state in zip(self.names, states):
+            if attribute is None and state == len(tags) - 1 and is_name_match(tag, tags[-1]):
+                if route_attribute is None:
+                    attribute = ''
+                elif get_attribute(route_attribute) is not None:
+                    attribute = route_attribute
+
+            if state < len(tags) - 1 and is_name_match(tag, tags[state]):
+                state += 1
+            element_states.append(state)
+
+        return element_states, attribute
+
+
+def detect_encoding(file_path):
+    '''
+    Get the first of ENCODINGS that can decode the whole file. The file is decoded in blocks.
+    '''
+    for encoding in ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(file_path, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    decoder.decode(block)
+                decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+
+        if encoding != ENCODINGS[0]:
+            print("Decoding '{}' as {}".format(file_path, encoding))
+        return encoding
+
+
+def extract_text(file_path, routes, backend='beautifulsoup'):
     '''
     Extract the desired text content from a file containing HTML or XML.
+    routes is a route, a list of routes, or a RouteMatcher.
+    '''
+    if backend == 'lxml':
+        return extract_text_lxml(file_path, routes)
+
+    routes = compile_routes(routes)
+    with open(file_path, 'r', encoding=detect_encoding(file_path)) as file:
+        soup = BeautifulSoup(file, features="html.parser")
+
+    return collect_text(soup, routes)
+
+
+def collect_text(soup, routes):
+    '''
+    Collect the text content from a BeautifulSoup instance based on one or more routes (see extract_text).
+    '''
+    routes = compile_routes(routes)
+    return ' '.join(get_text([element], attribute) for element, attribute in routes.select(soup))
+
+
+def extract_text_lxml(file_path, routes):
+    '''
+    Extract the desired text content from a file containing HTML or XML with lxml's HTML parser.
+    Like BeautifulSoup's HTML parser it lowercases tag and attribute names, and allows HTML entities in XML.
+    Routes are translated to XPath expressions that select the same elements as their CSS selectors.
     '''
+    routes = compile_routes(routes, 'lxml')
+
     try:
-        with open(file_path, 'r') as file:
-            soup = BeautifulSoup(file, features="html.parser")
-    except UnicodeDecodeError as e:
-        print("Error when decoding '{}' More info: {}".format(file_path, e))
-        exit(1)
+        tree = etree.parse(file_path, etree.HTMLParser(encoding=detect_encoding(file_path), huge_tree=True))
+    except (OSError, etree.XMLSyntaxError) as e:
+        raise ConversionError("Error when parsing '{}' More info: {}".format(file_path, e))
+
+    if tree.getroot() is None:
+        return ''
 
-    return collect_text(soup, route_to_text)
+    return ' '.join(get_text_lxml([element], attribute) for element, attribute in routes.select(tree))
 
 
-def collect_text(soup, route_to_text):
+def iter_text(file_path, routes):
     '''
-    Collect the text content from a BeautifulSoup instance based on a route.
+    Generate the desired text content from a file containing HTML or XML, one matching element at a time.
+    The file is parsed incrementally with lxml's HTML parser (see extract_text_lxml), and the routes are
+    matched while parsing. Elements are removed once they (and the matching elements they contain) are
+    processed, so memory use is bounded by the depth of the document rather than its size.
+    Joining the generated text with spaces gives the same text as extract_text with the lxml backend.
     '''
-    parsed_route = parse_route(route_to_text)
+    routes = compile_routes(routes, 'lxml')
+    if os.path.getsize(file_path) == 0:
+        return
+    encoding = detect_encoding(file_path)
+
+    # per open element, the states of the routes (see RouteMatcher.start)
+    states = [None]
+    # the outermost open element that matches a route on its text, and the matching elements in it
+    # (with the attribute that contains their text), in document order
+    matches = []
 
     try:
-        elements = soup.select(parsed_route['query'])
-    except SyntaxError:
-        fatal("Your route contains invalid syntax. Please review it and try again.")
+        for event, elem in etree.iterparse(file_path, events=('start', 'end'), html=True,
+                                           encoding=encoding, huge_tree=True):
+            if event == 'start':
+                element_states, attribute = routes.start(states[-1], elem.tag, elem.get)
+                states.append(element_states)
+
+                if attribute and not matches:
+                    yield elem.get(attribute)
+                elif attribute is not None:
+                    matches.append((elem, attribute))
+                continue
+
+            states.pop()
+            if matches and elem is matches[0][0]:
+                for match, attribute in matches:
+                    yield match.get(attribute) if attribute else match.xpath('string()')
+                matches = []
+
+            if not matches:
+                # nothing in the element is needed anymore, remove it (and earlier siblings) from the tree
+                elem.clear(keep_tail=True)
+                parent = elem.getparent()
+                while parent is not None and elem.getprevious() is not None:
+                    del parent[0]
+    except etree.XMLSyntaxError as e:
+        raise ConversionError("Error when parsing '{}' More info: {}".format(file_path, e))
+
+
+def get_route_names(route_to_text):
+    '''
+    Get the (lowercased) tag names in a route and the name of its attribute (or 'None').
+    Raises ValueError if a name is not valid.
+    '''
+    tags = [tag.split('[')[0] for tag in route_to_text.split('#')]
+    attribute = parse_route(route_to_text)['attr']
+
+    # validate the names
+    for name in tags:
+        get_name_test(name)
+    if attribute is not None:
+        get_name_test(attribute, '@')
+
+    return [tag.lower() for tag in tags], None if attribute is None else attribute.lower()
+
+
+def is_name_match(name, route_name):
+    return route_name == '*' or name == route_name
+
+
+def get_xpath(route):
+    '''
+    Translates a route of format 'node#childnode#subchildnode[attribute]' into an XPath expression
+    (e.g. '//subchildnode[@attribute][ancestor::childnode[ancestor::node]]').
+    The ancestors are tested in predicates, rather than with '//node//childnode//subchildnode',
+    which libxml2 evaluates a lot slower because it merges the descendants of all matching nodes.
+    '''
+    tags = [tag.split('[')[0] for tag in route.split('#')]
+    attribute = parse_route(route)['attr']
+
+    ancestors = None
+    for tag in tags[:-1]:
+        if ancestors is None:
+            ancestors = 'ancestor::{}'.format(get_name_test(tag))
+        else:
+            ancestors = 'ancestor::{}[{}]'.format(get_name_test(tag), ancestors)
+
+    xpath = '//' + get_name_test(tags[-1])
+    if attribute is not None:
+        xpath = '{}[{}]'.format(xpath, get_name_test(attribute, '@'))
+    if ancestors is not None:
+        xpath = '{}[{}]'.format(xpath, ancestors)
 
-    return get_text(elements, parsed_route['attr'])
+    return xpath
+
+
+def get_name_test(name, axis=''):
+    '''
+    Get the XPath test for an element (or with axis '@', an attribute) name, which is lowercased
+    as in files parsed by the HTML parser. Raises ValueError if name is not a valid name.
+    '''
+    if name == '*' and not axis:
+        return name
+
+    name = name.lower()
+    if not NAME.match(name):
+        raise ValueError("Invalid name '{}'".format(name))
+
+    # names with a (namespace) prefix are kept as they are by the HTML parser
+    if ':' in name:
+        return "{}*[name()='{}']".format(axis, name)
+    return axis + name
+
+
+def get_text_lxml(elements, attribute):
+    '''
+    Get the text from a set of lxml elements, see get_text.
+    '''
+    text = []
+
+    for elem in elements:
+        if not attribute is None:
+            text.append(elem.get(attribute.lower()))
+        else:
+            text.append(elem.xpath('string()'))
+
+    return ' '.join(text)
 
 
 def get_text(elements, attribute):
@@ -186,8 +534,28 @@ def parse_route(route):
 
 
 def write_to_file(folder, filename, text):
-    with open(os.path.join(folder, filename), "w") as outfile:
-        outfile.write(text)
+    write_stream_to_file(folder, filename, [text])
+
+
+def write_stream_to_file(folder, filename, texts):
+    '''
+    Write texts to a file as they are generated, separated by spaces.
+    The text is written to a temporary file first, so that an interrupted run does not leave
+    a partial file behind (which would be skipped by the next run). The temporary file has a fixed
+    name, so one left by a killed run is overwritten by the next.
+    '''
+    temp_path = os.path.join(folder, filename + '.tmp')
+
+    try:
+        with open(temp_path, "w", encoding='utf-8') as outfile:
+            for index, text in enumerate(texts):
+                if index:
+                    outfile.write(' ')
+                outfile.write(text)
+        os.replace(temp_path, os.path.join(folder, filename))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,10 @@
 import os
 import pytest
 from bs4 import BeautifulSoup
-from parser import collect_text, parse_route, extract_text
+import sys
+from parser import collect_text, parse_route, extract_text, get_xpath, iter_text, write_stream_to_file, BACKENDS
+import pickle
+from parser import convert_file, detect_encoding, main, compile_routes, RouteMatcher
 
 
 def test_parse_route_attribute():
@@ -133,27 +136,185 @@ def test_collect_text_nonsense_in_route():
     assert pytest_wrapped_e.value.code == 1
 
 
-def test_extract_text_europeana_one_textline():
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_extract_text_europeana_one_textline(backend):
     actual = extract_text(os.path.join(basepath(), "test_files/europeana_one_textline.xml"),
-                          'string[content]')
+                          'string[content]', backend)
     assert actual == "Indien men Italië in zijn geheel kon neutraliseren ,"
 
 
-def test_extract_text_europeana_one_textbox():
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_extract_text_europeana_one_textbox(backend):
     print(os.path.join(basepath(), "test_files/europeana_one_textbox.txt"))
 
     with open(os.path.join(basepath(), "test_files/europeana_one_textbox.txt"), "r") as txt:
         expected = txt.read()
     actual = extract_text(os.path.join(basepath(), "test_files/europeana_one_textbox.xml"),
-                          'string[content]')
+                          'string[content]', backend)
     assert actual == expected
    
 
-def test_extract_text_icabish():
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_extract_text_icabish(backend):
     actual = extract_text(os.path.join(
-        basepath(), "test_files/icab-ish.xml"), 'TEXT')
+        basepath(), "test_files/icab-ish.xml"), 'TEXT', backend)
     assert actual == "Some text to test"
 
 
+def test_get_xpath():
+    assert get_xpath('contentnode') == '//contentnode'
+    assert get_xpath('root#child#contentnode') == '//contentnode[ancestor::child[ancestor::root]]'
+    assert get_xpath('parent#*#ContentNode[Content]') == '//contentnode[@content][ancestor::*[ancestor::parent]]'
+    assert get_xpath('alto:string') == "//*[name()='alto:string']"
+
+
+@pytest.mark.parametrize('route', [
+    'root#child#contentnode', 'contentnode', 'String', 'parent#*#contentnode[content]', 'CONTENTNODE',
+    'nonexisting'])
+def test_extract_text_backends_agree(tmpdir, route):
+    xml_file = tmpdir.join('example.xml')
+    xml_file.write_text(EXAMPLE_XML, encoding='utf-8')
+
+    expected = extract_text(str(xml_file), route, 'beautifulsoup')
+    assert extract_text(str(xml_file), route, 'lxml') == expected
+    assert ' '.join(iter_text(str(xml_file), route)) == expected
+
+
+EXAMPLE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+        <root xmlns:alto="http://schema.ccs-gmbh.com/ALTO">
+            <parent>
+                <child><contentnode content="Itali&euml;">TEXT <b>bold</b> &amp; more</contentnode></child>
+                <anotherchild>
+                    <contentnode Content="TEXT2"><contentnode content="nested">TEXT3</contentnode></contentnode>
+                </anotherchild>
+                <String>string</String>
+            </parent>
+            <alto:textline><alto:string content="prefixed" /><alto:string content="twice" /></alto:textline>
+        </root>"""
+
+
+def test_extract_text_lxml_prefixed_names(tmpdir):
+    xml_file = tmpdir.join('example.xml')
+    xml_file.write_text("""<alto:TextLine xmlns:alto="http://schema.ccs-gmbh.com/ALTO">
+            <alto:String CONTENT="Indien" /><alto:String CONTENT="men" />
+        </alto:TextLine>""", encoding='utf-8')
+
+    actual = extract_text(str(xml_file), 'alto:textline#alto:string[Content]', 'lxml')
+    assert actual == "Indien men"
+
+
+@pytest.mark.parametrize('route', ['string[content]', 'textline#string', 'textblock'])
+def test_iter_text_europeana(route):
+    file_path = os.path.join(basepath(), "test_files/europeana_one_textbox.xml")
+    assert ' '.join(iter_text(file_path, route)) == extract_text(file_path, route, 'lxml')
+
+
+def test_iter_text_empty_file(tmpdir):
+    xml_file = tmpdir.join('empty.xml')
+    xml_file.write_text('', encoding='utf-8')
+    assert list(iter_text(str(xml_file), 'contentnode')) == []
+
+
+def test_write_stream_to_file(tmpdir):
+    write_stream_to_file(str(tmpdir), 'example.txt', iter(['TEXT', 'TEXT2', 'TEXT3']))
+    assert tmpdir.join('example.txt').read_text(encoding='utf-8') == 'TEXT TEXT2 TEXT3'
+    assert tmpdir.listdir() == [tmpdir.join('example.txt')]
+
+
+def test_write_stream_to_file_after_interrupted_run(tmpdir):
+    tmpdir.join('example.txt.tmp').write_text('PARTIAL TEXT OF A KILLED RUN', encoding='utf-8')
+    write_stream_to_file(str(tmpdir), 'example.txt', iter(['TEXT']))
+    assert tmpdir.listdir() == [tmpdir.join('example.txt')]
+
+
+def test_detect_encoding(tmpdir):
+    xml_file = tmpdir.join('example.xml')
+    xml_file.write_binary('<text>Itali\u00eb \u201cquoted\u201d</text>'.encode('utf-8'))
+    assert detect_encoding(str(xml_file)) == 'utf-8'
+
+    xml_file.write_binary('<text>Itali\u00eb \u201cquoted\u201d</text>'.encode('cp1252'))
+    assert detect_encoding(str(xml_file)) == 'cp1252'
+    assert extract_text(str(xml_file), 'text') == 'Itali\u00eb \u201cquoted\u201d'
+
+    xml_file.write_binary(b'<text>\x81</text>')
+    assert detect_encoding(str(xml_file)) == 'latin-1'
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_convert_file(tmpdir, backend):
+    output_path = str(tmpdir.join('icab-ish.txt'))
+    error = convert_file(os.path.join(basepath(), "test_files/icab-ish.xml"), output_path, 'TEXT', backend, False)
+
+    assert error is None
+    assert tmpdir.join('icab-ish.txt').read_text(encoding='utf-8') == "Some text to test"
+
+
+def test_convert_file_error(tmpdir):
+    output_path = str(tmpdir.join('missing.txt'))
+    error = convert_file(str(tmpdir.join('missing.xml')), output_path, 'TEXT', 'beautifulsoup', False)
+
+    assert error.startswith('FileNotFoundError')
+    assert tmpdir.listdir() == []
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_main_reports_failures(tmpdir, monkeypatch, capsys, jobs):
+    input_dir = tmpdir.mkdir('input')
+    output_dir = tmpdir.mkdir('output')
+    input_dir.join('first.xml').write_text('<text>first</text>', encoding='utf-8')
+    input_dir.join('second.xml').write_text('<text>second</text>', encoding='utf-8')
+    input_dir.join('broken.xml').mksymlinkto(tmpdir.join('nonexisting.xml'))
+
+    monkeypatch.setattr(sys, 'argv', ['parser.py', '--dir', str(input_dir), '--out', str(output_dir),
+                                      '--route_to_content', 'text', '--jobs', jobs])
+    assert main(sys.argv) == 1
+
+    assert sorted(path.basename for path in output_dir.listdir()) == ['first.txt', 'second.txt']
+    assert output_dir.join('second.txt').read_text(encoding='utf-8') == 'second'
+    assert "Failed to convert 1 of 3 files" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('backend', BACKENDS + ['stream'])
+def test_extract_text_multiple_routes(tmpdir, backend):
+    xml_file = tmpdir.join('example.xml')
+    xml_file.write_text("""<root>
+            <title>Title</title>
+            <page><string content="first" /><string content="second" /></page>
+            <caption>Caption <string content="nested" /></caption>
+        </root>""", encoding='utf-8')
+
+    routes = ['string[content]', 'title', 'root#caption']
+    if backend == 'stream':
+        actual = ' '.join(iter_text(str(xml_file), routes))
+    else:
+        actual = extract_text(str(xml_file), routes, backend)
+
+    assert actual == "Title first second Caption  nested"
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_route_matcher_can_be_pickled(backend):
+    routes = compile_routes(['string[content]', 'textline'], backend)
+    file_path = os.path.join(basepath(), "test_files/europeana_one_textline.xml")
+    expected = extract_text(file_path, routes, backend)
+
+    copy = pickle.loads(pickle.dumps(routes))
+    assert isinstance(copy, RouteMatcher)
+    assert extract_text(file_path, copy, backend) == expected
+
+
+def test_compile_routes_reuses_matcher():
+    routes = compile_routes('string[content]', 'lxml')
+    assert compile_routes(routes, 'lxml') is routes
+    assert compile_routes(routes, 'beautifulsoup').backend == 'beautifulsoup'
+
+
+def test_extract_text_lxml_nonsense_in_route():
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        extract_text(os.path.join(basepath(), "test_files/icab-ish.xml"), '@#!', 'lxml')
+
+    assert pytest_wrapped_e.value.code == 1
+
+
 def basepath():
     return os.path.dirname(os.path.realpath(__file__))
@@ -0,0 +1,193 @@
+from itertools import product
+import numpy as np
+
+
+# Mean radius of the earth, in km
+EARTH_RADIUS = 6371.0088
+# Offset and base of the cell coordinates in the cell keys, enough for cells of about 50 m
+CELL_OFFSET = 2 ** 19
+CELL_BASE = 2 ** 20
+MIN_CELL_CHORD = 4 / CELL_OFFSET
+# The offsets of a cell and the cells around it
+NEIGHBOURS = np.array(list(product([-1, 0, 1], repeat=3)), dtype=np.int64)
+# Computing all dot products (a matrix product) is this many times faster per pair than
+# computing those of the pairs in neighbouring cells
+BRUTE_FORCE_FACTOR = 8
+# The number of dot products computed at once when computing all of them
+BLOCK_SIZE = 2 ** 22
+
+
+def haversine_matrix(lats, lngs, other_lats=None, other_lngs=None):
+    '''
+    Get the great circle distances (in km) between all pairs of points, as a matrix with a row per point in
+    (lats, lngs) and a column per point in (other_lats, other_lngs) (defaults to the same points).
+    Coordinates are in degrees.
+    '''
+    if other_lats is None:
+        other_lats, other_lngs = lats, lngs
+
+    return get_distances(get_unit_vectors(lats, lngs) @ get_unit_vectors(other_lats, other_lngs).T)
+
+
+def get_unit_vectors(lats, lngs):
+    '''
+    Get the points on the unit sphere for coordinates in degrees, as an array with a row (x, y, z) per point.
+    '''
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lngs = np.radians(np.asarray(lngs, dtype=float))
+    return np.column_stack([np.cos(lats) * np.cos(lngs), np.cos(lats) * np.sin(lngs), np.sin(lats)]).reshape(-1, 3)
+
+
+def get_distances(dots):
+    '''
+    Get the great circle distances (in km) for the dot products of unit vectors (i.e. the cosines of the angles
+    between them), with the haversine formula: hav(angle) = (1 - cos(angle)) / 2.
+    Since the distance decreases with the dot product, the nearest of a set of points has the largest dot product.
+    '''
+    haversines = np.clip((1 - dots) / 2, 0, 1)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(haversines))
+
+
+def get_chord(distance):
+    '''
+    Get the straight line distance between two points on the unit sphere that are distance km apart.
+    '''
+    return 2 * np.sin(min(distance / EARTH_RADIUS, np.pi) / 2)
+
+
+def get_arc(chord):
+    '''
+    Get the distance in km between two points on the unit sphere that are chord apart in a straight line.
+    '''
+    return 2 * EARTH_RADIUS * np.arcsin(min(chord, 2) / 2)
+
+
+class SpatialIndex:
+    '''
+    An index of points (latitude, longitude) that finds the points within a distance of, or nearest to,
+    other points, without computing the distances between all pairs.
+
+    Like a geohash, the index is a hierarchy of grids: points are put in cells by their coordinates, here those
+    of their unit vector (x, y, z) in cubes, so that there are no special cases near the poles or the antimeridian.
+    Each level halves the cells of the level above it. A query looks at the 27 cells around each point
+    on the level with the smallest cells that are at least as large as the radius. On each level, the points
+    are sorted by cell, so that the points in a cell are found with a binary search.
+    Queries are answered for many points at a time, with numpy.
+    '''
+
+    def __init__(self, lats, lngs, leaf_size=8):
+        self.points = get_unit_vectors(lats, lngs)
+        # the sorted cell keys and the order of the points, per level (by cell size)
+        self.levels = {}
+
+        # the size of cells that have about leaf_size points (if not empty), to estimate the density of the points
+        self.cell_chord = 2.0
+        while self.cell_chord / 2 >= MIN_CELL_CHORD and \
+                len(self) > leaf_size * len(np.unique(self.get_level(self.cell_chord)[0])):
+            self.cell_chord /= 2
+        self.density = len(self) / max(1, len(np.unique(self.get_level(self.cell_chord)[0])))
+
+    def __len__(self):
+        return len(self.points)
+
+    def get_level(self, cell_chord):
+        if cell_chord not in self.levels:
+            keys = self.get_keys(self.get_cells(self.points, cell_chord))
+            order = np.argsort(keys, kind='stable')
+            self.levels[cell_chord] = (keys[order], order)
+        return self.levels[cell_chord]
+
+    def get_cells(self, points, cell_chord):
+        return np.floor(points / cell_chord).astype(np.int64)
+
+    def get_keys(self, cells):
+        cells = cells + CELL_OFFSET
+        return (cells[:, 0] * CELL_BASE + cells[:, 1]) * CELL_BASE + cells[:, 2]
+
+    def query_radius(self, lats, lngs, radius):
+        '''
+        Find the indexed points within radius km of each of the points (lats, lngs).
+        Returns three arrays, with an entry per pair of points: the index of the query point, the index
+        of the indexed point and their distance, sorted by query point and then by distance.
+        '''
+        return self.find_pairs(get_unit_vectors(lats, lngs), radius)
+
+    def query(self, lats, lngs, k=1, max_distance=None):
+        '''
+        Find the k indexed points nearest to each of the points (lats, lngs), optionally only those within
+        max_distance km. Returns two arrays with a row per query point: the distances to the k nearest points
+        (ascending) and their indices. k is at most the number of indexed points. If there are fewer than k
+        points (within max_distance), the rows are padded with distance infinity and index len(self).
+        '''
+        points = get_unit_vectors(lats, lngs)
+        k = min(k, len(self))
+        max_distance = np.pi * EARTH_RADIUS if max_distance is None else min(max_distance, np.pi * EARTH_RADIUS)
+        distances = np.full((len(points), k), np.inf)
+        indices = np.full((len(points), k), len(self), dtype=np.int64)
+
+        # the k nearest points are within a radius if there are at least k points within it,
+        # for the points that have fewer the search is repeated with twice the radius.
+        # The first radius is about half that of the area expected to have k points, given the points per cell,
+        # as points in denser areas need a smaller radius (and find many more points).
+        remaining = np.arange(len(points)) if k else np.zeros(0, dtype=np.int64)
+        radius = get_arc(self.cell_chord * np.sqrt(k / max(1, self.density)) / 2)
+        while len(remaining):
+            radius = min(radius, max_distance)
+            query_indices, point_indices, pair_distances = self.find_pairs(points[remaining], radius)
+
+            counts = np.bincount(query_indices, minlength=len(remaining))
+            done = (counts >= k) | (radius == max_distance)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[done]
+            found = np.arange(k) < counts[done][:, np.newaxis]
+            nearest = (starts[:, np.newaxis] + np.arange(k))[found]
+            rows = np.repeat(remaining[done], found.sum(axis=1))
+            distances[rows, found.nonzero()[1]] = pair_distances[nearest]
+            indices[rows, found.nonzero()[1]] = point_indices[nearest]
+
+            remaining = remaining[~done]
+            radius *= 2
+
+        return distances, indices
+
+    def find_pairs(self, points, radius):
+        '''
+        Find the pairs of (unit vectors of) points and indexed points within radius km, see query_radius.
+        '''
+        chord = get_chord(radius)
+        # points within the radius have a dot product (cosine) of at least that of the radius
+        min_dot = 1 - chord ** 2 / 2
+        cell_chord = 2.0
+        while cell_chord / 2 >= max(chord, MIN_CELL_CHORD):
+            cell_chord /= 2
+
+        counts = None
+        if cell_chord < 2.0:
+            # for each query point and neighbouring cell, the range of points in that cell
+            sorted_keys, order = self.get_level(cell_chord)
+            keys = self.get_keys((self.get_cells(points, cell_chord)[:, np.newaxis, :] + NEIGHBOURS).reshape(-1, 3))
+            starts = np.searchsorted(sorted_keys, keys, side='left')
+            counts = np.searchsorted(sorted_keys, keys, side='right') - starts
+
+        if counts is not None and counts.sum() * BRUTE_FORCE_FACTOR < len(points) * len(self):
+            query_indices = np.repeat(np.arange(len(keys)) // len(NEIGHBOURS), counts)
+            positions = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+            point_indices = order[positions]
+
+            dots = np.einsum('ij,ij->i', points[query_indices], self.points[point_indices])
+            within = dots >= min_dot
+            query_indices, point_indices, dots = query_indices[within], point_indices[within], dots[within]
+        else:
+            # the cells around the points hold most points, compute the dot products with all of them,
+            # a block of rows at a time
+            rows = max(1, BLOCK_SIZE // max(1, len(self)))
+            blocks = []
+            for start in range(0, len(points), rows):
+                block_dots = points[start:start + rows] @ self.points.T
+                block_query_indices, block_point_indices = np.nonzero(block_dots >= min_dot)
+                blocks.append((block_query_indices + start, block_point_indices,
+                               block_dots[block_query_indices, block_point_indices]))
+            query_indices, point_indices, dots = [np.concatenate(arrays) for arrays in zip(*blocks)] if blocks \
+                else [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)]
+
+        order = np.lexsort((-dots, query_indices))
+        return query_indices[order], point_indices[order], get_distances(dots[order])
@@ -0,0 +1,113 @@
+/*
+ * Renders the documents of a (sidecar) report. The data of a document is loaded from
+ * '<name>.entities.js', which calls pndDocument, the list of documents from 'index.js',
+ * which calls pndIndex. Script files (rather than json) are used so that the report
+ * also works when opened from disk.
+ */
+var PAGE_SIZE = 50;
+
+var CSS_CLASSES = {
+    'ORGANIZATION': 'ner_organization',
+    'PERSON': 'ner_person',
+    'LOCATION': 'ner_location'
+};
+
+function pndDocument(data) {
+    var entities = data.entities.slice().sort(function (a, b) { return a.pos - b.pos; });
+    var wrapper = document.getElementById('entityWrapper');
+    var position = 0;
+
+    document.getElementById('summary').textContent =
+        'A total of ' + entities.length + ' entities were found.';
+
+    for (var i = 0; i < entities.length; i++) {
+        var entity = entities[i];
+        if (entity.pos < position) {
+            continue;
+        }
+        wrapper.appendChild(document.createTextNode(data.text.substring(position, entity.pos)));
+        wrapper.appendChild(createEntityElement(entity));
+        position = entity.pos + entity.ne.length;
+    }
+    wrapper.appendChild(document.createTextNode(data.text.substring(position)));
+}
+
+function createEntityElement(entity) {
+    var element = document.createElement('span');
+    element.className = (CSS_CLASSES[entity.type] || 'ner_other') + ' tooltip';
+    element.textContent = entity.ne;
+
+    // only build the tooltip when it is needed
+    element.addEventListener('mouseenter', function () {
+        if (!element.querySelector('.tooltiptext')) {
+            var tooltip = document.createElement('span');
+            tooltip.className = 'tooltiptext';
+            tooltip.appendChild(createEntityTable(entity));
+            element.appendChild(tooltip);
+        }
+    });
+    return element;
+}
+
+function createEntityTable(entity) {
+    var rows = [
+        ['Named entity', entity.ne],
+        ['Alternative named entity', entity.alt_ne],
+        ['Count', entity.count],
+        ['Type', entity.type],
+        ['Type certainty', entity.type_certainty],
+        ['Types', entity.types && entity.types.length > 1 ? entity.types.join(', ') : undefined],
+        ['Sources', entity.ner_src ? entity.ner_src.join(', ') : undefined],
+        ['Left context', entity.left_context],
+        ['Right context', entity.right_context]
+    ];
+    var providers = [['geonames', 'Geonames'], ['google', 'Google'], ['osm', 'Open Street Map']];
+    for (var i = 0; i < providers.length; i++) {
+        var lat = entity[providers[i][0] + '_lat'];
+        if (lat !== undefined) {
+            rows.push([providers[i][1], 'Lat: ' + lat + ' Lng: ' + entity[providers[i][0] + '_lng']]);
+        }
+    }
+
+    var table = document.createElement('table');
+    for (var j = 0; j < rows.length; j++) {
+        if (rows[j][1] === undefined || rows[j][1] === null || rows[j][1] === '') {
+            continue;
+        }
+        var row = table.insertRow();
+        row.insertCell().textContent = rows[j][0];
+        row.insertCell().textContent = rows[j][1];
+    }
+    return table;
+}
+
+function pndIndex(documents) {
+    var page = 0;
+    var pageCount = Math.max(1, Math.ceil(documents.length / PAGE_SIZE));
+    var body = document.getElementById('documents');
+
+    document.getElementById('summary').textContent = documents.length + ' documents';
+
+    function show() {
+        body.innerHTML = '';
+        var pageDocuments = documents.slice(page * PAGE_SIZE, (page + 1) * PAGE_SIZE);
+        for (var i = 0; i < pageDocuments.length; i++) {
+            var row = body.insertRow();
+            var link = document.createElement('a');
+            link.href = pageDocuments[i].html;
+            link.textContent = pageDocuments[i].name;
+            row.insertCell().appendChild(link);
+            row.insertCell().textContent = pageDocuments[i].entities;
+            row.insertCell().textContent = pageDocuments[i].locations;
+        }
+        document.getElementById('page').textContent = 'Page ' + (page + 1) + ' of ' + pageCount;
+    }
+
+    document.getElementById('previous').addEventListener('click', function () {
+        if (page > 0) { page--; show(); }
+    });
+    document.getElementById('next').addEventListener('click', function () {
+        if (page < pageCount - 1) { page++; show(); }
+    });
+    show();
+}
@@ -0,0 +1,77 @@
+import pytest
+from gazetteer import Gazetteer
+from disambiguation import Disambiguator
+
+
+def row(geonameid, name, lat, lng, feature_class, country_code, population):
+    return [geonameid, name, name, '', lat, lng, feature_class, '', country_code, '', '', '', '', '', population,
+            '', '', '', '2019-01-01']
+
+
+DUMP = [
+    row('2988507', 'Paris', '48.85341', '2.3488', 'P', 'FR', '2138551'),
+    row('4717560', 'Paris', '33.66094', '-95.55551', 'P', 'US', '24782'),
+    row('4684888', 'Dallas', '32.78306', '-96.80667', 'P', 'US', '1300092'),
+    row('4671654', 'Austin', '30.26715', '-97.74306', 'P', 'US', '931830'),
+    row('2759794', 'Amsterdam', '52.37403', '4.88969', 'P', 'NL', '741636'),
+]
+
+
+@pytest.fixture
+def gazetteer(tmpdir):
+    dump = tmpdir.join('dump.txt')
+    dump.write_text('\n'.join('\t'.join(columns) for columns in DUMP) + '\n', encoding='utf-8')
+    index = str(tmpdir.join('gazetteer.idx'))
+
+    Gazetteer.build([str(dump)], index)
+    gazetteer = Gazetteer(index)
+    yield gazetteer
+    gazetteer.close()
+
+
+def get_entities(*names):
+    return [{'ne': name, 'type': 'LOCATION'} for name in names]
+
+
+def test_disambiguate_most_populous_alone(gazetteer):
+    entities = get_entities('Paris')
+    Disambiguator(gazetteer).disambiguate(entities)
+    assert entities[0]['geonames_id'] == 2988507
+
+
+def test_disambiguate_nearby_places(gazetteer):
+    entities = get_entities('Dallas', 'Paris', 'Austin', 'paris')
+    Disambiguator(gazetteer).disambiguate(entities)
+    assert [entity['geonames_id'] for entity in entities] == [4684888, 4717560, 4671654, 4717560]
+    assert entities[1]['geonames_lat'] == 33.66094
+    assert entities[1]['geonames_lng'] == -95.55551
+
+
+def test_disambiguate_near_europe(gazetteer):
+    entities = get_entities('Amsterdam', 'Paris')
+    Disambiguator(gazetteer).disambiguate(entities)
+    assert entities[1]['geonames_id'] == 2988507
+
+
+def test_disambiguate_skips_unknown_and_other_types(gazetteer):
+    entities = get_entities('Atlantis') + [{'ne': 'Paris', 'type': 'PERSON'}]
+    Disambiguator(gazetteer).disambiguate(entities)
+    assert all('geonames_id' not in entity for entity in entities)
+
+
+def test_disambiguate_weights(gazetteer):
+    entities = get_entities('Dallas', 'Paris')
+    Disambiguator(gazetteer, weights={'distance': 0}).disambiguate(entities)
+    assert entities[1]['geonames_id'] == 2988507
+
+
+def test_disambiguate_region(gazetteer):
+    entities = get_entities('Paris')
+    Disambiguator(gazetteer, region=[(32.78306, -96.80667)]).disambiguate(entities)
+    assert entities[0]['geonames_id'] == 4717560
+
+
+def test_disambiguate_few_neighbours(gazetteer):
+    entities = get_entities('Dallas', 'Paris', 'Austin')
+    Disambiguator(gazetteer, candidates=2, neighbours=1).disambiguate(entities)
+    assert entities[1]['geonames_id'] == 4717560
@@ -1,6 +1,7 @@
-
+import pytest
 from sklearn.metrics import f1_score
 from sklearn.metrics import classification_report
+from evaluate import Evaluation, LABELS, ENTITY_LABELS, extract_labels, evaluate_file, evaluate_files
 
 def test_f1_score_base():
     gold = ['DE O', 'EERSTE B-LOC', 'DE O', 'BESTE B-PER', 'DUS B-LOC']
@@ -62,3 +63,121 @@ def test_f1_real_world_data():
 
     print(classification_report(gold, pred))
     assert 0
+
+
+def test_evaluation_micro_scores_match_sklearn():
+    gold = ['O', 'LOC', 'O', 'PER', 'LOC', 'LOC', 'O', 'ORG']
+    pred = ['O', 'O', 'O', 'PER', 'LOC', 'LOC', 'LOC', 'PER']
+    evaluation = Evaluation()
+    evaluation.add(gold[:3], pred[:3])
+    evaluation.add(gold[3:], pred[3:])
+
+    expected = classification_report(gold, pred, output_dict=True, zero_division=0)
+    precision, recall, f1, support = evaluation.get_micro_scores()
+    for index, label in enumerate(LABELS):
+        if label in expected:
+            assert precision[index] == pytest.approx(expected[label]['precision'])
+            assert recall[index] == pytest.approx(expected[label]['recall'])
+            assert f1[index] == pytest.approx(expected[label]['f1-score'])
+            assert support[index] == expected[label]['support']
+
+
+def test_evaluation_macro_scores_average_over_files():
+    evaluation = Evaluation()
+    evaluation.add(['LOC', 'O'], ['LOC', 'O'])
+    evaluation.add(['LOC', 'LOC'], ['LOC', 'O'])
+    evaluation.add(['O'], ['O'])
+
+    precision, recall, f1 = evaluation.get_macro_scores()
+    loc = LABELS.index('LOC')
+    assert evaluation.file_counts[loc] == 2
+    assert precision[loc] == 1.0
+    assert recall[loc] == 0.75
+    assert evaluation.get_micro_scores()[1][loc] == pytest.approx(2 / 3)
+
+
+def test_evaluation_entity_scores():
+    gold = ['LOC', 'LOC', 'O', 'PER', 'O', 'ORG']
+    pred = ['LOC', 'O', 'O', 'PER', 'O', 'LOC']
+    evaluation = Evaluation()
+    evaluation.add(gold, pred)
+
+    precision, recall, f1, support = evaluation.get_entity_scores()
+    loc = ENTITY_LABELS.index('LOC')
+    per = ENTITY_LABELS.index('PER')
+    assert (precision[loc], recall[loc], support[loc]) == (0.0, 0.0, 1)
+    assert (precision[per], recall[per], f1[per]) == (1.0, 1.0, 1.0)
+    assert evaluation.entity_counts[2, loc] == 2
+
+
+def test_evaluation_different_lengths():
+    with pytest.raises(ValueError):
+        Evaluation().add(['O', 'LOC'], ['O'])
+
+
+def test_evaluation_merge():
+    first = Evaluation()
+    first.add(['LOC', 'O'], ['LOC', 'LOC'])
+    second = Evaluation()
+    second.add(['PER'], ['PER'])
+
+    both = Evaluation()
+    both.add(['LOC', 'O'], ['LOC', 'LOC'])
+    both.add(['PER'], ['PER'])
+
+    first.merge(second)
+    assert (first.confusion == both.confusion).all()
+    assert (first.entity_counts == both.entity_counts).all()
+    assert first.files == 2
+
+
+def test_extract_labels(tmpdir):
+    bio_file = tmpdir.join('example.bio')
+    bio_file.write_text('PERSONEEL O\nJan B-PER\nJansen I-PER\n\nPiet B-PER\nin O\nLOCatie OTHER\nOslo LOCATION\n',
+                        encoding='utf-8')
+
+    labels, beginnings = extract_labels(str(bio_file))
+    assert [LABELS[label] for label in labels] == ['O', 'PER', 'PER', 'PER', 'O', 'OTH', 'LOC']
+    assert list(beginnings) == [False, True, False, True, False, False, False]
+
+
+def test_evaluation_entities_split_on_beginnings():
+    gold = ['PER', 'PER', 'PER']
+    evaluation = Evaluation()
+    evaluation.add(gold, gold, [True, False, True], [True, False, False])
+
+    correct, gold_count, pred_count = evaluation.entity_counts[:, ENTITY_LABELS.index('PER')]
+    assert (correct, gold_count, pred_count) == (0, 2, 1)
+
+
+def test_evaluate_files_skips_unreadable_files(tmpdir):
+    tmpdir.join('gold.bio').write_text('Oslo LOC\nis O\n', encoding='utf-8')
+    tmpdir.join('pred.bio').write_text('Tromsø LOC\nis O\n', encoding='latin-1')
+    pair = (str(tmpdir.join('gold.bio')), str(tmpdir.join('pred.bio')))
+    same = (str(tmpdir.join('gold.bio')), str(tmpdir.join('gold.bio')))
+
+    evaluation, skipped = evaluate_files([pair, same])
+    assert evaluation.files == 1
+    assert len(skipped) == 1 and 'pred.bio' in skipped[0]
+
+
+def test_evaluate_file_different_tokenization(tmpdir):
+    tmpdir.join('gold.bio').write_text('Jan B-PER\nJansen I-PER\nwoont O\nin O\nNew B-LOC\nYork I-LOC\n', encoding='utf-8')
+    tmpdir.join('pred.bio').write_text('Jan B-PER\nJansen I-PER\nwoont O\nin O\nNewYork B-LOC\n', encoding='utf-8')
+
+    evaluation = Evaluation()
+    evaluate_file(str(tmpdir.join('gold.bio')), str(tmpdir.join('pred.bio')), evaluation)
+
+    assert evaluation.confusion.trace() == 6
+    assert (evaluation.entity_counts[0] == evaluation.entity_counts[1]).all()
+
+
+def test_evaluate_file_different_tokenization_same_length(tmpdir):
+    tmpdir.join('gold.bio').write_text('in O\nNew B-LOC\nYork I-LOC\nwonen O\n', encoding='utf-8')
+    tmpdir.join('pred.bio').write_text('in O\nNewYork B-LOC\nwo O\nnen O\n', encoding='utf-8')
+
+    evaluation = Evaluation()
+    evaluate_file(str(tmpdir.join('gold.bio')), str(tmpdir.join('pred.bio')), evaluation)
+
+    assert evaluation.confusion.trace() == 4
+    assert (evaluation.entity_counts[0] == evaluation.entity_counts[1]).all()
@@ -0,0 +1,37 @@
+import argparse
+import extract
+
+
+ENTITIES = {'text': {'title': 'test', 'entities': [{
+    'ne': 'Utrecht', 'pos': 11, 'type': 'LOCATION', 'types': ['LOCATION'], 'count': 1, 'ner_src': ['stanford'],
+    'type_certainty': 1, 'alt_nes': [], 'left_context': 'Hello from', 'right_context': '.',
+    'google_lat': 52.09, 'google_lng': 5.12}]}}
+TEXT = 'Hello from Utrecht.\n'
+
+
+def get_args(tmpdir, html_mode='inline'):
+    return argparse.Namespace(output_dir=str(tmpdir), extension='.txt', html_mode=html_mode)
+
+
+def test_export_html(tmpdir):
+    extract.export(get_args(tmpdir), 'doc.txt', TEXT, ENTITIES, ['html'])
+
+    html = tmpdir.join('doc.html').read_text(encoding='utf-8')
+    assert 'A total of 1 entities were found.' in html
+    assert '<td>Utrecht</td>' in html
+    assert 'Lat: 52.09 Lng: 5.12' in html
+    assert 'htmlDecode("Hello from Utrecht. ")' in html
+    assert tmpdir.listdir() == [tmpdir.join('doc.html')]
+
+
+def test_export_html_from_other_folder(tmpdir, monkeypatch):
+    # the templates are found relative to extract.py, not the working directory
+    out = tmpdir.mkdir('out')
+    monkeypatch.chdir(tmpdir.mkdir('elsewhere'))
+
+    extract.export(get_args(out), 'doc.txt', TEXT, ENTITIES, ['html'])
+    extract.export(get_args(out, 'sidecar'), 'other.txt', TEXT, ENTITIES, ['html'])
+
+    assert '<td>Utrecht</td>' in out.join('doc.html').read_text(encoding='utf-8')
+    assert '<script src="other.entities.js"></script>' in out.join('other.html').read_text(encoding='utf-8')
+    assert out.join('other.entities.js').check()
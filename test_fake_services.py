@@ -0,0 +1,138 @@
+import threading
+import pytest
+import requests
+import fake_services
+from fake_services import Cassette, FakeServices, find_capitalized
+from geocoding import Geocoder, get_service_urls
+from toponym_tagger import ToponymTagger
+
+
+def start(**kwargs):
+    server = FakeServices(('127.0.0.1', 0), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def services():
+    started = []
+
+    def create(**kwargs):
+        server = start(**kwargs)
+        started.append(server)
+        return server
+
+    yield create
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def ner_body(text):
+    return {'title': 'test', 'text': text, 'configuration': {'language': 'en', 'context_length': 1}}
+
+
+def test_find_capitalized():
+    text = 'The trip from New York to Utrecht. Then home, via Ede.'
+    assert [text[start:end] for start, end in find_capitalized(text)] == ['New York', 'Utrecht', 'Ede']
+
+
+def test_multiner(services):
+    urls = get_service_urls(services().url)
+    r = requests.get(urls['multiner'], json=ner_body('From Utrecht to Utrecht.'))
+
+    assert r.status_code == 200
+    entities = r.json()['text']['entities']
+    assert [(entity['ne'], entity['pos'], entity['count']) for entity in entities] == [('Utrecht', 5, 2), ('Utrecht', 16, 2)]
+    assert entities[0]['left_context'] == 'From'
+    assert entities[0]['right_context'] == 'to'
+
+
+def test_multiner_with_tagger(services):
+    urls = get_service_urls(services(tagger=ToponymTagger(['ede'])).url)
+    entities = requests.get(urls['multiner'], json=ner_body('Mister Smith from Ede.')).json()['text']['entities']
+
+    assert [(entity['ne'], entity['type']) for entity in entities] == [('Ede', 'LOCATION')]
+
+
+def test_geocode_locations(services, monkeypatch):
+    monkeypatch.delenv('GEONAMES_USERNAME', raising=False)
+    monkeypatch.delenv('GOOGLE_API_KEY', raising=False)
+    urls = get_service_urls(services().url)
+    entities = [{'ne': 'Utrecht', 'type': 'LOCATION'}, {'ne': 'Ede', 'type': 'LOCATION'}]
+
+    Geocoder(entities, 'nl', urls=urls).geocode_locations()
+
+    lat, lng = fake_services.get_coordinates(fake_services.get_place_id('Utrecht'))
+    for provider in ['geonames', 'google', 'osm']:
+        assert float(entities[0]['{}_lat'.format(provider)]) == pytest.approx(lat)
+        assert float(entities[0]['{}_lng'.format(provider)]) == pytest.approx(lng)
+    assert entities[1]['osm_lat'] != entities[0]['osm_lat']
+
+
+def test_not_found_rate(services):
+    urls = get_service_urls(services(not_found_rate=1).url)
+    entities = [{'ne': 'Utrecht', 'type': 'LOCATION'}]
+
+    Geocoder(entities, 'nl', urls=urls).geocode_locations()
+
+    assert entities == [{'ne': 'Utrecht', 'type': 'LOCATION'}]
+
+
+def test_error_rate(services):
+    urls = get_service_urls(services(error_rate=0.5, error_status=503, seed=1).url)
+    statuses = [requests.get(urls['osm'], params={'q': 'Utrecht'}).status_code for _ in range(100)]
+
+    assert set(statuses) == {200, 503}
+    assert 30 < statuses.count(503) < 70
+
+
+def test_unknown_path(services):
+    assert requests.get(services().url + '/unknown').status_code == 404
+
+
+def test_record_and_replay(services, monkeypatch, tmpdir):
+    # record the responses of another stand-in, instead of the real services
+    upstream = services()
+    monkeypatch.setattr(fake_services, 'SERVICE_URLS', get_service_urls(upstream.url))
+    monkeypatch.setenv('GEONAMES_USERNAME', 'secret')
+    path = str(tmpdir.join('cassette.jsonl'))
+
+    urls = get_service_urls(services(cassette=Cassette(path, record=True), record=True).url)
+    recorded = requests.get(urls['geonames'], params={'q': 'Utrecht', 'username': 'local'}).json()
+    requests.get(urls['multiner'], json=ner_body('From Utrecht.'))
+
+    assert recorded == requests.get(fake_services.SERVICE_URLS['geonames'], params={'q': 'Utrecht'}).json()
+    assert 'secret' not in tmpdir.join('cassette.jsonl').read_text(encoding='utf-8')
+
+    # the credentials are not part of the request, and the keys of a JSON body can be in any order
+    cassette = Cassette(path)
+    assert len(cassette) == 2
+    urls = get_service_urls(services(cassette=cassette).url)
+    assert requests.get(urls['geonames'], params={'username': 'other', 'q': 'Utrecht'}).json() == recorded
+    body = dict(reversed(list(ner_body('From Utrecht.').items())))
+    assert requests.get(urls['multiner'], json=body).json()['text']['entities'][0]['ne'] == 'Utrecht'
+    assert requests.get(urls['geonames'], params={'q': 'Ede'}).status_code == 404
+
+
+def test_replay_does_not_write(services, tmpdir):
+    cassette = tmpdir.join('cassette.jsonl')
+    cassette.write_text('', encoding='utf-8')
+    cassette.chmod(0o444)
+
+    replayed = Cassette(str(cassette))
+    assert replayed.file is None
+    urls = get_service_urls(services(cassette=replayed).url)
+    assert requests.get(urls['osm'], params={'q': 'Utrecht'}).status_code == 404
+
+
+def test_record_unreachable_service(services, monkeypatch, tmpdir):
+    # nothing listens on the port of a closed server
+    closed = FakeServices(('127.0.0.1', 0))
+    monkeypatch.setattr(fake_services, 'SERVICE_URLS', get_service_urls(closed.url))
+    closed.server_close()
+    path = str(tmpdir.join('cassette.jsonl'))
+
+    urls = get_service_urls(services(cassette=Cassette(path, record=True), record=True).url)
+    assert requests.get(urls['multiner'], json=ner_body('From Utrecht.')).status_code == 502
+    assert len(Cassette(path)) == 0
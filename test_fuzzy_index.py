@@ -0,0 +1,113 @@
+import pytest
+from gazetteer import Gazetteer
+from fuzzy_index import FuzzyIndex, fold_place_name, get_deletes, get_edit_distance
+
+
+def row(geonameid, name, alternate_names, population):
+    return [geonameid, name, name, alternate_names, '52.0', '5.0', 'P', 'PPL', 'NL', '', '', '', '', '', population,
+            '', '', '', '2019-01-01']
+
+
+DUMP = [
+    row('2759794', 'Amsterdam', '', '741636'),
+    row('2747891', 'Rotterdam', '', '598199'),
+    row('2759706', "'s-Hertogenbosch", 'Den Bosch', '135000'),
+    row('2867714', 'München', 'Munich', '1260391'),
+    row('2747373', 'Amstelveen', '', '85971'),
+    row('2756669', 'Ede', '', '67670'),
+]
+
+
+@pytest.fixture
+def fuzzy_index(tmpdir):
+    dump = tmpdir.join('dump.txt')
+    dump.write_text('\n'.join('\t'.join(columns) for columns in DUMP) + '\n', encoding='utf-8')
+    Gazetteer.build([str(dump)], str(tmpdir.join('gazetteer.idx')))
+    gazetteer = Gazetteer(str(tmpdir.join('gazetteer.idx')))
+    FuzzyIndex.build(gazetteer, str(tmpdir.join('fuzzy.idx')))
+    gazetteer.close()
+
+    fuzzy_index = FuzzyIndex(str(tmpdir.join('fuzzy.idx')))
+    yield fuzzy_index
+    fuzzy_index.close()
+
+
+def test_fold_place_name():
+    assert fold_place_name('München') == 'munchen'
+    assert fold_place_name('Mu¨nchen') == 'munchen'
+    assert fold_place_name("'s-Hertogenbosch") == 's hertogenbosch'
+    assert fold_place_name("  'S  Hertogenbosch ") == 's hertogenbosch'
+    assert fold_place_name('Łódź') == 'lodz'
+
+
+def test_get_deletes():
+    assert get_deletes('abc', 1, 9) == {'abc', 'bc', 'ac', 'ab'}
+    assert get_deletes('abcdef', 1, 2) == {'ab', 'a', 'b'}
+
+
+@pytest.mark.parametrize('a, b, distance', [
+    ('amsteldam', 'amsterdam', 1),
+    ('amsterdam', 'amsterdam', 0),
+    ('amstrdam', 'amsterdam', 1),
+    ('amsterdma', 'amsterdam', 1),
+    ('', 'abc', 3),
+    ('abc', '', 3),
+    ('kitten', 'sitting', 3),
+    ('ca', 'abc', 3),
+    ('a' * 80, 'a' * 79 + 'b', 1),
+])
+def test_get_edit_distance(a, b, distance):
+    assert get_edit_distance(a, b) == distance
+
+
+def test_lookup(fuzzy_index):
+    matches = fuzzy_index.lookup('Amsteldam')
+    assert [(match.name, match.distance) for match in matches] == [('Amsterdam', 1)]
+    assert matches[0].key == 'amsterdam'
+    assert matches[0].population == 741636
+
+
+def test_lookup_max_distance_and_limit(fuzzy_index):
+    assert [match.name for match in fuzzy_index.lookup('Amsteldam', max_distance=1)] == ['Amsterdam']
+    assert len(fuzzy_index.lookup('Amsteldam', limit=1)) == 1
+    assert fuzzy_index.lookup('Atlantis') == []
+    assert fuzzy_index.lookup('') == []
+
+
+def test_lookup_alternate_name(fuzzy_index):
+    matches = fuzzy_index.lookup('Den Bosh')
+    assert matches[0].key == 'den bosch'
+    assert matches[0].name == 'den bosch'
+
+
+def test_correct(fuzzy_index):
+    assert fuzzy_index.correct('Amsteldam') == 'Amsterdam'
+    assert fuzzy_index.correct("'s Hertogenbosch") == "'s-Hertogenbosch"
+    assert fuzzy_index.correct('Mu¨nchen') == 'München'
+    assert fuzzy_index.correct('AMSTERDAM') == 'AMSTERDAM'
+    assert fuzzy_index.correct('Atlantis') == 'Atlantis'
+
+
+def test_correct_short_names(fuzzy_index):
+    assert fuzzy_index.correct('Eda') == 'Eda'
+    assert fuzzy_index.correct('EDE') == 'EDE'
+    assert fuzzy_index.correct('Rotterdm') == 'Rotterdam'
+    assert fuzzy_index.correct('Rottrdm') == 'Rottrdm'
+    assert fuzzy_index.lookup('Eda')[0].key == 'ede'
+
+
+def test_not_a_fuzzy_index(tmpdir):
+    path = tmpdir.join('other.idx')
+    path.write_binary(b'0' * 64)
+    with pytest.raises(ValueError):
+        FuzzyIndex(str(path))
+
+
+def test_build_in_runs(tmpdir, monkeypatch, fuzzy_index):
+    monkeypatch.setattr(FuzzyIndex, 'SORT_RUN_SIZE', 10)
+    gazetteer = Gazetteer(str(tmpdir.join('gazetteer.idx')))
+    FuzzyIndex.build(gazetteer, str(tmpdir.join('runs.idx')))
+    gazetteer.close()
+
+    assert tmpdir.join('runs.idx').read_binary() == tmpdir.join('fuzzy.idx').read_binary()
+    assert tmpdir.listdir(lambda path: path.isdir()) == []
@@ -0,0 +1,77 @@
+import pytest
+from gazetteer import Gazetteer
+
+
+DUMP = [
+    ['2745912', 'Utrecht', 'Utrecht', 'Trajectum,Utreg,Oetrech', '52.09083', '5.12222', 'P', 'PPLA', 'NL', '', '09', '', '', '', '290529', '', '13', 'Europe/Amsterdam', '2019-01-01'],
+    ['2745909', 'Provincie Utrecht', 'Provincie Utrecht', 'Utrecht', '52.08333', '5.16667', 'A', 'ADM1', 'NL', '', '09', '', '', '', '1253672', '', '2', 'Europe/Amsterdam', '2019-01-01'],
+    ['3117735', 'Madrid', 'Madrid', '', '40.4165', '-3.70256', 'P', 'PPLC', 'ES', '', '29', '', '', '', '3255944', '', '665', 'Europe/Madrid', '2019-01-01'],
+    ['2759794', "'s-Hertogenbosch", "'s-Hertogenbosch", 'Den Bosch,Bois-le-Duc', '51.69917', '5.30417', 'P', 'PPLA', 'NL', '', '06', '', '', '', '', '', '4', 'Europe/Amsterdam', '2019-01-01'],
+]
+
+
+@pytest.fixture
+def gazetteer(tmpdir):
+    dump = tmpdir.join('dump.txt')
+    dump.write_text('\n'.join('\t'.join(columns) for columns in DUMP) + '\n', encoding='utf-8')
+    index = str(tmpdir.join('gazetteer.idx'))
+
+    Gazetteer.build([str(dump)], index)
+    gazetteer = Gazetteer(index)
+    yield gazetteer
+    gazetteer.close()
+
+
+def test_lookup_name(gazetteer):
+    entries = gazetteer.lookup('Madrid')
+    assert len(entries) == 1
+    assert entries[0].geonameid == 3117735
+    assert entries[0].name == 'Madrid'
+    assert entries[0].lat == 40.4165
+    assert entries[0].lng == -3.70256
+    assert entries[0].country_code == 'ES'
+
+
+def test_lookup_alternate_name_case_insensitive(gazetteer):
+    entries = gazetteer.lookup('den  BOSCH')
+    assert [entry.name for entry in entries] == ["'s-Hertogenbosch"]
+    assert entries[0].population == 0
+
+
+def test_lookup_sorted_by_population(gazetteer):
+    entries = gazetteer.lookup('Utrecht')
+    assert [entry.geonameid for entry in entries] == [2745909, 2745912]
+
+
+def test_lookup_feature_class_and_limit(gazetteer):
+    assert [entry.geonameid for entry in gazetteer.lookup('Utrecht', feature_class='P')] == [2745912]
+    assert len(gazetteer.lookup('Utrecht', limit=1)) == 1
+
+
+def test_lookup_unknown(gazetteer):
+    assert gazetteer.lookup('Atlantis') == []
+    assert gazetteer.lookup('') == []
+
+
+def test_build_filters(tmpdir):
+    dump = tmpdir.join('dump.txt')
+    dump.write_text('\n'.join('\t'.join(columns) for columns in DUMP) + '\n', encoding='utf-8')
+    index = str(tmpdir.join('gazetteer.idx'))
+
+    Gazetteer.build([str(dump)], index, feature_classes=['P'], min_population=1000)
+    gazetteer = Gazetteer(index)
+
+    assert len(gazetteer) == 2
+    assert gazetteer.lookup('Den Bosch') == []
+
+
+def test_build_in_runs(tmpdir, monkeypatch, gazetteer):
+    monkeypatch.setattr(Gazetteer, 'SORT_RUN_SIZE', 2)
+    index = str(tmpdir.join('runs.idx'))
+    Gazetteer.build([str(tmpdir.join('dump.txt'))], index)
+
+    in_runs = Gazetteer(index)
+    assert list(in_runs.iter_names()) == list(gazetteer.iter_names())
+    assert in_runs.lookup('utrecht') == gazetteer.lookup('utrecht')
+    in_runs.close()
+    assert tmpdir.listdir(lambda path: path.isdir()) == []
@@ -0,0 +1,152 @@
+import threading
+import time
+import pytest
+import geocoding
+from geocoding import Geocoder, create_rate_limiters
+from helpers.geocode_cache import GeocodeCache
+
+
+class FakeResult:
+    def __init__(self, lat=None, lng=None, status='OK'):
+        self.ok = lat is not None
+        self.lat = lat
+        self.lng = lng
+        self.status = status if self.ok else 'ERROR - No results found'
+        self.geonames_id = 1
+
+
+@pytest.fixture
+def requests_made(monkeypatch):
+    '''
+    Replace the geocoder providers with fakes that know only 'Utrecht', and record the requests made.
+    '''
+    made = []
+
+    def fake(provider):
+        def lookup(location, **kwargs):
+            made.append((provider, location))
+            time.sleep(0.01)
+            if location in ['Utrecht', 1]:
+                return FakeResult(52.09, 5.12)
+            return FakeResult()
+        return lookup
+
+    monkeypatch.setenv('GEONAMES_USERNAME', 'test')
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test')
+    monkeypatch.setattr(geocoding.geocoder, 'geonames', fake('geonames'))
+    monkeypatch.setattr(geocoding.geocoder, 'google', fake('google'))
+    monkeypatch.setattr(geocoding.geocoder, 'osm', fake('osm'))
+    return made
+
+
+def location(name):
+    return {'ne': name, 'type': 'LOCATION'}
+
+
+def unlimited():
+    return create_rate_limiters({'geonames': (1000, 1000), 'google': (1000, 1000), 'osm': (1000, 1000)})
+
+
+def test_geocode_locations(requests_made):
+    entities = [location('Utrecht'), {'ne': 'Jan', 'type': 'PERSON'}]
+    Geocoder(entities, 'nl', limiters=unlimited()).geocode_locations()
+
+    assert entities[0]['geonames_lat'] == 52.09
+    assert entities[0]['google_lng'] == 5.12
+    assert entities[0]['osm_lat'] == 52.09
+    assert 'osm_lat' not in entities[1]
+
+
+def test_geocode_locations_once_per_name(requests_made):
+    entities = [location('Utrecht'), location('utrecht'), location('Nowhere'), location('Utrecht')]
+    Geocoder(entities, 'nl', limiters=unlimited()).geocode_locations()
+
+    assert all(ent['osm_lat'] == 52.09 for ent in entities if ent['ne'] != 'Nowhere')
+    assert 'osm_lat' not in entities[2]
+    assert len([r for r in requests_made if r[0] == 'osm']) == 2
+
+
+def test_geocode_locations_caches_per_url(requests_made):
+    cache = GeocodeCache()
+    urls = {'osm': 'http://localhost:8000/search'}
+    Geocoder([location('Utrecht')], 'nl', cache, limiters=unlimited(), urls=urls).geocode_locations()
+    count = len([r for r in requests_made if r[0] == 'osm'])
+
+    Geocoder([location('Utrecht')], 'nl', cache, limiters=unlimited()).geocode_locations()
+
+    assert len([r for r in requests_made if r[0] == 'osm']) == count + 1
+
+
+def test_geocode_locations_uses_cache(requests_made):
+    cache = GeocodeCache()
+    Geocoder([location('Utrecht'), location('Nowhere')], 'nl', cache, limiters=unlimited()).geocode_locations()
+    count = len(requests_made)
+
+    entities = [location('Utrecht'), location('Nowhere')]
+    Geocoder(entities, 'nl', cache, limiters=unlimited()).geocode_locations()
+
+    assert len(requests_made) == count
+    assert entities[0]['google_lat'] == 52.09
+    assert 'google_lat' not in entities[1]
+
+
+def test_geocode_locations_concurrently(monkeypatch, requests_made):
+    active = []
+    max_active = []
+    lock = threading.Lock()
+
+    def slow_osm(location, **kwargs):
+        with lock:
+            active.append(location)
+            max_active.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(location)
+        return FakeResult()
+
+    monkeypatch.setattr(geocoding.geocoder, 'osm', slow_osm)
+    entities = [location('Place {}'.format(i)) for i in range(8)]
+    Geocoder(entities, 'nl', workers=8, limiters=unlimited()).geocode_locations()
+
+    assert max(max_active) > 1
+
+
+def test_geocode_locations_respects_rate_limit(requests_made):
+    limiters = create_rate_limiters({'geonames': (1000, 1000), 'google': (1000, 1000), 'osm': (20, 1)})
+    entities = [location('Place {}'.format(i)) for i in range(5)]
+
+    start = time.time()
+    Geocoder(entities, 'nl', workers=5, limiters=limiters).geocode_locations()
+
+    assert time.time() - start >= 0.2
+
+
+def test_geocode_locations_from_gazetteer(monkeypatch, requests_made):
+    class FakeGazetteer:
+        def lookup(self, name, feature_class=None, limit=None):
+            return [FakeResult(1.0, 2.0)] if name == 'Utrecht' else []
+
+    monkeypatch.delenv('GEONAMES_USERNAME')
+    entities = [location('Utrecht'), location('Nowhere')]
+    Geocoder(entities, 'nl', limiters=unlimited(), gazetteer=FakeGazetteer()).geocode_locations()
+
+    assert entities[0]['geonames_lat'] == 1.0
+    assert entities[0]['geonames_lng'] == 2.0
+    assert 'geonames_lat' not in entities[1]
+    assert not any(r[0] == 'geonames' for r in requests_made)
+
+
+def test_geocode_locations_corrects_spelling(requests_made):
+    class FakeFuzzyIndex:
+        def correct(self, name):
+            return 'Utrecht' if name == 'Uitrecht' else name
+
+    entities = [location('Uitrecht'), location('uitrecht'), location('Nowhere')]
+    Geocoder(entities, 'nl', limiters=unlimited(), fuzzy_index=FakeFuzzyIndex()).geocode_locations()
+
+    assert entities[0]['osm_lat'] == 52.09
+    assert entities[1]['google_lat'] == 52.09
+    assert entities[0]['ne'] == 'Uitrecht'
+    assert 'osm_lat' not in entities[2]
+    assert ('osm', 'Utrecht') in requests_made
+    assert ('osm', 'Uitrecht') not in requests_made
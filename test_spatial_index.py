@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from spatial_index import SpatialIndex, haversine_matrix, get_chord, get_arc
+
+
+# Amsterdam, Paris, Madrid, New York, Sydney, Utrecht
+LATS = [52.37403, 48.85341, 40.4165, 40.71427, -33.86785, 52.09083]
+LNGS = [4.88969, 2.3488, -3.70256, -74.00597, 151.20732, 5.12222]
+
+
+def test_haversine_matrix():
+    distances = haversine_matrix([52.37403, 48.85341], [4.88969, 2.3488])
+    assert distances.shape == (2, 2)
+    assert distances[0][0] == pytest.approx(0, abs=1e-3)
+    assert distances[0][1] == pytest.approx(430, abs=1)
+    assert distances[1][0] == distances[0][1]
+
+
+def test_haversine_matrix_other_points():
+    distances = haversine_matrix([0, 0], [0, 90], [0], [180])
+    assert distances.shape == (2, 1)
+    assert distances[0][0] == pytest.approx(6371.0088 * np.pi, rel=1e-6)
+    assert distances[1][0] == pytest.approx(6371.0088 * np.pi / 2, rel=1e-6)
+
+
+def test_chord_and_arc():
+    assert get_chord(6371.0088 * np.pi) == pytest.approx(2)
+    assert get_arc(get_chord(100)) == pytest.approx(100)
+
+
+@pytest.mark.parametrize('leaf_size', [1, 2, 8])
+def test_query_radius(leaf_size):
+    index = SpatialIndex(LATS, LNGS, leaf_size=leaf_size)
+    query_indices, point_indices, distances = index.query_radius([52.0, 40.0], [5.0, -74.0], 600)
+    assert list(query_indices) == [0, 0, 0, 1]
+    assert list(point_indices) == [5, 0, 1, 3]
+    assert list(distances) == sorted(distances[:3]) + [distances[3]]
+    assert distances[0] == pytest.approx(haversine_matrix([52.0], [5.0], [52.09083], [5.12222])[0][0])
+
+
+@pytest.mark.parametrize('leaf_size', [1, 2, 8])
+def test_query(leaf_size):
+    index = SpatialIndex(LATS, LNGS, leaf_size=leaf_size)
+    distances, indices = index.query([52.0, -30.0], [5.0, 150.0], k=2)
+    assert indices.tolist() == [[5, 0], [4, 3]]
+    assert distances[1][0] == pytest.approx(haversine_matrix([-30.0], [150.0], [-33.86785], [151.20732])[0][0])
+
+
+def test_query_more_than_indexed():
+    distances, indices = SpatialIndex(LATS[:2], LNGS[:2]).query([0], [0], k=5)
+    assert indices.tolist() == [[1, 0]]
+    distances, indices = SpatialIndex([], []).query([0], [0], k=5)
+    assert distances.shape == (1, 0)
+
+
+def test_query_random_points_match_matrix():
+    random = np.random.RandomState(0)
+    lats = np.degrees(np.arcsin(random.uniform(-1, 1, 500)))
+    lngs = random.uniform(-180, 180, 500)
+    index = SpatialIndex(lats, lngs)
+    matrix = haversine_matrix(lats[:50], lngs[:50], lats, lngs)
+
+    distances, indices = index.query(lats[:50], lngs[:50], k=10)
+    assert np.allclose(distances, np.sort(matrix, axis=1)[:, :10], atol=1e-3)
+
+    query_indices, point_indices, distances = index.query_radius(lats[:50], lngs[:50], 1500)
+    assert len(query_indices) == (matrix <= 1500).sum()
+
+
+def test_query_max_distance():
+    distances, indices = SpatialIndex(LATS, LNGS).query([52.0, 0.0], [5.0, 0.0], k=3, max_distance=100)
+    assert indices.tolist() == [[5, 0, 6], [6, 6, 6]]
+    assert np.isinf(distances[0][2])
+    assert np.isinf(distances[1]).all()
+
+
+def test_query_clustered_points_match_matrix():
+    random = np.random.RandomState(0)
+    lats = np.concatenate([random.normal(52, 0.5, 400), random.uniform(-60, 60, 100)])
+    lngs = np.concatenate([random.normal(5, 0.5, 400), random.uniform(-180, 180, 100)])
+    index = SpatialIndex(lats, lngs)
+    matrix = haversine_matrix(lats, lngs)
+
+    distances, indices = index.query(lats, lngs, k=20)
+    assert np.allclose(distances, np.sort(matrix, axis=1)[:, :20], atol=1e-3)
@@ -0,0 +1,90 @@
+import pytest
+from gazetteer import Gazetteer
+from toponym_tagger import ToponymTagger
+
+
+def row(geonameid, name, alternate_names, feature_class, population):
+    return [geonameid, name, name, alternate_names, '52.0', '5.0', feature_class, '', 'NL', '', '', '', '', '',
+            population, '', '', '', '2019-01-01']
+
+
+DUMP = [
+    row('2759794', 'Amsterdam', '', 'P', '741636'),
+    row('5128581', 'New York City', 'New York', 'P', '8175133'),
+    row('5128638', 'New York', '', 'A', '19274244'),
+    row('2759706', "'s-Hertogenbosch", 'Den Bosch', 'P', '135000'),
+    row('2756669', 'Ede', '', 'P', '67670'),
+    row('2747373', 'Best', '', 'P', '0'),
+]
+
+
+@pytest.fixture
+def gazetteer(tmpdir):
+    dump = tmpdir.join('dump.txt')
+    dump.write_text('\n'.join('\t'.join(columns) for columns in DUMP) + '\n', encoding='utf-8')
+    index = str(tmpdir.join('gazetteer.idx'))
+
+    Gazetteer.build([str(dump)], index)
+    gazetteer = Gazetteer(index)
+    yield gazetteer
+    gazetteer.close()
+
+
+def find(tagger, text):
+    return [text[start:end] for start, end in tagger.find(text)]
+
+
+def test_find_longest_names():
+    tagger = ToponymTagger(['new york', 'york', 'new york city', 'new'])
+    assert find(tagger, 'From New York City to York.') == ['New York City', 'York']
+    assert find(tagger, 'New York, New Amsterdam') == ['New York', 'New']
+
+
+def test_find_overlapping_suffixes():
+    tagger = ToponymTagger(['a b c d', 'b c', 'c d e'])
+    assert find(tagger, 'A B C D E') == ['A B C D']
+    assert find(tagger, 'A B C E') == ['B C']
+    assert find(tagger, 'X C D E') == ['C D E']
+
+
+def test_find_requires_capitals_and_separators():
+    tagger = ToponymTagger(['den bosch', 'best', "'s-hertogenbosch"])
+    assert find(tagger, 'the best of Den Bosch') == ['Den Bosch']
+    assert find(tagger, 'Den: Bosch, den Bosch and Den, Bosch') == []
+    assert find(tagger, "in 's-Hertogenbosch and 'S Hertogenbosch") == ["'s-Hertogenbosch", "'S Hertogenbosch"]
+
+
+def test_find_nothing():
+    assert ToponymTagger([]).find('Amsterdam') == []
+    assert ToponymTagger(['amsterdam']).find('') == []
+
+
+def test_from_gazetteer(gazetteer):
+    assert len(ToponymTagger.from_gazetteer(gazetteer)) == 7
+    tagger = ToponymTagger.from_gazetteer(gazetteer, feature_classes=['P'], min_population=1000)
+    assert find(tagger, 'Best, Ede, Den Bosch and New York City') == ['Ede', 'Den Bosch', 'New York City']
+
+
+def test_tag():
+    text = 'I went from Amsterdam to Ede. Amsterdam is nice.'
+    response = ToponymTagger(['amsterdam', 'ede']).tag('test', text, 2)
+
+    assert response['text']['title'] == 'test'
+    entities = response['text']['entities']
+    assert [(entity['ne'], entity['pos'], entity['count']) for entity in entities] == \
+        [('Amsterdam', 12, 2), ('Ede', 25, 1), ('Amsterdam', 30, 2)]
+    assert all(entity['type'] == 'LOCATION' for entity in entities)
+    assert entities[0]['left_context'] == 'went from'
+    assert entities[0]['right_context'] == 'to Ede.'
+
+
+def test_add_missing():
+    text = 'Paris Hilton flew from Amsterdam to Ede.'
+    response = {'text': {'title': 'test', 'entities': [
+        {'ne': 'Paris Hilton', 'pos': 0, 'type': 'PERSON'},
+        {'ne': 'Ede', 'pos': 36, 'type': 'LOCATION'}]}}
+    ToponymTagger(['paris', 'amsterdam', 'ede']).add_missing(response, text, 3)
+
+    assert [(entity['ne'], entity['type']) for entity in response['text']['entities']] == \
+        [('Paris Hilton', 'PERSON'), ('Amsterdam', 'LOCATION'), ('Ede', 'LOCATION')]
+    assert response['text']['entities'][1]['ner_src'] == ['gazetteer']
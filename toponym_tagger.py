@@ -0,0 +1,165 @@
+import re
+from collections import Counter
+
+from helpers.chunker import get_left_context, get_right_context
+
+
+TOKEN = re.compile(r'\w+')
+# The characters that can separate the words of a place name in a text
+SEPARATORS = re.compile(r"[\s\-'’.]*")
+APOSTROPHES = "'’"
+# The population of the smallest places to find by default, the names of all places in a large gazetteer
+# (e.g. allCountries.txt) take minutes to put in a tagger and GBs of memory, and include many common words
+TAGGER_MIN_POPULATION = 1000
+
+
+class ToponymTagger:
+    '''
+    An offline alternative to the multiNER service for finding place names in a text: a dictionary tagger that
+    finds the (normalized) names in a Gazetteer, as entities tagged LOCATION in the format of multiNER.
+
+    The names are put in an Aho-Corasick automaton over words (i.e. a trie of names as sequences of lowercase words,
+    with for each state the longest proper suffix that is also in the trie), so that all names in a text are found
+    in one pass over its words, regardless of the number of names. Of overlapping names, the longest (and then
+    the first) is kept. Names only count if their first and last word are capitalized in the text (where a first word
+    after an apostrophe, like the 's of 's-Hertogenbosch, need not be), and their words are only separated by whitespace,
+    hyphens, apostrophes or periods.
+    '''
+
+    def __init__(self, names):
+        # the state after each (state, word), the number of words of each state,
+        # whether a name ends in each state, and for each state the state its longest proper suffix is in
+        self.transitions = {}
+        self.depths = [0]
+        self.ends = [False]
+        self.failures = [0]
+        children = [[]]
+
+        for name in names:
+            state = 0
+            for word in TOKEN.findall(name.casefold()):
+                next_state = self.transitions.get((state, word))
+                if next_state is None:
+                    next_state = len(self.depths)
+                    self.transitions[(state, word)] = next_state
+                    self.depths.append(self.depths[state] + 1)
+                    self.ends.append(False)
+                    self.failures.append(0)
+                    children.append([])
+                    children[state].append((word, next_state))
+                state = next_state
+            if state:
+                self.ends[state] = True
+
+        # per state, the state of the longest name that is a suffix of it (0 if none)
+        self.outputs = [0] * len(self.depths)
+        queue = [child for word, child in children[0]]
+        for state in queue:
+            self.outputs[state] = state if self.ends[state] else self.outputs[self.failures[state]]
+            for word, child in children[state]:
+                failure = self.failures[state]
+                while failure and (failure, word) not in self.transitions:
+                    failure = self.failures[failure]
+                self.failures[child] = self.transitions.get((failure, word), 0)
+                queue.append(child)
+
+    def __len__(self):
+        return self.ends.count(True)
+
+    @classmethod
+    def from_gazetteer(cls, gazetteer, feature_classes=None, min_population=0):
+        '''
+        Create a tagger for the names and alternate names in a Gazetteer.
+
+        Keyword arguments:
+            feature_classes -- Only include names of entries of these feature classes. Defaults to 'None', i.e. all.
+            min_population -- Only include names of entries with at least this population. Defaults to 0.
+        '''
+        return cls(key for key, entries in gazetteer.iter_names() if any(
+            (feature_classes is None or entry.feature_class in feature_classes) and
+            entry.population >= min_population for entry in entries))
+
+    def find(self, text):
+        '''
+        Find the names in text. Returns a list of (start, end) character offsets, in order.
+        '''
+        words = []
+        matches = []
+        state = 0
+
+        for match in TOKEN.finditer(text):
+            word = match.group().casefold()
+            words.append(match.span())
+            while state and (state, word) not in self.transitions:
+                state = self.failures[state]
+            state = self.transitions.get((state, word), 0)
+
+            output = self.outputs[state]
+            while output:
+                first = len(words) - self.depths[output]
+                if self.is_name(text, words, first, len(words) - 1):
+                    matches.append((first, len(words)))
+                output = self.outputs[self.failures[output]]
+
+        # keep the longest of overlapping names
+        matches.sort(key=lambda match: (match[0], -match[1]))
+        spans = []
+        end = 0
+        for first, last in matches:
+            if first >= end:
+                start = words[first][0]
+                if start > 0 and text[start - 1] in APOSTROPHES:
+                    start -= 1
+                spans.append((start, words[last - 1][1]))
+                end = last
+        return spans
+
+    def is_name(self, text, words, first, last):
+        start = words[first][0]
+        if not text[start].isupper() and not (start > 0 and text[start - 1] in APOSTROPHES):
+            return False
+        if not text[words[last][0]].isupper():
+            return False
+        return all(SEPARATORS.fullmatch(text, words[index][1], words[index + 1][0])
+                   for index in range(first, last))
+
+    def get_entities(self, text, context_length):
+        '''
+        Find the names in text, as entities in the format of multiNER.
+        '''
+        spans = self.find(text)
+        counts = Counter(text[start:end] for start, end in spans)
+        return [{
+            'ne': text[start:end],
+            'pos': start,
+            'type': 'LOCATION',
+            'count': counts[text[start:end]],
+            'ner_src': ['gazetteer'],
+            'type_certainty': 1,
+            'alt_nes': [],
+            'left_context': get_left_context(text, start, context_length),
+            'right_context': get_right_context(text, end, context_length)
+        } for start, end in spans]
+
+    def tag(self, title, text, context_length):
+        '''
+        Find the names in text. Returns a response in the format of multiNER.
+        '''
+        return {'text': {'title': title, 'entities': self.get_entities(text, context_length)}}
+
+    def add_missing(self, response, text, context_length):
+        '''
+        Add the names in text that do not overlap with an entity in a multiNER response (of any type) to it.
+        '''
+        entities = response['text']['entities']
+        taken = sorted((entity['pos'], entity['pos'] + len(entity['ne'])) for entity in entities)
+        index = 0
+        for entity in self.get_entities(text, context_length):
+            start, end = entity['pos'], entity['pos'] + len(entity['ne'])
+            while index < len(taken) and taken[index][1] <= start:
+                index += 1
+            if index == len(taken) or taken[index][0] >= end:
+                entities.append(entity)
+
+        entities.sort(key=lambda entity: entity['pos'])
+        return response